@@ -1,16 +1,97 @@
 const vscode = require('vscode');
 const { spawn } = require('child_process');
 
+// one long-running `main.py --server` process answers every lint request,
+// so we don't pay python startup + imports on each keystroke
+let server = null;
+// the server's stderr (optimizer notes, tracebacks) goes here. it has to be read either
+// way, once the pipe fills up the server blocks on its next write and stops answering
+let output = null;
+
+function getServer(compilerPath) {
+    if (server && server.compilerPath === compilerPath) return server;
+    if (server) server.proc.kill();
+
+    const proc = spawn('python', [compilerPath, '--server']);
+    const state = { proc, compilerPath, pending: new Map(), nextId: 1, buffer: "", openDocs: new Set() };
+
+    proc.stdout.on('data', (data) => {
+        state.buffer += data.toString();
+        let newline;
+        while ((newline = state.buffer.indexOf('\n')) >= 0) {
+            const line = state.buffer.slice(0, newline);
+            state.buffer = state.buffer.slice(newline + 1);
+            try {
+                const response = JSON.parse(line);
+                const callback = state.pending.get(response.id);
+                if (callback) {
+                    state.pending.delete(response.id);
+                    callback(response);
+                }
+            } catch (e) {
+
+            }
+        }
+    });
+
+    proc.stderr.on('data', (data) => {
+        if (output) output.append(data.toString());
+    });
+
+    proc.on('exit', () => {
+        if (server === state) server = null;
+    });
+    proc.on('error', () => {
+        if (server === state) server = null;
+    });
+
+    server = state;
+    return server;
+}
+
+function sendRequest(compilerPath, request, callback) {
+    const srv = getServer(compilerPath);
+    const id = srv.nextId++;
+    srv.pending.set(id, callback);
+    srv.proc.stdin.write(JSON.stringify({ id, ...request }) + '\n');
+}
+
+// keep the server's copy of a document in sync by streaming edits, so it only
+// re-parses the event/function that was touched
+function syncDocument(compilerPath, document, contentChanges) {
+    const srv = getServer(compilerPath);
+    const file = document.uri.fsPath;
+
+    if (!srv.openDocs.has(file)) {
+        srv.openDocs.add(file);
+        sendRequest(compilerPath, { cmd: 'open', file, text: document.getText() }, () => {});
+        return;
+    }
+
+    const edits = contentChanges.map(change => ({
+        start: [change.range.start.line, change.range.start.character],
+        end: [change.range.end.line, change.range.end.character],
+        text: change.text
+    }));
+    sendRequest(compilerPath, { cmd: 'edit', file, edits }, () => {});
+}
+
 function activate(context) {
     const diagnosticCollection = vscode.languages.createDiagnosticCollection('catlua');
     context.subscriptions.push(diagnosticCollection);
 
+    output = vscode.window.createOutputChannel('CatLua');
+    context.subscriptions.push(output);
+
     let lintTimeout;
 
     vscode.workspace.onDidChangeTextDocument((event) => {
         const document = event.document;
         if (document.languageId !== 'catlua') return;
 
+        const compilerPath = vscode.workspace.getConfiguration('catlua').get('compilerPath');
+        if (compilerPath) syncDocument(compilerPath, document, event.contentChanges);
+
         clearTimeout(lintTimeout);
         
         lintTimeout = setTimeout(() => {
@@ -19,41 +100,39 @@ function activate(context) {
 
             if (!compilerPath) return;
 
-            const pyProcess = spawn('python', [compilerPath, document.uri.fsPath, '--lint', '--stdin']);
-            
-            let stdout = "";
-            pyProcess.stdout.on('data', (data) => { stdout += data.toString(); });
-            
-            pyProcess.on('close', (code) => {
+            const request = { cmd: 'lint', file: document.uri.fsPath, text: document.getText() };
+            sendRequest(compilerPath, request, (response) => {
                 diagnosticCollection.clear();
-                try {
-                    const diagnostics = JSON.parse(stdout);
-                    const vsDiagnostics = diagnostics.map(diag => {
-                        const lineStr = Math.max(0, diag.line - 1); 
-                        const lineObj = document.lineAt(lineStr);
-                        const range = new vscode.Range(
-                            lineStr, 
-                            lineObj.firstNonWhitespaceCharacterIndex, 
-                            lineStr, 
-                            lineObj.text.length
-                        );
-                        const severity = diag.severity === "warning" 
-                            ? vscode.DiagnosticSeverity.Warning 
-                            : vscode.DiagnosticSeverity.Error;
-                        return new vscode.Diagnostic(range, diag.msg, severity);
-                    });
-                    diagnosticCollection.set(document.uri, vsDiagnostics);
-                } catch (e) {
-
-                }
+                if (!response.diagnostics) return;
+
+                const vsDiagnostics = response.diagnostics.map(diag => {
+                    const lineStr = Math.min(Math.max(0, diag.line - 1), document.lineCount - 1);
+                    const lineObj = document.lineAt(lineStr);
+                    const range = new vscode.Range(
+                        lineStr, 
+                        lineObj.firstNonWhitespaceCharacterIndex, 
+                        lineStr, 
+                        lineObj.text.length
+                    );
+                    const severity = diag.severity === "warning" 
+                        ? vscode.DiagnosticSeverity.Warning 
+                        : vscode.DiagnosticSeverity.Error;
+                    return new vscode.Diagnostic(range, diag.msg, severity);
+                });
+                diagnosticCollection.set(document.uri, vsDiagnostics);
             });
 
-            pyProcess.stdin.write(document.getText());
-            pyProcess.stdin.end();
-
         }, 500);
     });
 
+    vscode.workspace.onDidCloseTextDocument((document) => {
+        if (document.languageId !== 'catlua' || !server) return;
+        const file = document.uri.fsPath;
+        if (server.openDocs.delete(file)) {
+            sendRequest(server.compilerPath, { cmd: 'close', file }, () => {});
+        }
+    });
+
     const provider = vscode.languages.registerCompletionItemProvider('catlua', {
         provideCompletionItems(document, position, token, context) {
             const items = [];
@@ -87,6 +166,11 @@ function activate(context) {
     context.subscriptions.push(provider);
 }
 
-function deactivate() {}
+function deactivate() {
+    if (server) {
+        server.proc.kill();
+        server = null;
+    }
+}
 
 module.exports = { activate, deactivate };
\ No newline at end of file
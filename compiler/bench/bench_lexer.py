@@ -0,0 +1,79 @@
+"""
+lexer throughput benchmark. builds a synthetic source file out of a snippet that hits
+every token kind, tokenizes it a few times and prints the best MB/s. exits with 1
+when the lexer is slower than TARGET_MBPS so it can gate a CI job
+
+    python compiler/bench/bench_lexer.py [size_mb] [runs]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from lexer import Lexer
+
+# the single-pass lexer does ~2.3-2.5 MB/s on a slow single core, the old
+# per-instance regex one ~1.6. anything under this is a regression
+TARGET_MBPS = 2.0
+
+SNIPPET = '''--@ script_alias="bench"
+OnWebsiteLoaded
+    -- plain comment
+    local myVar = 10.5
+    object myObjVar = "hello"
+    global count = 0
+    local name = LocalPlayer.Name
+
+    print(`welcome {name}!`)
+    local tbl = {}
+    tbl['a'] = 5
+    local s = "a" .. "b"
+    local z = -(myVar + 2) * 3 / 4 ^ 2 % 7
+    count += 1
+    for k, v in pairs(tbl) do
+        if k ~= nil and v >= 2 or not g!flag then
+            print(v)
+        elseif #tbl <= 3 then
+            o!counter -= 1
+        end
+    end
+    repeat forever
+        wait(0.1)
+        break
+    end
+end
+
+--#type audio
+function helper(a, b)
+    mySong.Volume = 8
+    return a + b * 2 - 1
+end
+--#end
+'''
+
+def make_source(size_mb):
+    copies = max(1, int(size_mb * 1024 * 1024 / len(SNIPPET)))
+    return SNIPPET * copies
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    code = make_source(size_mb)
+    mb = len(code) / (1024 * 1024)
+
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        tokens = Lexer(code).tokenize()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{mb:.2f} MB, {len(tokens)} tokens")
+    print(f"best of {runs}: {best * 1000:.0f}ms, {mb / best:.2f} MB/s, {len(tokens) / best / 1e6:.2f}M tokens/s")
+    if mb / best < TARGET_MBPS:
+        print(f"below the {TARGET_MBPS} MB/s target")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+action counts of the CWIR that actually gets emitted, after scaffolding and every -O pass.
+every instruction between EVENT and END_EVENT becomes one CatWeb action, ELSE and END_* included
+"""
+from cwir import LOOP_OPENERS, BLOCK_CLOSERS, opens_block
+
+ACTION_LIMIT = 120 # per event, CatWeb stops compiling/running past this
+
+def worst_path(body, i=0):
+    """
+    most actions one run of the event can go through: an if costs its header, the larger of its
+    branches and its END_IF, a loop body is counted once. returns (cost, index it stopped at)
+    """
+    cost = 0
+    while i < len(body):
+        op = body[i].op
+        if op in BLOCK_CLOSERS or op == "ELSE":
+            return cost, i
+        if opens_block(op):
+            inner, i = worst_path(body, i + 1)
+            if op not in LOOP_OPENERS and i < len(body) and body[i].op == "ELSE":
+                other, i = worst_path(body, i + 1)
+                inner = max(inner, other + 1)
+            cost += inner + 2 # the opener and its END_*
+            i += 1
+            continue
+        cost += 1
+        i += 1
+    return cost, i
+
+def count_actions(instrs):
+    """one dict per EVENT/FUNC_DEF: where it is, how many actions, worst path and per-line counts"""
+    events = []
+    alias = None
+    event, body = None, None
+
+    for instr in instrs:
+        if instr.op == "SCRIPT":
+            alias = None
+        elif instr.op == "SCRIPT_ALIAS" and instr.args:
+            alias = instr.args[0].value
+        elif instr.op == "EVENT":
+            event, body = instr, []
+        elif instr.op == "END_EVENT" and body is not None:
+            kind = event.args[0].value if event.args else "?"
+            lines = {}
+            for ins in body:
+                key = str(ins.line) if ins.line is not None else "?"
+                lines[key] = lines.get(key, 0) + 1
+            events.append({
+                "script": alias,
+                "event": kind,
+                "function": event.args[1].value if kind == "FUNC_DEF" and len(event.args) > 1 else None,
+                "line": event.line,
+                "actions": len(body),
+                "worst_path": worst_path(body)[0],
+                "over_limit": len(body) > ACTION_LIMIT,
+                "lines": lines,
+            })
+            event, body = None, None
+        elif body is not None:
+            body.append(instr)
+    return events
+
+def action_report(instrs, filename=None, opt_level=None):
+    """the machine-readable form --report-actions writes, meant to be diffed/checked in CI"""
+    events = count_actions(instrs)
+    return {
+        "file": filename,
+        "opt_level": opt_level,
+        "limit": ACTION_LIMIT,
+        "total": sum(ev["actions"] for ev in events),
+        "events": events,
+    }
+
+def print_report(report, colors, top=3):
+    print(f"\n{colors.BOLD}{colors.BLUE}=== ACTIONS ==={colors.RESET}")
+    for ev in report["events"]:
+        name = f"function {ev['function']}" if ev["function"] else ev["event"]
+        if ev["script"]:
+            name = f"{ev['script']}: {name}"
+        color = colors.RED if ev["over_limit"] else colors.YELLOW if ev["actions"] > ACTION_LIMIT * 0.8 else colors.GREEN
+        print(f"  {color}{ev['actions']:4d}{colors.RESET} / {report['limit']}  worst path {ev['worst_path']:4d}  {name} (line {ev['line']})")
+        heaviest = sorted(ev["lines"].items(), key=lambda item: -item[1])[:top]
+        if heaviest and ev["actions"]:
+            print("        heaviest lines: " + ", ".join(f"{line} ({n})" for line, n in heaviest))
+    print(f"  {report['total']} actions in {len(report['events'])} event(s)")
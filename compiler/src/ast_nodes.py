@@ -1,11 +1,23 @@
+# shared by every node without annotations. never mutate a node's annotations in
+# place, assign a new dict instead (the parser builds one per annotated statement)
+EMPTY_ANNOTATIONS = {}
+
 class Node:
+    # nodes are slotted. `_children` lists the slots that can hold nodes (a node, a list of
+    # nodes, or the (condition, body) tuples in IfStmt.else_ifs), that's all the visitors walk
+    __slots__ = ("line", "force_builtin", "force_custom", "annotations")
+    _children = ()
+
     def __init__(self, line):
         self.line = line
         self.force_builtin = False
         self.force_custom = False
-        self.annotations = {}
+        self.annotations = EMPTY_ANNOTATIONS
 
 class ScriptShardNode:
+    __slots__ = ("alias", "events", "func_defs", "requires")
+    _children = ("events", "func_defs")
+
     def __init__(self, alias=""):
         self.alias = alias
         self.events = []
@@ -13,25 +25,39 @@ class ScriptShardNode:
         self.requires = []
 
 class ScriptNode(Node):
+    __slots__ = ("shards",)
+    _children = ("shards",)
+
     def __init__(self, line, shards):
         super().__init__(line)
         self.shards = shards
 
 class EventNode(Node):
+    __slots__ = ("event_type", "args", "body", "end_line")
+    _children = ("body",)
+
     def __init__(self, line, event_type, args, body):
         super().__init__(line)
         self.event_type = event_type
         self.args = args
         self.body = body
+        self.end_line = line
 
 class FuncDefNode(Node):
+    __slots__ = ("name", "params", "body", "end_line")
+    _children = ("body",)
+
     def __init__(self, line, name, params, body):
         super().__init__(line)
         self.name = name
         self.params = params
         self.body = body
+        self.end_line = line
 
 class AssignStmt(Node):
+    __slots__ = ("scope", "targets", "value", "op")
+    _children = ("targets", "value")
+
     def __init__(self, line, scope, targets, value, op="="):
         super().__init__(line)
         self.scope = scope
@@ -40,6 +66,9 @@ class AssignStmt(Node):
         self.op = op
 
 class IfStmt(Node):
+    __slots__ = ("condition", "true_body", "else_ifs", "false_body")
+    _children = ("condition", "true_body", "else_ifs", "false_body")
+
     def __init__(self, line, condition, true_body, else_ifs, false_body):
         super().__init__(line)
         self.condition = condition
@@ -48,12 +77,18 @@ class IfStmt(Node):
         self.false_body = false_body
 
 class RepeatStmt(Node):
+    __slots__ = ("count", "body")
+    _children = ("count", "body")
+
     def __init__(self, line, count, body):
         super().__init__(line)
         self.count = count
         self.body = body
 
 class ForStmt(Node):
+    __slots__ = ("vars", "iterator", "body")
+    _children = ("iterator", "body")
+
     def __init__(self, line, vars, iterator, body):
         super().__init__(line)
         self.vars = vars
@@ -61,6 +96,9 @@ class ForStmt(Node):
         self.body = body
 
 class CallStmt(Node):
+    __slots__ = ("is_bg", "func_expr", "args", "targets", "is_protected", "scope")
+    _children = ("func_expr", "args", "targets")
+
     def __init__(self, line, is_bg, func_expr, args, targets, is_protected, scope=None):
         super().__init__(line)
         self.is_bg = is_bg
@@ -71,19 +109,28 @@ class CallStmt(Node):
         self.scope = scope
 
 class ReturnStmt(Node):
+    __slots__ = ("value",)
+    _children = ("value",)
+
     def __init__(self, line, value):
         super().__init__(line)
         self.value = value
 
 class BreakStmt(Node):
-    pass
+    __slots__ = ()
 
 class DeleteStmt(Node):
+    __slots__ = ("target",)
+    _children = ("target",)
+
     def __init__(self, line, target):
         super().__init__(line)
         self.target = target
 
 class PropertySet(Node):
+    __slots__ = ("obj", "prop", "value")
+    _children = ("obj", "value")
+
     def __init__(self, line, obj, prop, value):
         super().__init__(line)
         self.obj = obj
@@ -91,6 +138,9 @@ class PropertySet(Node):
         self.value = value
 
 class IndexSet(Node):
+    __slots__ = ("table", "index", "value", "is_object_ref")
+    _children = ("table", "index", "value")
+
     def __init__(self, line, table, index, value, is_object_ref=False):
         super().__init__(line)
         self.table = table
@@ -99,6 +149,9 @@ class IndexSet(Node):
         self.is_object_ref = is_object_ref
 
 class BinaryExpr(Node):
+    __slots__ = ("left", "op", "right")
+    _children = ("left", "right")
+
     def __init__(self, line, left, op, right):
         super().__init__(line)
         self.left = left
@@ -106,49 +159,71 @@ class BinaryExpr(Node):
         self.right = right
 
 class UnaryExpr(Node):
+    __slots__ = ("op", "right")
+    _children = ("right",)
+
     def __init__(self, line, op, right):
         super().__init__(line)
         self.op = op
         self.right = right
 
 class VarRef(Node):
+    __slots__ = ("name", "prefix")
+
     def __init__(self, line, name, prefix=None):
         super().__init__(line)
         self.name = name
         self.prefix = prefix
 
 class PropRef(Node):
+    __slots__ = ("obj", "prop")
+    _children = ("obj",)
+
     def __init__(self, line, obj, prop):
         super().__init__(line)
         self.obj = obj
         self.prop = prop
 
 class IndexRef(Node):
+    __slots__ = ("table", "index")
+    _children = ("table", "index")
+
     def __init__(self, line, table, index):
         super().__init__(line)
         self.table = table
         self.index = index
 
 class NumberLit(Node):
+    __slots__ = ("value",)
+
     def __init__(self, line, value):
         super().__init__(line)
         self.value = value
 
 class StringLit(Node):
+    __slots__ = ("value",)
+
     def __init__(self, line, value):
         super().__init__(line)
         self.value = value
 
 class InterpStringLit(Node):
+    __slots__ = ("value",)
+
     def __init__(self, line, value):
         super().__init__(line)
         self.value = value
 
 class TableLit(Node):
+    __slots__ = ()
+
     def __init__(self, line):
         super().__init__(line)
 
 class CommentStmt(Node):
+    __slots__ = ("value",)
+
     def __init__(self, line, value):
         super().__init__(line)
-        self.value = value
\ No newline at end of file
+        self.value = value
+NODE_TYPES = (Node, ScriptShardNode)
@@ -0,0 +1,215 @@
+import re
+from ast_nodes import *
+from visitor import NodeTransformer, walk
+from optimizer import note
+
+ARITH = {"+", "-", "*", "/", "^", "%"}
+COMPARE = {"==", "~=", "<", "<=", ">", ">="}
+# conditions the IR emitter reads variable names out of, leave their operands alone
+NAMED_CONDS = {"and", "or", "nor", "xor"}
+
+HOLE_RE = re.compile(r"\{l!([a-zA-Z_]\w*)\}")
+
+def number(value):
+    # same shape the parser gives, so 4.0 stays 4 like fold_constants always did
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+def fold_arith(op, left, right):
+    """number op number, None if it can't (or shouldn't) be done at compile time"""
+    try:
+        left, right = float(left), float(right)
+        if op == "+": result = left + right
+        elif op == "-": result = left - right
+        elif op == "*": result = left * right
+        elif op == "/": result = left / right if right != 0 else None
+        elif op == "^": result = left ** right
+        elif op == "%": result = left % right if right != 0 else None
+        else: result = None
+    except (ValueError, OverflowError, ZeroDivisionError):
+        return None
+    if not isinstance(result, float): # None, or complex from a negative ** fraction
+        return None
+    return number(result)
+
+def text(lit):
+    # what the literal reads as once it's in a CatWeb string
+    return str(lit.value)
+
+def compare(op, left, right):
+    """True/False for two literals, None if CatWeb could see it differently"""
+    if isinstance(left, NumberLit) and isinstance(right, NumberLit):
+        a, b = float(left.value), float(right.value)
+    elif isinstance(left, StringLit) and isinstance(right, StringLit) and op in ("==", "~="):
+        a, b = left.value, right.value
+    else:
+        return None
+    return {"==": a == b, "~=": a != b, "<": a < b, "<=": a <= b, ">": a > b, ">=": a >= b}[op]
+
+def local_writes(body):
+    """how many times each name gets written anywhere in an event/function body"""
+    writes = {}
+    for stmt in body:
+        for node in walk(stmt):
+            names = ()
+            if isinstance(node, (AssignStmt, CallStmt)):
+                names = [t.name for t in (node.targets or ()) if isinstance(t, VarRef)]
+            elif isinstance(node, ForStmt):
+                names = node.vars
+            elif isinstance(node, DeleteStmt) and isinstance(node.target, VarRef):
+                names = [node.target.name]
+            for name in names:
+                writes[name] = writes.get(name, 0) + 1
+    return writes
+
+class ConstantFolder(NodeTransformer):
+    """
+    -O1 constant propagation. locals assigned once from a literal are substituted into
+    later reads, then arithmetic, `..`, unary minus and `{l!x}` holes of literals are
+    folded, and if/elseif branches with a known comparison are dropped before they
+    ever become IF_* actions
+    """
+    def __init__(self, ast):
+        self.ast = ast
+        self.consts = {}
+        self.writes = {}
+
+    def visit_body(self, node):
+        self.consts = {}
+        self.writes = local_writes(node.body)
+        node.body = self.visit_list(node.body)
+        return node
+
+    visit_EventNode = visit_body
+    visit_FuncDefNode = visit_body
+
+    def visit_nested(self, body):
+        # a body that might not run can't leave constants behind for what comes after it
+        saved = dict(self.consts)
+        body = self.visit_list(body)
+        self.consts = saved
+        return body
+
+    def fold(self, node):
+        if isinstance(node, VarRef):
+            lit = self.consts.get(node.name) if node.prefix == "l!" else None
+            return type(lit)(node.line, lit.value) if lit is not None else node
+        if isinstance(node, BinaryExpr):
+            if node.op in NAMED_CONDS or isinstance(node.right, VarRef) and node.right.name == "nil":
+                return node
+            node.left = self.fold(node.left)
+            node.right = self.fold(node.right)
+            return self.fold_binary(node)
+        if isinstance(node, UnaryExpr):
+            if node.op == "-":
+                node.right = self.fold(node.right)
+                if isinstance(node.right, NumberLit):
+                    return NumberLit(node.line, number(-node.right.value))
+            return node
+        if isinstance(node, InterpStringLit):
+            return self.fold_interp(node)
+        if isinstance(node, CallStmt):
+            self.fold_args(node)
+        return node
+
+    def fold_binary(self, node):
+        left, right = node.left, node.right
+        if node.op in ARITH and isinstance(left, NumberLit) and isinstance(right, NumberLit):
+            result = fold_arith(node.op, left.value, right.value)
+            return node if result is None else NumberLit(node.line, result)
+        if node.op == "..":
+            if isinstance(left, (NumberLit, StringLit)) and isinstance(right, (NumberLit, StringLit)):
+                return StringLit(node.line, text(left) + text(right))
+            # a plain literal next to an interpolated string, as long as it can't open a hole
+            if isinstance(left, InterpStringLit) and isinstance(right, (NumberLit, StringLit)) and "{" not in text(right):
+                return InterpStringLit(node.line, left.value + text(right))
+            if isinstance(right, InterpStringLit) and isinstance(left, (NumberLit, StringLit)) and "{" not in text(left):
+                return InterpStringLit(node.line, text(left) + right.value)
+        return node
+
+    def fold_interp(self, node):
+        def hole(match):
+            lit = self.consts.get(match.group(1))
+            if lit is None or "{" in text(lit) or "}" in text(lit):
+                return match.group(0)
+            return text(lit)
+
+        value = HOLE_RE.sub(hole, node.value)
+        if value == node.value:
+            return node
+        return InterpStringLit(node.line, value) if "{" in value else StringLit(node.line, value)
+
+    def fold_args(self, call):
+        func = call.func_expr
+        # table.concat takes the table itself as a name
+        skip = 0 if isinstance(func, PropRef) and getattr(func.obj, "name", None) == "table" and func.prop == "concat" else None
+        call.args = [arg if i == skip else self.fold(arg) for i, arg in enumerate(call.args)]
+
+    def visit_AssignStmt(self, node):
+        node.value = self.fold(node.value)
+        target = node.targets[0] if len(node.targets) == 1 else None
+        if (node.scope == "local" and node.op == "=" and isinstance(target, VarRef)
+                and isinstance(node.value, (NumberLit, StringLit)) and self.writes.get(target.name) == 1):
+            self.consts[target.name] = node.value
+        return node
+
+    def visit_CallStmt(self, node):
+        self.fold_args(node)
+        return node
+
+    def visit_ReturnStmt(self, node):
+        node.value = self.fold(node.value)
+        return node
+
+    def visit_PropertySet(self, node):
+        node.value = self.fold(node.value)
+        return node
+
+    visit_IndexSet = visit_PropertySet
+
+    def visit_RepeatStmt(self, node):
+        node.count = self.fold(node.count)
+        node.body = self.visit_nested(node.body)
+        return node
+
+    def visit_ForStmt(self, node):
+        node.body = self.visit_nested(node.body)
+        return node
+
+    def known(self, cond):
+        if isinstance(cond, BinaryExpr) and cond.op in COMPARE:
+            return compare(cond.op, cond.left, cond.right)
+        return None
+
+    def visit_IfStmt(self, node):
+        branches = [(node.condition, node.true_body)] + list(node.else_ifs)
+        kept = []
+        false_body = node.false_body
+        for cond, body in branches:
+            cond = self.fold(cond)
+            truth = self.known(cond)
+            if truth is not False:
+                body = self.visit_nested(body)
+            if truth is False:
+                note(self.Colors, 1, f"removed branch that can never run at line {cond.line}")
+                continue
+            if truth is True:
+                # nothing after a branch that always runs is reachable
+                if len(kept) + 1 < len(branches) or false_body:
+                    note(self.Colors, 1, f"condition at line {cond.line} is always true, removed the branches after it")
+                false_body = body
+                break
+            kept.append((cond, body))
+        else:
+            if false_body:
+                false_body = self.visit_nested(false_body)
+
+        if not kept:
+            return false_body or None
+        node.condition, node.true_body = kept[0]
+        node.else_ifs = kept[1:]
+        node.false_body = false_body
+        return node
+
+    def optimize(self, colors_class=None):
+        self.Colors = colors_class
+        self.visit(self.ast)
@@ -0,0 +1,149 @@
+"""
+in-memory CWIR. the IR emitter builds a list of Instr and the JSON emitter reads it
+directly, the text form is only for --ir and .cwobj files
+"""
+from collections import namedtuple
+
+CWIR_VERSION = "1.0"
+
+# instructions followed by a blank line in the text form, purely cosmetic
+SPACED = {"SCRIPT_ALIAS", "END_EVENT", "END_SCRIPT"}
+
+LOOP_OPENERS = {"REPEAT", "REPEAT_FOREVER", "TABLE_ITER"}
+BLOCK_CLOSERS = {"END_IF", "END_REPEAT", "END_ITER"}
+
+def opens_block(op):
+    # every IF_* opcode opens a block that END_IF closes
+    return op in LOOP_OPENERS or op.startswith("IF_")
+
+class Operand(namedtuple("Operand", "kind value")):
+    # kind is STRING, OBJECT, WORD or TUPLE (value is then a list of operands),
+    # same (kind, value) pairs tokenize_line() produces from text
+    __slots__ = ()
+
+    def __str__(self):
+        if self.kind == "STRING":
+            return f'"{self.value}"'
+        if self.kind == "OBJECT":
+            return f"({self.value})"
+        if self.kind == "TUPLE":
+            return "[" + " ".join(str(item) for item in self.value) + "]"
+        return self.value
+
+EMPTY = Operand("WORD", "EMPTY")
+
+# str() so numbers end up exactly as the text form would have spelled them
+def string(value):
+    return Operand("STRING", str(value))
+
+def obj(name):
+    return Operand("OBJECT", str(name))
+
+def word(value):
+    return Operand("WORD", value)
+
+def tuple_of(items):
+    return Operand("TUPLE", list(items))
+
+class Instr:
+    __slots__ = ("op", "args", "line", "indent")
+
+    def __init__(self, op, args=(), line=None, indent=""):
+        self.op = op
+        self.args = list(args)
+        self.line = line # .catlua source line, or the CWIR line when parsed from text
+        self.indent = indent
+
+    def __str__(self):
+        return self.indent + " ".join([self.op] + [str(arg) for arg in self.args])
+
+    def __repr__(self):
+        return f"Instr({str(self).strip()!r}, line={self.line})"
+
+def serialize(instrs):
+    """the text form, what --ir prints and .cwobj files contain"""
+    out = [f"CWIR_VERSION {CWIR_VERSION}\n"]
+    for instr in instrs:
+        out.append(f"{instr}\n" if instr.op in SPACED else str(instr))
+    return "\n".join(out)
+
+class CWIRSyntaxError(Exception):
+    def __init__(self, msg, line=None):
+        self.line = line
+        super().__init__(msg)
+
+def tokenize_line(line):
+    tokens = []
+    i = 0
+    while i < len(line):
+        if line[i] == " ":
+            i += 1
+            continue
+        if line[i] == '"':
+            j = i + 1
+            while j < len(line) and line[j] != '"':
+                if line[j] == '\\':
+                    j += 1
+                j += 1
+            if j >= len(line):
+                raise CWIRSyntaxError(f"unterminated string: {line}")
+            tokens.append(string(line[i+1:j]))
+            i = j + 1
+            continue
+        if line[i] == '(':
+            j = line.index(')', i)
+            tokens.append(obj(line[i+1:j]))
+            i = j + 1
+            continue
+        if line[i] == '[':
+            j = line.index(']', i)
+            inner = line[i+1:j].strip()
+            tokens.append(tuple_of(tokenize_line(inner) if inner else []))
+            i = j + 1
+            continue
+        j = i
+        while j < len(line) and line[j] not in (' ', '"', '(', '['):
+            j += 1
+        word_ = line[i:j]
+        if word_:
+            tokens.append(word(word_))
+        i = j
+    return tokens
+
+def parse_line(raw_line, lineno):
+    line = raw_line.strip()
+    if not line or line.startswith(";;"):
+        return None
+    try:
+        tokens = tokenize_line(line)
+    except CWIRSyntaxError as e:
+        raise CWIRSyntaxError(str(e), lineno)
+    if not tokens:
+        return None
+    kind, val = tokens[0]
+    if kind != "WORD":
+        raise CWIRSyntaxError(f"expected opcode, got {val!r}", lineno)
+    return val, tokens[1:]
+
+def parse(source):
+    """text CWIR -> (file version, [Instr]). lines keep their CWIR line numbers"""
+    lines = source.splitlines()
+    if not lines:
+        raise CWIRSyntaxError("empty source")
+
+    first = lines[0].strip()
+    if not first.startswith("CWIR_VERSION"):
+        raise CWIRSyntaxError("missing CWIR_VERSION declaration on first line", 1)
+
+    vtokens = tokenize_line(first)
+    version = vtokens[1][1] if len(vtokens) >= 2 else None
+
+    instrs = []
+    for lineno, raw_line in enumerate(lines[1:], start=2):
+        parsed = parse_line(raw_line, lineno)
+        if parsed is None:
+            continue
+        opcode, args = parsed
+        indent = raw_line[:len(raw_line) - len(raw_line.lstrip())]
+        instrs.append(Instr(opcode, args, lineno, indent))
+    return version, instrs
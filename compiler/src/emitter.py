@@ -1,17 +1,63 @@
+import io
+import os
 import json
 import sys
 import random
 import string
+import hashlib
+import marshal
 from pathlib import Path
+from cwir import CWIR_VERSION, CWIRSyntaxError, BLOCK_CLOSERS, parse
 
 _schema_path = Path(__file__).parent / "schema.json"
-with open(_schema_path, "r", encoding="utf-8") as _f:
-    _schema_data = json.load(_f)
+SCHEMA_CACHE_VERSION = 1 # bump when compile_schema's output changes shape
+
+# slot kinds of a compiled template
+TEXT, PARAM, TUPLE = 0, 1, 2
+
+def compile_schema(table):
+    """
+    {name: {"id", "text": [...]}} -> {name: (id, slots)}. a slot is (TEXT, literal),
+    (PARAM, param dict) or (TUPLE, param dict), args fill the non-TEXT slots in order
+    """
+    compiled = {}
+    for name, entry in table.items():
+        slots = []
+        for slot in entry["text"]:
+            if isinstance(slot, str):
+                slots.append((TEXT, slot))
+            else:
+                slots.append((TUPLE if slot.get("t") == "tuple" else PARAM, dict(slot)))
+        compiled[name] = (entry["id"], tuple(slots))
+    return compiled
+
+def load_schema(path=_schema_path):
+    """
+    (action templates, event templates). compiled once per schema.json and kept in
+    __pycache__ as marshal data keyed on the file's hash
+    """
+    raw = path.read_bytes()
+    key = hashlib.sha256(raw).hexdigest()[:16]
+    cache = path.parent / "__pycache__" / f"schema.{key}.v{SCHEMA_CACHE_VERSION}.marshal"
+    try:
+        with open(cache, "rb") as f:
+            return marshal.loads(f.read()) # marshal.load() on a file reads it in tiny chunks
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
 
-SCHEMA = _schema_data["actions"]
-EVENT_SCHEMA = _schema_data["events"]
+    data = json.loads(raw)
+    tables = (compile_schema(data["actions"]), compile_schema(data["events"]))
+    try:
+        cache.parent.mkdir(exist_ok=True)
+        tmp = cache.parent / f"{cache.name}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(marshal.dumps(tables))
+        os.replace(tmp, cache)
+    except OSError:
+        pass # read-only install, compile it every time then
+    return tables
 
-CWIR_VERSION = "1.0"
+ACTION_TEMPLATES, EVENT_TEMPLATES = load_schema()
 
 BLOCK_OPENERS = {
     "IF_EQ", "IF_NEQ", "IF_GT", "IF_GTE", "IF_LT", "IF_LTE",
@@ -23,8 +69,6 @@ BLOCK_OPENERS = {
     "TABLE_ITER",
 }
 
-BLOCK_CLOSERS = {"END_IF", "END_REPEAT", "END_ITER"}
-
 CLOSER_MAP = {
     "END_IF":     ("IF_EQ", "IF_NEQ", "IF_GT", "IF_GTE", "IF_LT", "IF_LTE",
                    "IF_CONTAINS", "IF_NOT_CONTAINS", "IF_EXISTS", "IF_NOT_EXISTS",
@@ -42,73 +86,82 @@ class EmitError(Exception):
 
 
 class GlobalIDGen:
-    def __init__(self):
-        self._used = set()
-        self._chars = string.ascii_letters + string.digits + "!@#$%^&*"
+    """
+    counter-based globalids: every 2 character id in order (4,900 of them), then every 3
+    character one and so on, so there are no collisions to retry and no limit. the same
+    program and seed always get the same ids, the seed only shuffles the alphabet
+    """
+    CHARS = string.ascii_letters + string.digits + "!@#$%^&*"
+
+    def __init__(self, seed=None):
+        chars = list(self.CHARS)
+        if seed is not None:
+            random.Random(str(seed)).shuffle(chars) # --seed 7 and seed = 7 in catlua.toml agree
+        self._chars = chars
+        self._width = 2
+        self._capacity = len(chars) ** 2 # ids of the current width
+        self._count = 0 # handed out at the current width
 
     def next(self):
-        while True:
-            gid = "".join(random.choices(self._chars, k=2))
-            if gid not in self._used:
-                self._used.add(gid)
-                return gid
-
-
-def tokenize_line(line):
-    tokens = []
-    i = 0
-    while i < len(line):
-        if line[i] == " ":
-            i += 1
-            continue
-        if line[i] == '"':
-            j = i + 1
-            while j < len(line) and line[j] != '"':
-                if line[j] == '\\':
-                    j += 1
-                j += 1
-            if j >= len(line):
-                raise EmitError(f"unterminated string: {line}")
-            tokens.append(("STRING", line[i+1:j]))
-            i = j + 1
-            continue
-        if line[i] == '(':
-            j = line.index(')', i)
-            tokens.append(("OBJECT", line[i+1:j]))
-            i = j + 1
-            continue
-        if line[i] == '[':
-            j = line.index(']', i)
-            inner = line[i+1:j].strip()
-            args = []
-            if inner:
-                sub = tokenize_line(inner)
-                for t, v in sub:
-                    args.append((t, v))
-            tokens.append(("TUPLE", args))
-            i = j + 1
-            continue
-        j = i
-        while j < len(line) and line[j] not in (' ', '"', '(', '['):
-            j += 1
-        word = line[i:j]
-        if word:
-            tokens.append(("WORD", word))
-        i = j
-    return tokens
-
-
-def parse_line(raw_line, lineno):
-    line = raw_line.strip()
-    if not line or line.startswith(";;"):
-        return None
-    tokens = tokenize_line(line)
-    if not tokens:
-        return None
-    kind, val = tokens[0]
-    if kind != "WORD":
-        raise EmitError(f"expected opcode, got {val!r}", lineno)
-    return val, tokens[1:]
+        if self._count == self._capacity:
+            self._width += 1
+            self._capacity *= len(self._chars)
+            self._count = 0
+        n = self._count
+        self._count += 1
+        base = len(self._chars)
+        gid = []
+        for _ in range(self._width):
+            n, digit = divmod(n, base)
+            gid.append(self._chars[digit])
+        return "".join(gid)
+
+
+class ScriptWriter:
+    """
+    writes the scripts list out as emit_program flushes each event and script, so only one
+    event is ever held as a dict. the default layout is exactly json.dumps(scripts, indent=2),
+    compact drops the indentation and the spaces after separators
+    """
+    def __init__(self, out, compact=False):
+        self.out = out
+        self.compact = compact
+        self.scripts = 0
+        self.events = 0
+        self.gid = None # the open script's, its header waits for the first event
+
+    def dumps(self, value, level=0):
+        if self.compact:
+            return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        return json.dumps(value, indent=2, ensure_ascii=False).replace("\n", self.newline(level))
+
+    def newline(self, level):
+        return "" if self.compact else "\n" + "  " * level
+
+    def field(self, key, value, level):
+        return self.newline(level) + self.dumps(key) + (":" if self.compact else ": ") + self.dumps(value, level)
+
+    def start_script(self, gid):
+        self.gid = gid
+        self.out.write(("[" if not self.scripts else ",") + self.newline(1) + "{"
+                       + self.field("class", "script", 2) + "," + self.field("globalid", gid, 2) + ","
+                       + self.newline(2) + self.dumps("content") + (":[" if self.compact else ": ["))
+        self.scripts += 1
+        self.events = 0
+
+    def write_event(self, event):
+        self.out.write(("," if self.events else "") + self.newline(3) + self.dumps(event, 3))
+        self.events += 1
+
+    def end_script(self, alias=None):
+        text = (self.newline(2) if self.events else "") + "]," + self.field("enabled", "true", 2)
+        if alias:
+            text += "," + self.field("alias", alias, 2)
+        self.out.write(text + self.newline(1) + "}")
+        self.gid = None
+
+    def close(self):
+        self.out.write(self.newline(0) + "]")
 
 
 def resolve_value(token):
@@ -127,65 +180,62 @@ def build_action(opcode, args, gid, lineno):
         return {"id": "112", "text": ["else"], "globalid": gid}
     if opcode == "BREAK":
         return {"id": "24", "text": ["Break"], "globalid": gid}
-    if opcode not in SCHEMA:
+    template = ACTION_TEMPLATES.get(opcode)
+    if template is None:
         raise EmitError(f"unknown opcode {opcode!r}", lineno)
 
-    schema_entry = SCHEMA[opcode]
+    action_id, slots = template
     text_out = []
     arg_idx = 0
 
-    for slot in schema_entry["text"]:
-        if isinstance(slot, str):
+    # template dicts are never mutated, an empty slot can be shared by every action using it
+    for kind, slot in slots:
+        if kind == TEXT:
             text_out.append(slot)
             continue
-        param = dict(slot)
-        if param.get("t") == "tuple":
+        if kind == TUPLE:
             if arg_idx >= len(args):
                 raise EmitError(f"{opcode}: missing tuple arg", lineno)
-            kind, tup_args = args[arg_idx]
+            tkind, tup_args = args[arg_idx]
             arg_idx += 1
-            if kind != "TUPLE":
-                raise EmitError(f"{opcode}: expected tuple [...], got {kind!r}", lineno)
-            param["value"] = [
+            if tkind != "TUPLE":
+                raise EmitError(f"{opcode}: expected tuple [...], got {tkind!r}", lineno)
+            text_out.append({**slot, "value": [
                 {"t": "string", "l": "any", "value": v} if (v := resolve_value(t)) is not None
                 else {"t": "string", "l": "any"}
                 for t in tup_args
-            ]
-            text_out.append(param)
+            ]})
             continue
         if arg_idx >= len(args):
             raise EmitError(f"{opcode}: not enough args (slot {arg_idx})", lineno)
         value = resolve_value(args[arg_idx])
         arg_idx += 1
-        if value is not None:
-            param["value"] = value
-        text_out.append(param)
+        text_out.append(slot if value is None else {**slot, "value": value})
 
-    return {"id": schema_entry["id"], "text": text_out, "globalid": gid}
+    return {"id": action_id, "text": text_out, "globalid": gid}
 
 
 def build_event(event_type, event_args, actions, gid, x, y, lineno):
-    if event_type not in EVENT_SCHEMA:
+    template = EVENT_TEMPLATES.get(event_type)
+    if template is None:
         raise EmitError(f"unknown event type {event_type!r}", lineno)
 
-    schema = EVENT_SCHEMA[event_type]
+    event_id, slots = template
     text_out = []
     arg_idx = 0
 
-    for slot in schema["text"]:
-        if isinstance(slot, str):
+    for kind, slot in slots:
+        if kind == TEXT:
             text_out.append(slot)
             continue
-        param = dict(slot)
+        value = None
         if arg_idx < len(event_args):
             value = resolve_value(event_args[arg_idx])
             arg_idx += 1
-            if value is not None:
-                param["value"] = value
-        text_out.append(param)
+        text_out.append(slot if value is None else {**slot, "value": value})
 
     event = {
-        "id": schema["id"],
+        "id": event_id,
         "text": text_out,
         "x": str(x),
         "y": str(y),
@@ -223,24 +273,32 @@ def check_version(file_version):
 
 
 def emit(source):
-    lines = source.splitlines()
-    if not lines:
-        raise EmitError("empty source")
-
-    first = lines[0].strip()
-    if not first.startswith("CWIR_VERSION"):
-        raise EmitError("missing CWIR_VERSION declaration on first line", 1)
-
-    vtokens = tokenize_line(first)
-    if len(vtokens) >= 2:
-        check_version(vtokens[1][1])
-
-    gid_gen = GlobalIDGen()
-    scripts = []
+    """text CWIR (a .cwobj file) -> json"""
+    try:
+        version, instrs = parse(source)
+    except CWIRSyntaxError as e:
+        raise EmitError(str(e), e.line)
+    if version is not None:
+        check_version(version)
+    return emit_program(instrs)
+
+
+def emit_program(instrs, out=None, compact=False, seed=None):
+    """
+    a list of cwir.Instr straight from the IR emitter -> json. with `out` (a text file) every
+    script/event is written as soon as it's done and nothing is returned, otherwise the json
+    comes back as a string. `seed` picks the globalid alphabet order, see GlobalIDGen
+    """
+    if out is None:
+        buffer = io.StringIO()
+        emit_program(instrs, buffer, compact, seed)
+        return buffer.getvalue()
+
+    gid_gen = GlobalIDGen(seed)
+    writer = ScriptWriter(out, compact)
     flags = set()
 
     current_script_alias = None
-    current_script_events = []
     in_script_block = False
 
     current_event_type = None
@@ -261,7 +319,9 @@ def emit(source):
             current_event_type, current_event_args, current_actions,
             event_gid, x_cursor, y_cursor, current_event_lineno
         )
-        current_script_events.append(ev)
+        if writer.gid is None:
+            writer.start_script(gid_gen.next())
+        writer.write_event(ev)
         x_cursor += 400
         current_event_type = None
         current_event_args = None
@@ -269,26 +329,15 @@ def emit(source):
         event_gid = None
 
     def flush_script():
-        nonlocal current_script_alias, current_script_events, x_cursor
-        script = {
-            "class": "script",
-            "globalid": gid_gen.next(),
-            "content": current_script_events,
-            "enabled": "true",
-        }
-        if current_script_alias:
-            script["alias"] = current_script_alias
-        scripts.append(script)
+        nonlocal current_script_alias, x_cursor
+        if writer.gid is None:
+            writer.start_script(gid_gen.next())
+        writer.end_script(current_script_alias)
         current_script_alias = None
-        current_script_events = []
         x_cursor = 5000
 
-    for lineno, raw_line in enumerate(lines[1:], start=2):
-        parsed = parse_line(raw_line, lineno)
-        if parsed is None:
-            continue
-
-        opcode, args = parsed
+    for instr in instrs:
+        opcode, args, lineno = instr.op, instr.args, instr.line
 
         if opcode == "CWIR_VERSION":
             raise EmitError("CWIR_VERSION must only appear on line 1", lineno)
@@ -369,10 +418,9 @@ def emit(source):
     if in_script_block:
         raise EmitError("unclosed SCRIPT block at end of file")
 
-    if current_script_events or not scripts:
+    if writer.gid is not None or not writer.scripts:
         flush_script()
-
-    return json.dumps(scripts, indent=2, ensure_ascii=False)
+    writer.close()
 
 
 def main():
@@ -0,0 +1,109 @@
+from lexer import Lexer, LexerError
+from parser import Parser, ParseError
+from visitor import walk
+
+def shift_lines(node, delta):
+    # moves every node below `node` down (or up) by delta lines after an edit above it
+    seen = set()
+    for child in walk(node):
+        if id(child) in seen:
+            continue
+        seen.add(id(child))
+
+        if hasattr(child, 'line'):
+            child.line += delta
+        if hasattr(child, 'end_line'):
+            child.end_line += delta
+
+class IncrementalDocument:
+    """
+    an open source file whose AST gets patched on text edits instead of rebuilt.
+    an edit that stays inside one top-level event/function only re-lexes that item's
+    lines and re-parses that item, everything else is reused. anything the patch can't
+    prove safe falls back to a full reparse
+    """
+    def __init__(self, code):
+        self.reset(code)
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    def reset(self, code):
+        # editors send CRLF on windows, the lexer only knows \n
+        self.lines = code.replace("\r\n", "\n").split("\n")
+        self.parse_full()
+
+    def parse_full(self):
+        self.ast = None
+        self.errors = []
+        self.items = []
+        self.failure = None
+
+        try:
+            parser = Parser(Lexer(self.text).iter_tokens())
+            self.ast = parser.parse()
+        except (LexerError, ParseError) as e:
+            self.failure = e
+            return
+
+        self.errors = parser.errors
+        # recovered errors can leave the item spans half-parsed, don't patch those
+        if not self.errors:
+            self.items = [[node, anno_in] for node, anno_in in parser.toplevel]
+
+    def apply_edit(self, start, end, text):
+        """start/end are 0-based (line, column) pairs, same as LSP ranges"""
+        start_line, start_col = start
+        end_line, end_col = end
+
+        text = text.replace("\r\n", "\n")
+        new_text = self.lines[start_line][:start_col] + text + self.lines[end_line][end_col:]
+        new_lines = new_text.split("\n")
+        self.lines[start_line:end_line + 1] = new_lines
+        delta = len(new_lines) - (end_line - start_line + 1)
+
+        if not self.reparse_item(start_line + 1, end_line + 1, delta):
+            self.parse_full()
+
+    def reparse_item(self, first, last, delta):
+        if not self.items:
+            return False
+
+        for i, (node, anno_in) in enumerate(self.items):
+            if node.line <= first and last <= node.end_line:
+                break
+        else:
+            return False # edit spans several items or touches the gaps between them
+
+        start, end = node.line, node.end_line + delta
+        if end < start:
+            return False
+
+        chunk = "\n".join(self.lines[start - 1:end])
+        try:
+            parser = Parser(Lexer(chunk, line=start).iter_tokens())
+            parser.block_annotations = anno_in
+            new_node = parser.parse_toplevel()
+        except (LexerError, ParseError):
+            return False
+
+        if parser.errors or parser.peek().type != "EOF" or type(new_node) is not type(node):
+            return False
+
+        # block annotations (--#type ...) carry over into the next item, so the
+        # edited item has to hand them on exactly like it did before
+        if i + 1 < len(self.items) and parser.block_annotations != self.items[i + 1][1]:
+            return False
+
+        for shard in self.ast.shards:
+            for block in (shard.events, shard.func_defs):
+                for j, old in enumerate(block):
+                    if old is node:
+                        block[j] = new_node
+
+        self.items[i][0] = new_node
+        if delta:
+            for later, _ in self.items[i + 1:]:
+                shift_lines(later, delta)
+        return True
@@ -0,0 +1,199 @@
+"""
+-O3 inlining of small custom functions. runs on the CWIR before temps get their slots, so the
+callee's params and locals become fresh __tmpN temps of the caller and are packed with its own.
+function names are program-wide like everywhere else in the compiler, so helpers from required
+files get inlined too, unless they use o! variables, which belong to the script they're defined in
+"""
+import re
+from cwir import Instr, Operand, EMPTY, string, LOOP_OPENERS
+from peephole import name_re, rename
+from splitter import local_names
+from actions import ACTION_LIMIT
+from optimizer import note
+
+INLINE_MAX = 8 # actions in the callee body, RETURN included
+CALLS = ("FUNC_RUN", "FUNC_RUN_BG", "FUNC_RUN_PROTECTED")
+
+HOLE_RE = re.compile(r"\{l!([a-zA-Z_]\w*)\}")
+OBJECT_VAR_RE = re.compile(r"(?<![\w!])o!\w")
+ANY_HOLE_RE = re.compile(r"\{[^{}]*\}")
+
+def strings(args):
+    for arg in args:
+        if arg.kind == "TUPLE":
+            yield from strings(arg.value)
+        elif arg.kind != "WORD":
+            yield arg.value
+
+def used_bare(body, name):
+    # written or passed by name somewhere, not just read through "{l!x}"
+    pattern = name_re(f"l!{name}")
+    hole = f"{{l!{name}}}"
+    return any(pattern.search(value.replace(hole, "")) for ins in body for value in strings(ins.args))
+
+def object_scoped(body):
+    return any(OBJECT_VAR_RE.search(value) for ins in body for value in strings(ins.args))
+
+def stable(arg):
+    """the arg reads the same before and after the callee runs: a literal or caller locals only"""
+    if arg.kind == "WORD":
+        return arg == EMPTY
+    return arg.kind == "STRING" and all(HOLE_RE.fullmatch(h) for h in ANY_HOLE_RE.findall(arg.value))
+
+def substitute(arg, values):
+    # "{l!p}" -> the caller's arg, straight into the string. one pass so an arg that reads
+    # a caller local called like another param doesn't get substituted twice
+    if arg.kind == "TUPLE":
+        return Operand("TUPLE", [substitute(item, values) for item in arg.value])
+    if arg.kind == "WORD":
+        return arg
+    match = HOLE_RE.fullmatch(arg.value)
+    if match and match.group(1) in values:
+        return values[match.group(1)]
+
+    def hole(match):
+        value = values.get(match.group(1))
+        if value is None:
+            return match.group(0)
+        return "" if value == EMPTY else value.value
+    return Operand(arg.kind, HOLE_RE.sub(hole, arg.value))
+
+class Inliner:
+    def __init__(self, instrs, new_temp):
+        self.instrs = instrs
+        self.new_temp = new_temp # () -> "__tmpN", the emitter's counter
+
+    def inlinable(self, body):
+        """small, a single RETURN at the very end if any, nothing that needs a stack frame"""
+        if len(body) > INLINE_MAX:
+            return False
+        loops = 0
+        for i, ins in enumerate(body):
+            if ins.op in LOOP_OPENERS: loops += 1
+            elif ins.op in ("END_REPEAT", "END_ITER"): loops -= 1
+            if ins.op == "TABLE_ITER":
+                return False # its value/index locals would clash with a loop around the call
+            if ins.op == "BREAK" and loops == 0:
+                return False
+            if ins.op == "RETURN" and (i != len(body) - 1 or ins.indent != "    "):
+                return False
+        return True
+
+    def recursive(self, funcs):
+        calls = {name: {ins.args[0].value for ins in body if ins.op in CALLS and ins.args}
+                 for name, (params, body) in funcs.items()}
+
+        def reaches(start):
+            seen, todo = set(), list(calls[start])
+            while todo:
+                name = todo.pop()
+                if name == start:
+                    return True
+                if name in calls and name not in seen:
+                    seen.add(name)
+                    todo.extend(calls[name])
+            return False
+
+        return {name for name in calls if reaches(name)}
+
+    def expand(self, call, params, body):
+        """the callee body in place of the FUNC_RUN, or None if the call doesn't line up"""
+        _, args, out = call.args
+        if len(args.value) != len(params):
+            return None
+
+        renames, substituted, prologue = {}, {}, []
+        for name, arg in zip(params, args.value):
+            if stable(arg) and not used_bare(body, name):
+                substituted[name] = arg
+            else:
+                renames[name] = self.new_temp()
+                prologue.append(Instr("VAR_SET", [string(f"l!{renames[name]}"), arg], call.line, call.indent))
+        for name in local_names([arg for ins in body for arg in ins.args]):
+            if name not in substituted and name not in renames:
+                renames[name] = self.new_temp()
+        cut = min(len(ins.indent) for ins in body) if body else 0
+
+        out_body = []
+        for ins in body:
+            new_args = ins.args
+            # callee names first, the substituted args can read caller locals
+            for name, new in renames.items():
+                pattern = name_re(f"l!{name}")
+                new_args = [rename(a, pattern, f"l!{new}") for a in new_args]
+            if substituted:
+                new_args = [substitute(a, substituted) for a in new_args]
+            out_body.append(Instr(ins.op, new_args, call.line, call.indent + ins.indent[cut:]))
+
+        ret = EMPTY
+        if out_body and out_body[-1].op == "RETURN":
+            returned = out_body.pop()
+            ret = returned.args[0] if returned.args else EMPTY
+        if out != EMPTY:
+            out_body.append(Instr("VAR_SET", [out, ret], call.line, call.indent))
+        return prologue + out_body
+
+    def inline_body(self, body, funcs, label):
+        i = 0
+        while i < len(body):
+            ins = body[i]
+            name = ins.args[0].value if ins.op == "FUNC_RUN" and len(ins.args) == 3 else None
+            if name in funcs:
+                params, callee = funcs[name]
+                expanded = self.expand(ins, params, callee)
+                if expanded is not None and len(body) - 1 + len(expanded) <= ACTION_LIMIT:
+                    note(self.Colors, 3, f"inlined '{name}' into {label} at line {ins.line}")
+                    # no i += 1, calls inside the callee are candidates too
+                    body[i:i + 1] = expanded
+                    continue
+            i += 1
+        return body
+
+    def inline_scripts(self, scripts):
+        funcs = {}
+        for home, script in enumerate(scripts):
+            for event, body in script:
+                if event.args and event.args[0].value == "FUNC_DEF" and len(event.args) > 1:
+                    name = event.args[1].value
+                    params = [p.value for p in event.args[2].value] if len(event.args) > 2 else []
+                    # a name defined twice is ambiguous, leave those calls alone
+                    funcs[name] = None if name in funcs else (params, list(body), home)
+        recursive = self.recursive({name: f[:2] for name, f in funcs.items() if f})
+        funcs = {name: f for name, f in funcs.items() if f and name not in recursive and self.inlinable(f[1])}
+        if not funcs:
+            return
+        for n, script in enumerate(scripts):
+            # o! variables would read the calling script's instead of the library's
+            usable = {name: (params, body) for name, (params, body, home) in funcs.items()
+                      if home == n or not object_scoped(body)}
+            for event, body in script:
+                kind = event.args[0].value if event.args else "?"
+                label = f"function '{event.args[1].value}'" if kind == "FUNC_DEF" and len(event.args) > 1 else f"event {kind}"
+                self.inline_body(body, usable, label)
+
+    def inline(self, colors_class=None):
+        self.Colors = colors_class
+        out = []
+        scripts = []
+        script, body = [], None
+        for ins in self.instrs:
+            if ins.op == "EVENT":
+                out.append(ins)
+                body = []
+                script.append((ins, body))
+                out.append(body) # inlined in place, flattened below
+            elif ins.op == "END_EVENT" and body is not None:
+                out.append(ins)
+                body = None
+            elif body is not None:
+                body.append(ins)
+            else:
+                if ins.op == "END_SCRIPT":
+                    scripts.append(script)
+                    script = []
+                out.append(ins)
+        if script:
+            scripts.append(script)
+        self.inline_scripts(scripts)
+        self.instrs = [ins for item in out for ins in (item if isinstance(item, list) else [item])]
+        return self.instrs
@@ -2,13 +2,16 @@
 # from platform import node
 
 from ast_nodes import *
+from cwir import Instr, EMPTY, string, obj, word, tuple_of
+from regalloc import allocate_temps
+from inliner import Inliner
 
 class IREmitter:
     def __init__(self, ast, semantic_analyzer):
         self.ast = ast
         self.semantic = semantic_analyzer
-        self.lines = []
-        self.lines = []
+        self.instrs = []
+        self.line = None # source line of the statement being emitted
         # not the full list but you get the idea
         self.AUDIO_PROPS = {"Volume", "PlaybackSpeed", "TimePosition", "IsLoaded", "IsPlaying", "IsPaused"}
         self.INPUT_PROPS = {"Text", "PlaceholderText", "CursorPosition", "SelectionStart"}
@@ -65,25 +68,29 @@ class IREmitter:
             "cookie.del": ("COOKIE_DEL", 1, False),
         }
 
-    def emit(self):
-        self.lines.append("CWIR_VERSION 1.0\n")
-        
+    def emit(self, colors=None):
+        """returns the program as a list of cwir.Instr, cwir.serialize() gives the text form"""
         for shard in self.ast.shards:
-            self.lines.append("SCRIPT")
+            self.line = None
+            self.add("", "SCRIPT")
             if shard.alias:
-                self.lines.append(f'SCRIPT_ALIAS "{shard.alias}"\n')
+                self.add("", "SCRIPT_ALIAS", string(shard.alias))
                 
             for func in shard.func_defs:
                 self.emit_function(func)
             for event in shard.events:
                 self.emit_event(event)
                 
-            self.lines.append("END_SCRIPT\n")
-            
-        return "\n".join(self.lines)
+            self.line = None
+            self.add("", "END_SCRIPT")
+
+        if self.semantic.opt_level >= 3:
+            self.instrs = Inliner(self.instrs, lambda: self.new_tmp_var().name).inline(colors)
+        self.finish_bodies()
+        return self.instrs
 
-    def add(self, line):
-        self.lines.append(line)
+    def add(self, ind, op, *args):
+        self.instrs.append(Instr(op, args, self.line, ind))
 
     def new_tmp_var(self):
         if not hasattr(self, 'tmp_counter'):
@@ -96,12 +103,12 @@ class IREmitter:
     def format_interp(self, raw):
         import re
         result = re.sub(r'\{g!(\w+)\}', r'{\1}', raw)
-        return f'"{result}"'
+        return string(result)
 
     def scaffold(self, node, ind):
         if isinstance(node, (NumberLit, StringLit)):
             tmp = self.new_tmp_var()
-            self.add(f'{ind}VAR_SET {self.format_var_name(tmp)} {self.format_val(node)}')
+            self.add(ind, "VAR_SET", self.format_var_name(tmp), self.format_val(node))
             return tmp
         if isinstance(node, BinaryExpr):
             left_node = self.scaffold(node.left, ind)
@@ -113,7 +120,7 @@ class IREmitter:
             if node.op == "..":
                 tmp_ref = self.new_tmp_var()
                 tmp_str = self.format_var_name(tmp_ref)
-                self.add(f'{ind}STR_CONCAT {left_str} {right_str} {tmp_str}')
+                self.add(ind, "STR_CONCAT", left_str, right_str, tmp_str)
                 return tmp_ref
 
             if isinstance(left_node, VarRef) and left_node.name.startswith("__tmp"):
@@ -123,11 +130,11 @@ class IREmitter:
                 # create a new one if the left side is just a normal variable or number
                 tmp_ref = self.new_tmp_var()
                 tmp_str = self.format_var_name(tmp_ref)
-                self.add(f'{ind}VAR_SET {tmp_str} {left_str}')
+                self.add(ind, "VAR_SET", tmp_str, left_str)
             
             op_map = {"+": "VAR_INC", "-": "VAR_DEC", "*": "VAR_MUL", "/": "VAR_DIV", "^": "VAR_POW", "%": "VAR_MOD"}
             if node.op in op_map:
-                self.add(f'{ind}{op_map[node.op]} {tmp_str} {right_str}')
+                self.add(ind, op_map[node.op], tmp_str, right_str)
             
             return tmp_ref
 
@@ -144,8 +151,8 @@ class IREmitter:
             val = self.format_val(self.scaffold(node.right, ind))
             tmp_ref = self.new_tmp_var()
             tmp_str = self.format_var_name(tmp_ref)
-            self.add(f'{ind}VAR_SET {tmp_str} "0"')
-            self.add(f'{ind}VAR_DEC {tmp_str} {val}')
+            self.add(ind, "VAR_SET", tmp_str, string("0"))
+            self.add(ind, "VAR_DEC", tmp_str, val)
             return tmp_ref
         
         return node
@@ -153,43 +160,43 @@ class IREmitter:
     def format_var_name(self, node):
         if isinstance(node, VarRef):
             prefix = node.prefix if node.prefix in ('l!', 'o!') else ""
-            return f'"{prefix}{node.name}"'
-        return '"temp"'
+            return string(f"{prefix}{node.name}")
+        return string("temp")
 
     def format_val(self, node):
-        if node is None: return "EMPTY"
+        if node is None: return EMPTY
         if isinstance(node, NumberLit):
-            return f'"{node.value}"'
+            return string(node.value)
         if isinstance(node, StringLit):
-            return f'"{node.value}"'
+            return string(node.value)
         if isinstance(node, InterpStringLit):
             return self.format_interp(node.value)
         if isinstance(node, UnaryExpr) and node.op == "-" and isinstance(node.right, NumberLit):
-            return f'"-{node.right.value}"'
+            return string(f"-{node.right.value}")
         if isinstance(node, VarRef):
-            if node.name == "nil": return "EMPTY"
+            if node.name == "nil": return EMPTY
             prefix = node.prefix if node.prefix in ('l!', 'o!') else ""
-            return f'"{{{prefix}{node.name}}}"'
+            return string(f"{{{prefix}{node.name}}}")
         if isinstance(node, PropRef):
             obj_name = node.obj.name if isinstance(node.obj, VarRef) else "obj"
-            return f'"{{{obj_name}.{node.prop}}}"'
-        return "EMPTY"
+            return string(f"{{{obj_name}.{node.prop}}}")
+        return EMPTY
 
     def format_obj(self, node):
         if isinstance(node, VarRef):
             # uppercase = static UI element, lowercase = runtime object variable (cheap trick)
             if node.name[0].isupper():
-                return f'({node.name})'
+                return obj(node.name)
             prefix = node.prefix if node.prefix in ('l!', 'o!') else ""
-            return f'"{{{prefix}{node.name}}}"'
+            return string(f"{{{prefix}{node.name}}}")
         return self.format_val(node)
 
     def emit_function(self, func):
-        args_str = " ".join([f'"{arg}"' for arg in func.params])
-        args_arr = f"[{args_str}]" if args_str else "[]"
-        self.add(f'EVENT FUNC_DEF "{func.name}" {args_arr}')
+        self.line = func.line
+        self.add("", "EVENT", word("FUNC_DEF"), string(func.name), tuple_of(string(arg) for arg in func.params))
         self.emit_block(func.body)
-        self.add("END_EVENT\n")
+        self.line = func.end_line
+        self.add("", "END_EVENT")
 
     def emit_event(self, event):
         ev_map = {
@@ -198,64 +205,89 @@ class IREmitter:
             "OnCrossSiteMessageReceived": "CROSSSITE_MSG",
         }
         name = event.event_type
-        args_out = ""
+        args_out = None
         
         if name in ev_map: ev_type = ev_map[name]
         elif name.endswith(".MouseButton1Click"):
-            ev_type, args_out = "PRESSED", f"({name.split('.')[0]})"
+            ev_type, args_out = "PRESSED", obj(name.split('.')[0])
         elif name.endswith(".MouseEnter"):
-            ev_type, args_out = "MOUSE_ENTER", f"({name.split('.')[0]})"
+            ev_type, args_out = "MOUSE_ENTER", obj(name.split('.')[0])
         elif name.endswith(".MouseLeave"):
-            ev_type, args_out = "MOUSE_LEAVE", f"({name.split('.')[0]})"
+            ev_type, args_out = "MOUSE_LEAVE", obj(name.split('.')[0])
         elif name.endswith(".FocusLost"):
-            ev_type, args_out = "INPUT_SUBMIT", f"({name.split('.')[0]})"
+            ev_type, args_out = "INPUT_SUBMIT", obj(name.split('.')[0])
         elif name.endswith(".InputBegan"):
-            ev_type, args_out = "KEY_PRESSED", f'"{event.args[0]}"' if event.args else '"Unknown"'
+            ev_type, args_out = "KEY_PRESSED", string(event.args[0]) if event.args else string("Unknown")
         elif name.endswith(".OnDonationPurchase"):
-            ev_type, args_out = "DONATION", f"({name.split('.')[0]})"
+            ev_type, args_out = "DONATION", obj(name.split('.')[0])
         elif name.endswith(".MouseButton2Click"):
-            ev_type, args_out = "RIGHT_CLICKED", f"({name.split('.')[0]})"
+            ev_type, args_out = "RIGHT_CLICKED", obj(name.split('.')[0])
         elif name.endswith(".MouseButton1Down"):
-            ev_type, args_out = "MOUSE_DOWN", f"({name.split('.')[0]})"
+            ev_type, args_out = "MOUSE_DOWN", obj(name.split('.')[0])
         elif name.endswith(".MouseButton1Up"):
-            ev_type, args_out = "MOUSE_UP", f"({name.split('.')[0]})"
+            ev_type, args_out = "MOUSE_UP", obj(name.split('.')[0])
         else:
-            ev_type, args_out = "CHANGED", f"({name.split('.')[0] if '.' in name else name})"
+            ev_type, args_out = "CHANGED", obj(name.split('.')[0] if '.' in name else name)
             
-        self.add(f'EVENT {ev_type} {args_out}'.strip())
+        self.line = event.line
+        self.add("", "EVENT", word(ev_type), *([args_out] if args_out else []))
         self.emit_block(event.body)
-        self.add("END_EVENT\n")
+        self.line = event.end_line
+        self.add("", "END_EVENT")
+
+    def finish_bodies(self):
+        # temps only live inside one event/function, so their slots can be packed per body
+        if self.semantic.opt_level < 1:
+            return
+        start = None
+        for i, instr in enumerate(self.instrs):
+            if instr.op == "EVENT":
+                start = i + 1
+            elif instr.op == "END_EVENT" and start is not None:
+                allocate_temps(self.instrs[start:i])
+                start = None
 
     def emit_block(self, stmts, indent="    "):
+        line = self.line
         for stmt in stmts:
             self.emit_stmt(stmt, indent)
+        self.line = line # closers (ELSE, END_IF, ...) belong to the statement that opened the block
+
+    def rename_operand(self, arg, renames):
+        if arg.kind == "TUPLE":
+            return tuple_of(self.rename_operand(item, renames) for item in arg.value)
+        value = arg.value
+        for old, new in renames:
+            value = value.replace(old, new)
+        return arg._replace(value=value)
 
     def emit_stmt(self, stmt, ind):
+        self.line = stmt.line
         if isinstance(stmt, AssignStmt): self.emit_assign(stmt, ind)
-        elif isinstance(stmt, CommentStmt): self.add(f'{ind}COMMENT "{stmt.value}"')
+        elif isinstance(stmt, CommentStmt): self.add(ind, "COMMENT", string(stmt.value))
         elif isinstance(stmt, CallStmt): self.emit_call(stmt, ind)
         elif isinstance(stmt, IfStmt): self.emit_if(stmt, ind)
         elif isinstance(stmt, RepeatStmt): self.emit_repeat(stmt, ind)
         elif isinstance(stmt, ForStmt): self.emit_for(stmt, ind)
-        elif isinstance(stmt, BreakStmt): self.add(f"{ind}BREAK")
+        elif isinstance(stmt, BreakStmt): self.add(ind, "BREAK")
         elif isinstance(stmt, ReturnStmt):
             val = stmt.value
             if isinstance(val, (BinaryExpr, CallStmt, UnaryExpr)):
                 val = self.scaffold(val, ind)
-            self.add(f"{ind}RETURN {self.format_val(val)}")
+            self.add(ind, "RETURN", self.format_val(val))
         elif isinstance(stmt, DeleteStmt):
             if isinstance(stmt.target, VarRef):
                 if stmt.target.name[0].isupper():
-                    self.add(f"{ind}LOOK_DELETE {self.format_obj(stmt.target)}")
+                    self.add(ind, "LOOK_DELETE", self.format_obj(stmt.target))
                 else:
-                    self.add(f'{ind}VAR_DEL {self.format_var_name(stmt.target)}')
+                    self.add(ind, "VAR_DEL", self.format_var_name(stmt.target))
             elif isinstance(stmt.target, PropRef):
                 tbl = self.format_var_name(stmt.target.obj)
-                self.add(f'{ind}TABLE_DEL "{stmt.target.prop}" {tbl}')
+                self.add(ind, "TABLE_DEL", string(stmt.target.prop), tbl)
             elif isinstance(stmt.target, IndexRef):
                 tbl = self.format_var_name(stmt.target.table)
                 entry = self.format_val(stmt.target.index)
-                self.add(f'{ind}TABLE_DEL {entry} {tbl}')
+                self.add(ind, "TABLE_DEL", entry, tbl)
 
     def emit_assign(self, stmt, ind):
         target = stmt.targets[0]
@@ -267,8 +299,8 @@ class IREmitter:
             if isinstance(stmt.value.func_expr, PropRef):
                 if stmt.value.func_expr.prop == "GetMouseLocation":
                     x_var = self.format_var_name(stmt.targets[0])
-                    y_var = self.format_var_name(stmt.targets[1]) if len(stmt.targets) > 1 else "EMPTY"
-                    self.add(f'{ind}INPUT_GET_CURSOR {x_var} {y_var}')
+                    y_var = self.format_var_name(stmt.targets[1]) if len(stmt.targets) > 1 else EMPTY
+                    self.add(ind, "INPUT_GET_CURSOR", x_var, y_var)
                     return
 
         if isinstance(stmt.value, PropRef):
@@ -279,8 +311,8 @@ class IREmitter:
                         y_var = self.format_var_name(stmt.targets[1])
                     else:
                         x_var = self.format_var_name(stmt.targets[0])
-                        y_var = "EMPTY"
-                    self.add(f'{ind}INPUT_GET_VIEWPORT {x_var} {y_var}')
+                        y_var = EMPTY
+                    self.add(ind, "INPUT_GET_VIEWPORT", x_var, y_var)
                     return
             elif isinstance(stmt.value.obj, VarRef) and stmt.value.obj.name == "Camera":
                 if stmt.value.prop == "ViewportSize":
@@ -289,8 +321,8 @@ class IREmitter:
                         y_var = self.format_var_name(stmt.targets[1])
                     else:
                         x_var = self.format_var_name(stmt.targets[0])
-                        y_var = "EMPTY"
-                    self.add(f'{ind}INPUT_GET_VIEWPORT {x_var} {y_var}')
+                        y_var = EMPTY
+                    self.add(ind, "INPUT_GET_VIEWPORT", x_var, y_var)
                     return
 
         if isinstance(stmt.value, CallStmt):
@@ -302,8 +334,8 @@ class IREmitter:
                     print(out_var)
                     arg = stmt.value.args[0] if stmt.value.args else None
                     if arg is not None:
-                        self.add(f'{ind}VAR_SET {out_var} {self.format_val(arg)}')
-                    self.add(f'{ind}{op} {out_var}')
+                        self.add(ind, "VAR_SET", out_var, self.format_val(arg))
+                    self.add(ind, op, out_var)
                     return
                  
         if isinstance(stmt.value, UnaryExpr) and stmt.value.op == "#":
@@ -314,21 +346,21 @@ class IREmitter:
                 array_name = f"{prefix}{arr_node.name}"
             else:
                 array_name = "temp"
-            self.add(f'{ind}TABLE_LEN "{array_name}" {var_name}')
+            self.add(ind, "TABLE_LEN", string(array_name), var_name)
             return
             
         if isinstance(stmt.value, BinaryExpr) and stmt.value.op == "..":
             out_var = self.format_var_name(target)
             left = self.format_val(stmt.value.left)
             right = self.format_val(stmt.value.right)
-            self.add(f'{ind}STR_CONCAT {left} {right} {out_var}')
+            self.add(ind, "STR_CONCAT", left, right, out_var)
             return
 
         if isinstance(stmt.value, (BinaryExpr, CallStmt, UnaryExpr)):
             stmt.value = self.scaffold(stmt.value, ind)
 
         if isinstance(stmt.value, TableLit):
-            self.add(f'{ind}TABLE_CREATE {self.format_var_name(target)}')
+            self.add(ind, "TABLE_CREATE", self.format_var_name(target))
             return
         
         is_object_assign = getattr(stmt, 'annotations', {}).get('type') == 'object'
@@ -359,29 +391,29 @@ class IREmitter:
 
             if is_audio:
                 obj_ref = self.format_var_name(obj_node)
-                self.add(f'{ind}AVAR_GET "{prop}" {obj_ref} {out_var}')
+                self.add(ind, "AVAR_GET", string(prop), obj_ref, out_var)
                 return
                 
             if is_input and prop == "Text":
                 obj_ref = self.format_obj(obj_node)
-                self.add(f'{ind}INPUT_GET_TEXT {obj_ref} {out_var}')
+                self.add(ind, "INPUT_GET_TEXT", obj_ref, out_var)
                 return
 
             if obj_name == "LocalPlayer":
-                if prop == "Name": self.add(f'{ind}USER_GET_NAME {out_var}')
-                elif prop == "UserId": self.add(f'{ind}USER_GET_ID {out_var}')
-                elif prop == "DisplayName": self.add(f'{ind}USER_GET_DISPLAY {out_var}')
+                if prop == "Name": self.add(ind, "USER_GET_NAME", out_var)
+                elif prop == "UserId": self.add(ind, "USER_GET_ID", out_var)
+                elif prop == "DisplayName": self.add(ind, "USER_GET_DISPLAY", out_var)
                 return
 
             if is_prop:
                 obj_ref = self.format_obj(obj_node)
-                if prop == "Parent": self.add(f'{ind}HIER_GET_PARENT {obj_ref} {out_var}')
-                else: self.add(f'{ind}LOOK_GET_PROP "{prop}" {obj_ref} {out_var}')
+                if prop == "Parent": self.add(ind, "HIER_GET_PARENT", obj_ref, out_var)
+                else: self.add(ind, "LOOK_GET_PROP", string(prop), obj_ref, out_var)
             else:
                 tbl_ref = self.format_var_name(obj_node)
                 idx_node = getattr(target, 'index', None)
-                entry = f'"{prop}"' if prop else self.format_val(idx_node)
-                self.add(f'{ind}TABLE_GET {entry} {tbl_ref} {out_var}')
+                entry = string(prop) if prop else self.format_val(idx_node)
+                self.add(ind, "TABLE_GET", entry, tbl_ref, out_var)
             return
 
         # handle writing properties & tables
@@ -399,41 +431,41 @@ class IREmitter:
 
             # audio & table setters
             is_audio = getattr(stmt, 'annotations', {}).get('type') == 'audio' or prop in getattr(self, 'AUDIO_PROPS', set())
-            is_object_table = getattr(stmt, 'annotations', {}).get('type') == 'object' or val_str.startswith('(') or val_str.startswith('"{o!')
+            is_object_table = getattr(stmt, 'annotations', {}).get('type') == 'object' or val_str.kind == "OBJECT" or str(val_str).startswith('"{o!')
 
             if is_audio:
                 obj_ref = self.format_var_name(obj_node)
-                self.add(f'{ind}AVAR_SET "{prop}" {obj_ref} {val_str}')
+                self.add(ind, "AVAR_SET", string(prop), obj_ref, val_str)
                 return
 
             if is_prop:
                 obj_ref = self.format_obj(obj_node)
                 if prop == "Parent":
-                    self.add(f'{ind}HIER_PARENT {obj_ref} {val_str}')
+                    self.add(ind, "HIER_PARENT", obj_ref, val_str)
                 elif prop == "Text":
-                    self.add(f'{ind}LOOK_SET_TEXT {obj_ref} {val_str}')
+                    self.add(ind, "LOOK_SET_TEXT", obj_ref, val_str)
                 else:
-                    self.add(f'{ind}LOOK_SET_PROP "{prop}" {obj_ref} {val_str}')
+                    self.add(ind, "LOOK_SET_PROP", string(prop), obj_ref, val_str)
             else:
                 tbl_ref = self.format_var_name(obj_node)
                 idx_node = getattr(target, 'index', None)
-                entry = f'"{prop}"' if prop else self.format_val(idx_node)
+                entry = string(prop) if prop else self.format_val(idx_node)
                 
                 if is_object_table:
-                    self.add(f'{ind}TABLE_SET_OBJ {entry} {tbl_ref} {val_str}')
+                    self.add(ind, "TABLE_SET_OBJ", entry, tbl_ref, val_str)
                 else:
-                    self.add(f'{ind}TABLE_SET {entry} {tbl_ref} {val_str}')
+                    self.add(ind, "TABLE_SET", entry, tbl_ref, val_str)
             return
 
         out_var = self.format_var_name(target)
         
-        if stmt.op == "=": self.add(f'{ind}VAR_SET {out_var} {val_str}')
-        elif stmt.op == "+=": self.add(f'{ind}VAR_INC {out_var} {val_str}')
-        elif stmt.op == "-=": self.add(f'{ind}VAR_DEC {out_var} {val_str}')
-        elif stmt.op == "*=": self.add(f'{ind}VAR_MUL {out_var} {val_str}')
-        elif stmt.op == "/=": self.add(f'{ind}VAR_DIV {out_var} {val_str}')
-        elif stmt.op == "^=": self.add(f'{ind}VAR_POW {out_var} {val_str}')
-        elif stmt.op == "%=": self.add(f'{ind}VAR_MOD {out_var} {val_str}')
+        if stmt.op == "=": self.add(ind, "VAR_SET", out_var, val_str)
+        elif stmt.op == "+=": self.add(ind, "VAR_INC", out_var, val_str)
+        elif stmt.op == "-=": self.add(ind, "VAR_DEC", out_var, val_str)
+        elif stmt.op == "*=": self.add(ind, "VAR_MUL", out_var, val_str)
+        elif stmt.op == "/=": self.add(ind, "VAR_DIV", out_var, val_str)
+        elif stmt.op == "^=": self.add(ind, "VAR_POW", out_var, val_str)
+        elif stmt.op == "%=": self.add(ind, "VAR_MOD", out_var, val_str)
 
     def emit_call(self, stmt, ind, target_override=None):
         func_name = ""
@@ -444,8 +476,8 @@ class IREmitter:
             obj = stmt.func_expr.obj
             audio_methods = {"Stop": "AUDIO_STOP", "Pause": "AUDIO_PAUSE", "Resume": "AUDIO_RESUME"}
             if prop in audio_methods:
-                obj_ref = self.format_var_name(obj) if isinstance(obj, VarRef) else "EMPTY"
-                self.add(f"{ind}{audio_methods[prop]} {obj_ref}")
+                obj_ref = self.format_var_name(obj) if isinstance(obj, VarRef) else EMPTY
+                self.add(ind, audio_methods[prop], obj_ref)
                 return
             obj_name = getattr(obj, 'name', 'obj')
             func_name = f"{obj_name}.{prop}"
@@ -454,7 +486,7 @@ class IREmitter:
             if isinstance(stmt.args[i], (BinaryExpr, UnaryExpr)):
                 stmt.args[i] = self.scaffold(stmt.args[i], ind)
 
-        out_var = target_override if target_override else "EMPTY"
+        out_var = target_override if target_override else EMPTY
         if not target_override and getattr(stmt, 'targets', None):
             out_var = self.format_var_name(stmt.targets[0])
 
@@ -463,17 +495,16 @@ class IREmitter:
         is_custom = getattr(stmt, 'force_custom', False)
 
         if (is_custom or func_name in self.semantic.funcs) and not is_builtin:
-            args_fmt = " ".join([self.format_val(a) for a in stmt.args])
-            args_arr = f"[{args_fmt}]" if args_fmt else "[]"
+            args_arr = tuple_of(self.format_val(a) for a in stmt.args)
             
             if getattr(stmt, 'is_protected', False):
-                success_var = self.format_var_name(stmt.targets[0]) if len(stmt.targets) > 0 else "EMPTY"
-                out_var_prot = self.format_var_name(stmt.targets[1]) if len(stmt.targets) > 1 else "EMPTY"
-                self.add(f'{ind}FUNC_RUN_PROTECTED "{func_name}" {args_arr} {success_var} {out_var_prot}')
+                success_var = self.format_var_name(stmt.targets[0]) if len(stmt.targets) > 0 else EMPTY
+                out_var_prot = self.format_var_name(stmt.targets[1]) if len(stmt.targets) > 1 else EMPTY
+                self.add(ind, "FUNC_RUN_PROTECTED", string(func_name), args_arr, success_var, out_var_prot)
             elif getattr(stmt, 'is_bg', False):
-                self.add(f'{ind}FUNC_RUN_BG "{func_name}" {args_arr}')
+                self.add(ind, "FUNC_RUN_BG", string(func_name), args_arr)
             else:
-                self.add(f'{ind}FUNC_RUN "{func_name}" {args_arr} {out_var}')
+                self.add(ind, "FUNC_RUN", string(func_name), args_arr, out_var)
             return
 
         if func_name in self.SIMPLE_CALLS:
@@ -488,97 +519,97 @@ class IREmitter:
                         val = self.format_obj(stmt.args[i]) if "LOOK_" in opcode else self.format_val(stmt.args[i])
                     args_fmt.append(val)
                 else:
-                    args_fmt.append('"0"' if opcode == "WAIT" else '""' if opcode == "TABLE_JOIN" else "EMPTY")
+                    args_fmt.append(string("0") if opcode == "WAIT" else string("") if opcode == "TABLE_JOIN" else EMPTY)
             
             if yields_output:
                 args_fmt.append(out_var)
                 
-            self.add(f"{ind}{opcode} " + " ".join(args_fmt))
+            self.add(ind, opcode, *args_fmt)
             return
 
         if func_name.startswith("math."):
             math_func = func_name.split(".")[1]
             if math_func == "random":
-                min_val = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else '"0"'
-                max_val = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else '"1"'
-                self.add(f"{ind}VAR_RANDOM {out_var} {min_val} {max_val}")
+                min_val = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else string("0")
+                max_val = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else string("1")
+                self.add(ind, "VAR_RANDOM", out_var, min_val, max_val)
             elif math_func in ("round", "floor", "ceil"):
                 op = {"round": "VAR_ROUND", "floor": "VAR_FLOOR", "ceil": "VAR_CEIL"}[math_func]
                 if stmt.args:
                     arg = stmt.args[0]
-                    if out_var and out_var != "EMPTY":
-                        self.add(f"{ind}VAR_SET {out_var} {self.format_val(arg)}")
-                        self.add(f"{ind}{op} {out_var}")
+                    if out_var and out_var != EMPTY:
+                        self.add(ind, "VAR_SET", out_var, self.format_val(arg))
+                        self.add(ind, op, out_var)
                         return out_var
                     else:
                         if not isinstance(arg, VarRef):
                             arg = self.scaffold(arg, ind)
                         arg_var = self.format_var_name(arg)
-                        self.add(f"{ind}{op} {arg_var}")
+                        self.add(ind, op, arg_var)
                         return arg
                 return None
             else:
-                args_fmt = " ".join([self.format_val(a) for a in stmt.args])
-                args_arr = f"[{args_fmt}]" if args_fmt else "[]"
-                self.add(f'{ind}MATH_RUN "{math_func}" {args_arr} {out_var}')
+                args_arr = tuple_of(self.format_val(a) for a in stmt.args)
+                self.add(ind, "MATH_RUN", string(math_func), args_arr, out_var)
 
         elif func_name == "string.sub":
-            val = self.format_var_name(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            start = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            end = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else "EMPTY"
-            self.add(f"{ind}STR_SUB {val} {start} {end}")
+            val = self.format_var_name(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            start = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            end = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else EMPTY
+            self.add(ind, "STR_SUB", val, start, end)
             
         elif func_name == "string.gsub":
-            val = self.format_var_name(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            find = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            repl = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else "EMPTY"
-            self.add(f"{ind}STR_REPLACE {find} {val} {repl}")
+            val = self.format_var_name(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            find = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            repl = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else EMPTY
+            self.add(ind, "STR_REPLACE", find, val, repl)
 
         elif func_name in ("page.broadcast", "site.broadcast", "crossSite.broadcast"):
             op = {"page.broadcast": "NET_BROADCAST_PAGE", "site.broadcast": "NET_BROADCAST_SITE", "crossSite.broadcast": "NET_BROADCAST_CROSSSITE"}[func_name]
-            msg = self.format_val(stmt.args[0]) if stmt.args else "EMPTY"
-            target = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            self.add(f"{ind}{op} {msg} {target}" if func_name == "crossSite.broadcast" else f"{ind}{op} {msg}")
+            msg = self.format_val(stmt.args[0]) if stmt.args else EMPTY
+            target = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            if func_name == "crossSite.broadcast": self.add(ind, op, msg, target)
+            else: self.add(ind, op, msg)
 
         elif type(stmt.func_expr).__name__ == "PropRef" and stmt.func_expr.prop == "insert":
             obj = stmt.func_expr.obj
             if isinstance(obj, VarRef):
                 prefix = obj.prefix if obj.prefix in ('l!', 'o!') else ""
-                arr = f'"{prefix}{obj.name}"'
+                arr = string(f"{prefix}{obj.name}")
             else:
                 arr = self.format_var_name(obj)
-            val = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            pos = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            self.add(f"{ind}TABLE_INSERT {val} {pos} {arr}")
+            val = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            pos = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            self.add(ind, "TABLE_INSERT", val, pos, arr)
             
         elif type(stmt.func_expr).__name__ == "PropRef" and stmt.func_expr.prop == "remove":
             arr = self.format_var_name(stmt.func_expr.obj)
-            pos = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
+            pos = self.format_val(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
             obj = stmt.func_expr.obj
             if isinstance(obj, VarRef):
                 prefix = obj.prefix if obj.prefix in ('l!', 'o!') else ""
-                arr = f'"{prefix}{obj.name}"'
+                arr = string(f"{prefix}{obj.name}")
             else:
                 arr = self.format_var_name(obj)
-            self.add(f"{ind}TABLE_REMOVE {pos} {arr}")
+            self.add(ind, "TABLE_REMOVE", pos, arr)
 
         elif func_name == "getChildren":
-            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            self.add(f"{ind}HIER_GET_CHILDREN {obj} {out_var}")
+            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            self.add(ind, "HIER_GET_CHILDREN", obj, out_var)
             
         elif func_name == "findFirstChild":
-            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            child_name = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            self.add(f"{ind}HIER_FIND_CHILD {child_name} {obj} {out_var}")
+            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            child_name = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            self.add(ind, "HIER_FIND_CHILD", child_name, obj, out_var)
 
         elif func_name == "tween":
-            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else "EMPTY"
-            prop = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else "EMPTY"
-            val = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else "EMPTY"
-            time = self.format_val(stmt.args[3]) if len(stmt.args) > 3 else "EMPTY"
-            style = self.format_val(stmt.args[4]) if len(stmt.args) > 4 else "EMPTY"
-            dir_ = self.format_val(stmt.args[5]) if len(stmt.args) > 5 else "EMPTY"
-            self.add(f"{ind}LOOK_TWEEN {prop} {obj} {val} {time} {style} {dir_}")
+            obj = self.format_obj(stmt.args[0]) if len(stmt.args) > 0 else EMPTY
+            prop = self.format_val(stmt.args[1]) if len(stmt.args) > 1 else EMPTY
+            val = self.format_val(stmt.args[2]) if len(stmt.args) > 2 else EMPTY
+            time = self.format_val(stmt.args[3]) if len(stmt.args) > 3 else EMPTY
+            style = self.format_val(stmt.args[4]) if len(stmt.args) > 4 else EMPTY
+            dir_ = self.format_val(stmt.args[5]) if len(stmt.args) > 5 else EMPTY
+            self.add(ind, "LOOK_TWEEN", prop, obj, val, time, style, dir_)
 
     def emit_if(self, stmt, ind):
         self._emit_condition(stmt.condition, ind)
@@ -586,18 +617,18 @@ class IREmitter:
         closing_ends, curr_ind = 1, ind
         
         for elif_cond, elif_body in stmt.else_ifs:
-            self.add(f"{curr_ind}ELSE")
+            self.add(curr_ind, "ELSE")
             curr_ind += "    "
             self._emit_condition(elif_cond, curr_ind)
             self.emit_block(elif_body, curr_ind + "    ")
             closing_ends += 1
             
         if stmt.false_body:
-            self.add(f"{curr_ind}ELSE")
+            self.add(curr_ind, "ELSE")
             self.emit_block(stmt.false_body, curr_ind + "    ")
             
         for _ in range(closing_ends):
-            self.add(f"{curr_ind}END_IF")
+            self.add(curr_ind, "END_IF")
             if len(curr_ind) >= 4: curr_ind = curr_ind[:-4]
 
     def _emit_condition(self, cond, ind):
@@ -606,41 +637,41 @@ class IREmitter:
             
             if isinstance(cond.func_expr, PropRef):
                 if getattr(cond.func_expr.obj, 'name', '') == "string" and cond.func_expr.prop == "find":
-                    str_a = self.format_val(cond.args[0]) if len(cond.args) > 0 else "EMPTY"
-                    str_b = self.format_val(cond.args[1]) if len(cond.args) > 1 else "EMPTY"
-                    self.add(f"{ind}IF_CONTAINS {str_a} {str_b}")
+                    str_a = self.format_val(cond.args[0]) if len(cond.args) > 0 else EMPTY
+                    str_b = self.format_val(cond.args[1]) if len(cond.args) > 1 else EMPTY
+                    self.add(ind, "IF_CONTAINS", str_a, str_b)
                     return
 
             if func_name == "IsAncestorOf":
-                obj = self.format_obj(cond.args[0]) if len(cond.args) > 0 else "EMPTY"
-                child = self.format_obj(cond.args[1]) if len(cond.args) > 1 else "EMPTY"
-                self.add(f"{ind}IF_IS_ANCESTOR {obj} {child}")
+                obj = self.format_obj(cond.args[0]) if len(cond.args) > 0 else EMPTY
+                child = self.format_obj(cond.args[1]) if len(cond.args) > 1 else EMPTY
+                self.add(ind, "IF_IS_ANCESTOR", obj, child)
                 return
                 
             if func_name == "IsDescendantOf":
-                child = self.format_obj(cond.args[0]) if len(cond.args) > 0 else "EMPTY"
-                ancestor = self.format_obj(cond.args[1]) if len(cond.args) > 1 else "EMPTY"
-                self.add(f"{ind}IF_IS_DESCENDANT {child} {ancestor}")
+                child = self.format_obj(cond.args[0]) if len(cond.args) > 0 else EMPTY
+                ancestor = self.format_obj(cond.args[1]) if len(cond.args) > 1 else EMPTY
+                self.add(ind, "IF_IS_DESCENDANT", child, ancestor)
                 return
 
             if func_name == "keyDown":
-                key = self.format_val(cond.args[0]) if cond.args else '""'
-                self.add(f"{ind}IF_KEY_DOWN {key}")
+                key = self.format_val(cond.args[0]) if cond.args else string("")
+                self.add(ind, "IF_KEY_DOWN", key)
                 return
             if func_name == "leftMouseDown":
-                self.add(f"{ind}IF_MOUSE_LEFT")
+                self.add(ind, "IF_MOUSE_LEFT")
                 return
             if func_name == "rightMouseDown":
-                self.add(f"{ind}IF_MOUSE_RIGHT")
+                self.add(ind, "IF_MOUSE_RIGHT")
                 return
             if func_name == "middleMouseDown":
-                self.add(f"{ind}IF_MOUSE_MIDDLE")
+                self.add(ind, "IF_MOUSE_MIDDLE")
                 return
         if isinstance(cond, BinaryExpr):
             if cond.op in ("==", "~=") and getattr(cond.right, "name", None) == "nil":
                 op = "IF_NOT_EXISTS" if cond.op == "==" else "IF_EXISTS"
                 var_name = self.format_var_name(cond.left)
-                self.add(f"{ind}{op} {var_name}")
+                self.add(ind, op, var_name)
                 return
                 
             op_map = {
@@ -649,20 +680,20 @@ class IREmitter:
             }
             if cond.op in op_map:
                 left, right = self.format_val(cond.left), self.format_val(cond.right)
-                self.add(f"{ind}{op_map[cond.op]} {left} {right}")
+                self.add(ind, op_map[cond.op], left, right)
             elif cond.op in ("and", "or", "nor", "xor"):
                 op_name = f"IF_{cond.op.upper()}"
                 left = cond.left.name if isinstance(cond.left, VarRef) else "temp"
                 right = cond.right.name if isinstance(cond.right, VarRef) else "temp"
-                self.add(f'{ind}{op_name} "{left}" "{right}"')
+                self.add(ind, op_name, string(left), string(right))
         else:
-            self.add(f"{ind}IF_NEQ {self.format_val(cond)} EMPTY")
+            self.add(ind, "IF_NEQ", self.format_val(cond), EMPTY)
 
     def emit_repeat(self, stmt, ind):
-        if stmt.count: self.add(f"{ind}REPEAT {self.format_val(stmt.count)}")
-        else: self.add(f"{ind}REPEAT_FOREVER")
+        if stmt.count: self.add(ind, "REPEAT", self.format_val(stmt.count))
+        else: self.add(ind, "REPEAT_FOREVER")
         self.emit_block(stmt.body, ind + "    ")
-        self.add(f"{ind}END_REPEAT")
+        self.add(ind, "END_REPEAT")
 
     def emit_for(self, stmt, ind):
         key_var = stmt.vars[0] if len(stmt.vars) > 1 else None
@@ -670,18 +701,17 @@ class IREmitter:
         
         if isinstance(stmt.iterator, VarRef):
             tbl_var = self.format_var_name(stmt.iterator)
-            self.add(f'{ind}TABLE_ITER {tbl_var}')
+            self.add(ind, "TABLE_ITER", tbl_var)
         else:
-            self.add(f'{ind}TABLE_ITER "temp"')
+            self.add(ind, "TABLE_ITER", string("temp"))
         
-        start = len(self.lines)
+        start = len(self.instrs)
         self.emit_block(stmt.body, ind + "    ")
         
-        for i in range(start, len(self.lines)):
-            if key_var:
-                self.lines[i] = self.lines[i].replace(f'{{{key_var}}}', '{l!index}')
-                self.lines[i] = self.lines[i].replace(f'{{l!{key_var}}}', '{l!index}')
-            self.lines[i] = self.lines[i].replace(f'{{{val_var}}}', '{l!value}')
-            self.lines[i] = self.lines[i].replace(f'{{l!{val_var}}}', '{l!value}')
+        renames = [(f'{{{val_var}}}', '{l!value}'), (f'{{l!{val_var}}}', '{l!value}')]
+        if key_var:
+            renames = [(f'{{{key_var}}}', '{l!index}'), (f'{{l!{key_var}}}', '{l!index}')] + renames
+        for instr in self.instrs[start:]:
+            instr.args = [self.rename_operand(arg, renames) for arg in instr.args]
         
-        self.add(f"{ind}END_ITER")
\ No newline at end of file
+        self.add(ind, "END_ITER")
\ No newline at end of file
@@ -1,6 +1,9 @@
 import re
+from sys import intern
 
 class Token:
+    __slots__ = ("type", "value", "line", "column")
+
     def __init__(self, type, value, line, column):
         self.type = type
         self.value = value
@@ -19,54 +22,71 @@ KEYWORDS = {
 TOKEN_SPEC = [
     ("ANNOTATION", r"--[@#]\s*[^\n]*"),
     ("COMMENT", r"--.*"),
-    ("NUMBER", r"\d+(\.\d+)?"),
+    ("NUMBER", r"\d+(?:\.\d+)?"),
     ("INTERP_STR", r"`[^`]*`"),
     ("STRING", r'"[^"]*"|\'[^\']*\''),
     ("IDENT", r"(?:[glo]!)?[a-zA-Z_]\w*"),
-    ("OP", r"==|~=|>=|<=|\+=|-=|\*=|/=|\^=|%=|[\+\-\*/\^%=<>#]|(\.\.)"), 
+    ("OP", r"==|~=|>=|<=|\+=|-=|\*=|/=|\^=|%=|[\+\-\*/\^%=<>#]|\.\."),
     ("PUNC", r"[\(\)\[\]\{\}\.,:]"),
-    ("WS", r"[ \t]+"),
-    ("NEWLINE", r"\n"),
-    ("MISMATCH", r"."),
+    ("NEWLINE", r"\n(?:[ \t]*\n)*"), # blank lines collapse into one match
+    ("WS", r"[ \t]+"), # only reached for trailing whitespace, the prefix below eats the rest
+    ("MISMATCH", r"[^ \t\n]"),
 ]
 
+# compiled once at import. leading blanks are swallowed by the prefix so whitespace
+# never costs a match of its own, the token's column is where its group starts.
+# none of the patterns above have capturing groups of their own, so a match's
+# lastindex is the index of its kind
+TOKEN_RE = re.compile("[ \\t]*(?:" + "|".join(f"(?P<{name}>{pattern})" for name, pattern in TOKEN_SPEC) + ")")
+KINDS = (None,) + tuple(name for name, _ in TOKEN_SPEC)
+
+IDENT, NEWLINE, WS = KINDS.index("IDENT"), KINDS.index("NEWLINE"), KINDS.index("WS")
+QUOTED = {KINDS.index("STRING"), KINDS.index("INTERP_STR")}
+OP = KINDS.index("OP")
+COMMENT, MISMATCH = KINDS.index("COMMENT"), KINDS.index("MISMATCH")
+
 class LexerError(Exception):
     pass
 
 class Lexer:
-    def __init__(self, code):
+    def __init__(self, code, line=1):
         self.code = code
         self.tokens = []
-        self.regex = "|".join(f"(?P<{pair[0]}>{pair[1]})" for pair in TOKEN_SPEC)
-        self.line = 1
+        self.line = line
         self.line_start = 0
 
-    def tokenize(self):
-        for mo in re.finditer(self.regex, self.code):
-            kind = mo.lastgroup
-            value = mo.group(kind) if kind else mo.group(0)
-            column = mo.start() - self.line_start
+    def iter_tokens(self):
+        """yields tokens as they're matched, ending with EOF. the parser pulls from this lazily"""
+        keywords = KEYWORDS
+        kinds = KINDS
+        line = self.line
+        line_start = self.line_start
 
-            if kind == "NEWLINE":
-                self.line += 1
-                self.line_start = mo.end()
-                continue
-            elif kind == "WS":
-                continue
-            elif kind == "COMMENT":
-                value = value[2:].strip()
-                self.tokens.append(Token(kind, value, self.line, column))
-                continue
-            elif kind == "MISMATCH":
-                raise LexerError(f"unexpected char {value!r} at line {self.line}, col {column}")
-            elif kind == "IDENT" and value in KEYWORDS:
-                kind = "KEYWORD"
-            elif kind == "STRING":
-                value = value[1:-1]
-            elif kind == "INTERP_STR":
-                value = value[1:-1]
+        for mo in TOKEN_RE.finditer(self.code):
+            i = mo.lastindex
 
-            self.tokens.append(Token(kind, value, self.line, column))
-            
-        self.tokens.append(Token("EOF", "", self.line, len(self.code) - self.line_start))
-        return self.tokens
\ No newline at end of file
+            if i == IDENT:
+                # names end up in lots of nodes and dict keys, interning makes them one object each
+                value = intern(mo[i])
+                yield Token("KEYWORD" if value in keywords else "IDENT", value, line, mo.start(i) - line_start)
+            elif i == NEWLINE:
+                line += mo[i].count("\n")
+                line_start = mo.end()
+            elif i in QUOTED:
+                yield Token(kinds[i], mo[i][1:-1], line, mo.start(i) - line_start)
+            elif i == COMMENT:
+                yield Token("COMMENT", mo[i][2:].strip(), line, mo.start(i) - line_start)
+            elif i == MISMATCH:
+                raise LexerError(f"unexpected char {mo[i]!r} at line {line}, col {mo.start(i) - line_start}")
+            elif i == OP:
+                yield Token("OP", intern(mo[i]), line, mo.start(i) - line_start)
+            elif i != WS:
+                yield Token(kinds[i], mo[i], line, mo.start(i) - line_start)
+
+        self.line = line
+        self.line_start = line_start
+        yield Token("EOF", "", line, len(self.code) - line_start)
+
+    def tokenize(self):
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
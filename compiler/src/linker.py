@@ -0,0 +1,335 @@
+import os
+import sys
+import pickle
+import hashlib
+from contextlib import nullcontext
+from lexer import Lexer, LexerError
+from parser import Parser, ParseError
+from incremental import IncrementalDocument
+
+COMPILER_VERSION = "1.0.1"
+
+def user_cache_dir():
+    # the cache gets unpickled, so it lives in the user's cache folder and never inside a
+    # project, where a cloned repo could ship a crafted one. CATLUA_CACHE_DIR overrides it
+    if os.environ.get("CATLUA_CACHE_DIR"):
+        return os.environ["CATLUA_CACHE_DIR"]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(r"~\AppData\Local")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "catlua", "ast")
+
+def frontend_fingerprint():
+    # cached ASTs are only valid for the lexer/parser/node classes that produced them,
+    # so hash their source in with the version instead of trusting a manual bump
+    h = hashlib.sha256(COMPILER_VERSION.encode())
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in ("lexer.py", "parser.py", "ast_nodes.py"):
+        with open(os.path.join(src_dir, name), 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def parse_source(code):
+    parser = Parser(Lexer(code).iter_tokens())
+    ast = parser.parse()
+    return ast, parser.errors
+
+def parse_worker(code):
+    # runs in a pool process. hands back the pickled tree so the parent can memoize
+    # the exact bytes without pickling it a second time
+    ast, errors = parse_source(code)
+    return pickle.dumps(ast, pickle.HIGHEST_PROTOCOL), errors
+
+class LinkError(Exception):
+    def __init__(self, path, msg, syntax=True):
+        self.path = path
+        self.msg = msg
+        self.syntax = syntax
+        super().__init__(msg)
+
+class Linker:
+    """
+    recursive multi-file linker. keeps every parsed file in memory (pickled, so each
+    build gets a fresh copy to mutate) and only re-lexes/re-parses when the source changes.
+    with disk_cache on, parsed files are also stored in cache_dir (the user's cache folder
+    by default), keyed by a hash of the file contents and the compiler version
+    """
+    def __init__(self, disk_cache=False, cache_dir=None):
+        self.disk_cache = disk_cache
+        self.cache_dir = (cache_dir or user_cache_dir()) if disk_cache else None
+        self.fingerprint = frontend_fingerprint() if disk_cache else None
+        self.memo = {} # abs path -> (source, pickled ScriptNode)
+        self.documents = {} # abs path -> IncrementalDocument for files open in an editor
+        self.errors = [] # (path, msg) for recovered parse errors of the last link
+        self.prefetched = {} # abs path -> (ast, errors) or the syntax error, filled by prefetch()
+        self.prefetched_from = {} # abs path -> "cache" or "worker", how prefetch() got it
+        self.last_source = None # where load() got its tree: "editor", "cache", "worker" or "parsed"
+        self.graph = {} # abs path -> abs paths it requires, as of the last time it was linked
+        self.timer = None # a timing.PassTimer while --time-passes is timing a link
+        self.pool = None # the -j worker processes, started by the first parallel link and kept until close()
+        self.pool_size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """stops the -j workers. the linker stays usable, the next parallel link starts new ones"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def open_document(self, filepath, code):
+        self.documents[os.path.abspath(filepath)] = IncrementalDocument(code)
+
+    def edit_document(self, filepath, start, end, text):
+        self.documents[os.path.abspath(filepath)].apply_edit(start, end, text)
+
+    def close_document(self, filepath):
+        self.documents.pop(os.path.abspath(filepath), None)
+
+    def load(self, filepath, code=None):
+        abs_path = os.path.abspath(filepath)
+        if code is not None:
+            code = code.replace("\r\n", "\n")
+
+        doc = self.documents.get(abs_path)
+        if doc is not None:
+            if code is not None and code != doc.text:
+                doc.reset(code) # editor and server got out of sync, start over
+            if doc.failure:
+                raise doc.failure
+            # the passes mutate the tree, hand out a copy and keep the document's own pristine
+            self.last_source = "editor"
+            return pickle.loads(pickle.dumps(doc.ast, pickle.HIGHEST_PROTOCOL)), list(doc.errors)
+
+        if abs_path in self.prefetched:
+            result = self.prefetched.pop(abs_path)
+            if isinstance(result, Exception):
+                raise result
+            self.last_source = self.prefetched_from.get(abs_path, "worker")
+            return result
+
+        # only files read from disk go to the disk cache, editor buffers change every keystroke
+        from_disk = code is None
+        if from_disk:
+            code = self.read_source(filepath)
+
+        ast = self.lookup(abs_path, code, from_disk)
+        if ast is not None:
+            self.last_source = "cache"
+            return ast, []
+
+        self.last_source = "parsed"
+        ast, errors = parse_source(code)
+        # files with syntax errors are never cached so their errors get reported every time
+        if not errors:
+            self.store(abs_path, code, pickle.dumps(ast, pickle.HIGHEST_PROTOCOL), from_disk)
+        return ast, errors
+
+    def read_source(self, filepath):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def lookup(self, abs_path, code, from_disk=True):
+        cached = self.memo.get(abs_path)
+        if cached and cached[0] == code:
+            return pickle.loads(cached[1])
+
+        cache_file = self.cache_path(code) if from_disk else None
+        ast, blob = self.read_cache(cache_file)
+        if ast is not None:
+            self.memo[abs_path] = (code, blob)
+        return ast
+
+    def store(self, abs_path, code, blob, from_disk=True):
+        self.memo[abs_path] = (code, blob)
+        if from_disk:
+            self.write_cache(self.cache_path(code), blob)
+
+    def cache_path(self, code):
+        if not self.cache_dir:
+            return None
+        key = hashlib.sha256(self.fingerprint.encode() + code.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.ast")
+
+    def read_cache(self, cache_file):
+        if not cache_file:
+            return None, None
+        try:
+            with open(cache_file, 'rb') as f:
+                blob = f.read()
+            return pickle.loads(blob), blob
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None, None # missing or truncated, just reparse
+
+    def write_cache(self, cache_file, blob):
+        if not cache_file:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_file, cache_file)
+        except OSError:
+            pass # a read-only checkout just means no cache
+
+    def invalidate(self, filepath):
+        self.memo.pop(os.path.abspath(filepath), None)
+
+    def dependencies(self, filepath):
+        """every file an entry pulls in (itself included) according to the last link"""
+        found = set()
+        stack = [os.path.abspath(filepath)]
+        while stack:
+            path = stack.pop()
+            if path in found:
+                continue
+            found.add(path)
+            stack.extend(self.graph.get(path, []))
+        return found
+
+    def resolve(self, base_dir, req):
+        req_path = os.path.join(base_dir, req)
+        if not os.path.exists(req_path) and os.path.exists(req_path + ".catlua"):
+            req_path += ".catlua"
+        return req_path
+
+    def link(self, filepath, code=None, lenient=False, jobs=1):
+        """
+        lex, parse and link a file plus everything it requires (depth first).
+        lenient mode (linting) keeps going past recovered syntax errors and missing files.
+        with jobs > 1 the files are parsed in a process pool first, the depth first
+        merge afterwards is the same so the output order doesn't change
+        """
+        self.errors = []
+        if jobs > 1:
+            self.prefetch(filepath, code, jobs)
+        try:
+            return self._link(filepath, code, lenient, set())
+        finally:
+            self.prefetched.clear()
+            self.prefetched_from.clear()
+
+    def prefetch(self, filepath, code, jobs):
+        """
+        discover and parse the require graph in parallel. every file's requires get
+        submitted as soon as that file comes back from the pool, cache hits are
+        resolved in this process without a round trip
+        """
+        from concurrent.futures import wait, FIRST_COMPLETED
+        from concurrent.futures.process import BrokenProcessPool
+
+        seen = set()
+        pending = {}
+
+        try:
+            def schedule(path, source=None):
+                abs_path = os.path.abspath(path)
+                if abs_path in seen:
+                    return
+                seen.add(abs_path)
+
+                if abs_path in self.documents:
+                    return # open editor buffers are patched incrementally, load() handles them
+                from_disk = source is None
+                if from_disk:
+                    try:
+                        source = self.read_source(path)
+                    except OSError as e:
+                        self.prefetched[abs_path] = e # load() re-raises it, _link reports it
+                        return
+                else:
+                    source = source.replace("\r\n", "\n")
+
+                ast = self.lookup(abs_path, source, from_disk)
+                if ast is not None:
+                    done(path, ast, [], "cache")
+                else:
+                    pending[self.worker_pool(jobs).submit(parse_worker, source)] = (path, source, from_disk)
+
+            def done(path, ast, errors, source):
+                self.prefetched[os.path.abspath(path)] = (ast, errors)
+                self.prefetched_from[os.path.abspath(path)] = source
+                base_dir = os.path.dirname(os.path.abspath(path))
+                for shard in ast.shards:
+                    for req in shard.requires:
+                        req_path = self.resolve(base_dir, req)
+                        if os.path.exists(req_path):
+                            schedule(req_path)
+
+            schedule(filepath, code)
+            while pending:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, source, from_disk = pending.pop(future)
+                    try:
+                        blob, errors = future.result()
+                    except (LexerError, ParseError) as e:
+                        # re-raised by load() once the depth first walk gets here
+                        self.prefetched[os.path.abspath(path)] = e
+                        continue
+                    if not errors:
+                        self.store(os.path.abspath(path), source, blob, from_disk)
+                    done(path, pickle.loads(blob), errors, "worker")
+        except BrokenProcessPool:
+            self.close() # a worker died, don't hand the dead pool to the next link
+            raise
+
+    def worker_pool(self, jobs):
+        # forking the workers costs about as much as parsing a small site, so builds with
+        # several entries and --watch reuse one pool for every link instead of one each
+        if self.pool is not None and self.pool_size != jobs:
+            self.close()
+        if self.pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self.pool = ProcessPoolExecutor(max_workers=jobs)
+            self.pool_size = jobs
+        return self.pool
+
+    def _link(self, filepath, code, lenient, parsed_files):
+        abs_path = os.path.abspath(filepath)
+        if abs_path in parsed_files:
+            return []
+        parsed_files.add(abs_path)
+
+        timed = self.timer.file(abs_path) if self.timer else nullcontext({})
+        try:
+            with timed as entry:
+                ast, errors = self.load(filepath, code)
+                entry["source"] = self.last_source
+        except (LexerError, ParseError) as e:
+            raise LinkError(filepath, str(e))
+        except OSError as e:
+            # missing entry, or a file deleted/renamed between the exists() check and here
+            raise LinkError(filepath, f"cannot read '{filepath}': {e.strerror or e}", syntax=False)
+
+        if errors:
+            self.errors.extend((filepath, err) for err in errors)
+            if not lenient:
+                raise LinkError(filepath, errors[0])
+
+        final_shards = []
+        base_dir = os.path.dirname(abs_path)
+        self.graph[abs_path] = [
+            os.path.abspath(self.resolve(base_dir, req)) for shard in ast.shards for req in shard.requires
+        ]
+
+        for shard in ast.shards:
+            final_shards.append(shard)
+            for req in shard.requires:
+                req_path = self.resolve(base_dir, req)
+
+                if not os.path.exists(req_path):
+                    if lenient: continue
+                    raise LinkError(filepath, f"linker: could not find required file '{req}'", syntax=False)
+
+                final_shards.extend(self._link(req_path, None, lenient, parsed_files))
+
+        return final_shards
@@ -2,18 +2,36 @@ import sys
 import os
 import json
 import re
-from lexer import Lexer, LexerError
-from parser import Parser, ParseError
+import time
+import hashlib
+import cProfile
+from contextlib import redirect_stdout
 from semantic import SemanticAnalyzer
 from ir_emitter import IREmitter
-from optimizer import Optimizer
+from cwir import serialize
+from optimizer import Optimizer, CommonSubexprs, LoopInvariants, DeadDefinitions
+from constfold import ConstantFolder
+from peephole import Peephole
+from actions import action_report, print_report
+from splitter import EventSplitter
+from timing import PassTimer, print_timings
+from desugar import Desugarer
+from linker import Linker, LinkError
 from ast_nodes import ScriptNode
 
+try:
+    import tomllib
+except ModuleNotFoundError:
+    try:
+        import tomli as tomllib
+    except ModuleNotFoundError:
+        tomllib = None
+
 # try to grab the JSON emitter
 try:
-    from emitter import emit
+    from emitter import emit_program, EmitError
 except (ImportError, ModuleNotFoundError):
-    emit = None
+    emit_program = None
     class EmitError(Exception):
         pass
 
@@ -26,169 +44,574 @@ class Colors:
     BOLD = '\033[1m'
     RESET = '\033[0m'
 
-def main():
-    if len(sys.argv) < 2:
-        print(f"{Colors.BOLD}usage:{Colors.RESET} python main.py <file.catlua> [-o output.json] [--ir] [-O0|-O1|-O2]")
+def make_diagnostic(msg, fallback_line=1, severity="error"):
+    msg_str = str(msg)
+    extracted_line = fallback_line
+
+    match = re.search(r"line\s*(\d+)", msg_str, re.IGNORECASE)
+    if match:
+        extracted_line = int(match.group(1))
+
+    clean_msg = re.sub(r"^(Error|Warning|Parse Error|Lexer Error).*?line\s*\d+\)?:\s*", "", msg_str, flags=re.IGNORECASE).strip()
+
+    return {
+        "line": extracted_line,
+        "msg": clean_msg,
+        "severity": severity
+    }
+
+def get_flag_value(args, flag, default=None):
+    # supports both "-j 4" and "-j4"
+    for i, arg in enumerate(args):
+        if arg == flag and i + 1 < len(args):
+            return args[i + 1]
+        if not flag.startswith("--") and arg.startswith(flag) and len(arg) > len(flag):
+            return arg[len(flag):]
+    return default
+
+def get_jobs(args):
+    value = get_flag_value(args, "-j", "1")
+    if not value.isdigit() or int(value) < 1:
+        print(f"{Colors.RED}[ERROR] -j takes a number of worker processes (1 or more), got {value!r}{Colors.RESET}")
         sys.exit(1)
+    return int(value)
 
-    filename = sys.argv[1]
-    
-    with open(filename, 'r', encoding='utf-8') as f:
-        code = f.read()
-
-    # linter setup
-    is_linting = "--lint" in sys.argv
-    lint_diagnostics = []
-
-    def add_diagnostic(msg, fallback_line=1, severity="error"):
-        msg_str = str(msg)
-        extracted_line = fallback_line
-        
-        match = re.search(r"line\s*(\d+)", msg_str, re.IGNORECASE)
-        if match:
-            extracted_line = int(match.group(1))
-            
-        clean_msg = re.sub(r"^(Error|Warning|Parse Error|Lexer Error).*?line\s*\d+\)?:\s*", "", msg_str, flags=re.IGNORECASE).strip()
-        
-        lint_diagnostics.append({
-            "line": extracted_line,
-            "msg": clean_msg,
-            "severity": severity
-        })
-
-    # recursive multi-file linker
-    def compile_file(filepath, parsed_files=None):
-        if parsed_files is None:
-            parsed_files = set()
-            
-        abs_path = os.path.abspath(filepath)
-        if abs_path in parsed_files:
-            return []
-        parsed_files.add(abs_path)
-        
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                file_code = f.read()
-                
-            lexer = Lexer(file_code)
-            tokens = lexer.tokenize()
-            
-            parser = Parser(tokens)
-            ast = parser.parse()
-            
-            if parser.errors:
-                for err in parser.errors:
-                    if is_linting:
-                        add_diagnostic(err, 1)
-                    else:
-                        print(f"{Colors.RED}[ERROR] syntax in {os.path.basename(filepath)}: {err}{Colors.RESET}")
-                
-                if not is_linting:
-                    sys.exit(1)
-                
-        except (LexerError, ParseError) as e:
-            if is_linting:
-                add_diagnostic(str(e), 1)
-                print(json.dumps(lint_diagnostics))
-                sys.exit(0)
-            else:
-                print(f"{Colors.RED}[ERROR] syntax in {os.path.basename(filepath)}: {e}{Colors.RESET}")
-                sys.exit(1)
-                
-        final_shards = []
-        base_dir = os.path.dirname(abs_path)
-        
-        for shard in ast.shards:
-            final_shards.append(shard)
-            for req in shard.requires:
-                req_path = os.path.join(base_dir, req)
-                if not os.path.exists(req_path) and os.path.exists(req_path + ".catlua"):
-                    req_path += ".catlua"
-                    
-                if not os.path.exists(req_path):
-                    if is_linting: continue
-                    print(f"{Colors.RED}[ERROR] linker: could not find required file '{req}'{Colors.RESET}")
-                    sys.exit(1)
-                    
-                final_shards.extend(compile_file(req_path, parsed_files))
-                
-        return final_shards
+def get_opt_level(args):
+    opt_level = 1 # default: constant folding
+    if "-O0" in args: opt_level = 0
+    if "-O2" in args: opt_level = 2
+    if "-O3" in args: opt_level = 3
+    return opt_level
+
+def analyze(linker, filename, code=None, opt_level=1, lenient=False, colors=None, jobs=1, optimize=True, timer=None):
+    timer = timer or PassTimer()
 
     # lex, parse and link
-    all_shards = compile_file(filename)
+    linker.timer = timer if timer.enabled else None
+    try:
+        with timer.stage("link (lex + parse)"):
+            all_shards = linker.link(filename, code, lenient, jobs)
+    finally:
+        linker.timer = None
     ast = ScriptNode(1, all_shards)
 
     # desugaring pass
-    from desugar import Desugarer
-    ast = Desugarer(ast).process()
-
-    # optimization pass
-    opt_level = 1 # default: constant folding
-    if "-O0" in sys.argv: opt_level = 0
-    if "-O2" in sys.argv: opt_level = 2
+    with timer.stage("desugar"):
+        ast = Desugarer(ast).process()
 
     # analysis
-    analyzer = SemanticAnalyzer(ast, opt_level=opt_level)
-    errors, warnings = analyzer.analyze()
+    with timer.stage("semantic"):
+        analyzer = SemanticAnalyzer(ast, opt_level=opt_level)
+        analyzer.analyze()
+
+    if not optimize:
+        return ast, analyzer
 
-    # DCE
+    # constant propagation
+    if opt_level >= 1:
+        with timer.stage("constant propagation"):
+            ConstantFolder(ast).optimize(colors)
+
+    # LICM, CSE, then DCE, then whatever the whole program never uses
     if opt_level >= 2:
-        opt = Optimizer(ast)
-        # only pass Colors if we aren't linting (keeps stdout clean for VS Code)
-        opt.optimize(Colors if not is_linting else None)
-    
-    # linter json output
-    if is_linting:
-        for w in warnings: add_diagnostic(w, 1, "warning")
-        for e in errors: add_diagnostic(e, 1, "error")
-        print(json.dumps(lint_diagnostics))
-        sys.exit(0)
-    
+        with timer.stage("licm"):
+            LoopInvariants(ast, analyzer.funcs).optimize(colors)
+        with timer.stage("cse"):
+            CommonSubexprs(ast, analyzer.funcs).optimize(colors)
+        with timer.stage("dce"):
+            opt = Optimizer(ast)
+            opt.optimize(colors)
+        with timer.stage("dead definitions"):
+            DeadDefinitions(ast).optimize(colors)
+
+    return ast, analyzer
+
+def emit_ir(ast, analyzer, colors=None, split_events=False, timer=None):
+    """ast -> list of cwir.Instr, with the CWIR passes for the analyzer's -O level"""
+    timer = timer or PassTimer()
+    with timer.stage("ir emit"):
+        program = IREmitter(ast, analyzer).emit(colors)
+    if analyzer.opt_level >= 2:
+        with timer.stage("peephole"):
+            program = Peephole(program, analyzer.opt_level).optimize(colors)
+    if split_events:
+        with timer.stage("split events"):
+            program = EventSplitter(program).split(colors)
+    return program
+
+def lint(linker, filename, code=None, opt_level=1):
+    try:
+        ast, analyzer = analyze(linker, filename, code, opt_level, lenient=True, optimize=False)
+    except LinkError as e:
+        diagnostics = [make_diagnostic(err, 1) for _, err in linker.errors]
+        diagnostics.append(make_diagnostic(e.msg, 1))
+        return diagnostics
+
+    diagnostics = [make_diagnostic(err, 1) for _, err in linker.errors]
+    for w in analyzer.warnings: diagnostics.append(make_diagnostic(w, 1, "warning"))
+    for e in analyzer.errors: diagnostics.append(make_diagnostic(e, 1, "error"))
+    return diagnostics
+
+def serve():
+    """
+    long-running compile server for editors. reads one JSON request per line on stdin
+    and answers with one JSON line on stdout, reusing the warm linker between requests:
+
+        {"id": 1, "cmd": "lint", "file": "main.catlua", "text": "..."}
+        {"id": 2, "cmd": "compile", "file": "main.catlua", "output": "main.json", "opt": 2, "report": true}
+        {"id": 3, "cmd": "shutdown"}
+
+    editors can also keep a file open and stream edits, so only the edited event/function
+    gets re-lexed and re-parsed (ranges are 0-based [line, column] like LSP):
+
+        {"id": 4, "cmd": "open", "file": "main.catlua", "text": "..."}
+        {"id": 5, "cmd": "edit", "file": "main.catlua", "edits": [{"start": [3, 4], "end": [3, 9], "text": "10"}]}
+        {"id": 6, "cmd": "close", "file": "main.catlua"}
+    """
+    linker = Linker(disk_cache=True)
+    out = sys.stdout
+
+    for raw in sys.stdin:
+        if not raw.strip():
+            continue
+        req_id = None
+        try:
+            request = json.loads(raw)
+            req_id = request.get("id")
+            cmd = request.get("cmd")
+
+            # passes like the optimizer print progress, keep that off the protocol stream
+            with redirect_stdout(sys.stderr):
+                if cmd == "lint":
+                    diagnostics = lint(linker, request["file"], request.get("text"), request.get("opt", 1))
+                    response = {"id": req_id, "diagnostics": diagnostics}
+                elif cmd == "compile":
+                    response = {"id": req_id, **serve_compile(linker, request)}
+                elif cmd == "open":
+                    linker.open_document(request["file"], request["text"])
+                    response = {"id": req_id, "ok": True}
+                elif cmd == "edit":
+                    for edit in request["edits"]:
+                        linker.edit_document(request["file"], edit["start"], edit["end"], edit["text"])
+                    # the memo still holds the tree of the last lint's text, which is stale now
+                    linker.invalidate(request["file"])
+                    response = {"id": req_id, "ok": True}
+                elif cmd == "close":
+                    linker.close_document(request["file"])
+                    # unsaved edits may be thrown away, the next build reads the file again
+                    linker.invalidate(request["file"])
+                    response = {"id": req_id, "ok": True}
+                elif cmd == "shutdown":
+                    out.write(json.dumps({"id": req_id, "ok": True}) + "\n")
+                    out.flush()
+                    return
+                else:
+                    response = {"id": req_id, "error": f"unknown command {cmd!r}"}
+        except Exception as e:
+            response = {"id": req_id, "error": str(e)}
+
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+
+def serve_compile(linker, request):
+    filename = request["file"]
+    out_file = request.get("output") or f"{os.path.splitext(filename)[0]}.json"
+
+    try:
+        ast, analyzer = analyze(linker, filename, request.get("text"), request.get("opt", 1))
+    except LinkError as e:
+        return {"ok": False, "errors": [e.msg], "warnings": []}
+
+    if analyzer.errors:
+        return {"ok": False, "errors": analyzer.errors, "warnings": analyzer.warnings}
+
+    program = emit_ir(ast, analyzer, split_events=request.get("split", False))
+    if not emit_program:
+        return {"ok": False, "errors": ["emitter.py not found"], "warnings": analyzer.warnings}
+
+    try:
+        written = write_json(program, out_file, request.get("compact", False), request.get("seed"), request.get("force", False))
+    except EmitError as e:
+        return {"ok": False, "errors": [f"json emitter error: {e}"], "warnings": analyzer.warnings}
+
+    response = {"ok": True, "output": out_file, "unchanged": not written, "warnings": analyzer.warnings}
+    if request.get("report"):
+        response["actions"] = action_report(program, filename, request.get("opt", 1))
+    return response
+
+class HashingWriter:
+    # passes writes through to a text file and hashes them on the way
+    def __init__(self, f):
+        self.f = f
+        self.sha = hashlib.sha256()
+
+    def write(self, text):
+        self.sha.update(text.encode('utf-8'))
+        return self.f.write(text)
+
+def file_digest(path):
+    """sha256 of a text file, read back the same way HashingWriter saw it when it was written"""
+    sha = hashlib.sha256()
+    with open(path, 'r', encoding='utf-8') as f:
+        for chunk in iter(lambda: f.read(1 << 16), ""):
+            sha.update(chunk.encode('utf-8'))
+    return sha.hexdigest()
+
+def write_json(program, out_file, compact=False, seed=None, force=False):
+    """
+    streams the json into a temp file next to out_file and only moves it into place once it's
+    complete, so a failed emit never leaves a truncated output behind. the content hash goes to
+    <out_file>.sha256, and when it matches the last build's the old file is kept untouched
+    (its mtime too) unless force is set or the old file no longer matches its hash (edited by
+    hand, truncated). returns False if nothing was written
+    """
+    tmp_file = f"{out_file}.tmp"
+    hash_file = f"{out_file}.sha256"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            writer = HashingWriter(f)
+            emit_program(program, writer, compact, seed)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+    digest = writer.sha.hexdigest()
+    if not force and os.path.exists(out_file) and os.path.exists(hash_file):
+        with open(hash_file, 'r', encoding='utf-8') as f:
+            same = f.read().strip() == digest
+        try:
+            same = same and file_digest(out_file) == digest
+        except (OSError, UnicodeDecodeError):
+            same = False
+        if same:
+            os.remove(tmp_file)
+            return False
+
+    os.replace(tmp_file, out_file)
+    with open(hash_file, 'w', encoding='utf-8') as f:
+        f.write(digest + "\n")
+    return True
+
+def compile_entry(linker, filename, out_file, opt_level=1, jobs=1, show_ir=False, report=False, split_events=False, compact=False, seed=None, force=False,
+                  time_passes=False, profile=False):
+    """runs the whole pipeline for one entry file and writes its json, returns False on failure"""
+    base = os.path.splitext(out_file)[0]
+    if profile:
+        profiler = cProfile.Profile()
+        ok = profiler.runcall(compile_entry, linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes)
+        profiler.dump_stats(f"{base}.prof")
+        print(f"{Colors.BLUE}profile -> {base}.prof (python -m pstats {base}.prof){Colors.RESET}")
+        return ok
+
+    timer = PassTimer(time_passes)
+    try:
+        ok = run_entry(linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, timer)
+    finally:
+        timer.stop()
+
+    if time_passes:
+        timings = timer.report(filename, opt_level)
+        print_timings(timings, Colors)
+        with open(f"{base}.passes.json", 'w', encoding='utf-8') as f:
+            json.dump(timings, f, indent=2)
+        print(f"{Colors.BLUE}pass timings -> {base}.passes.json{Colors.RESET}")
+    return ok
+
+def run_entry(linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, timer):
+    try:
+        ast, analyzer = analyze(linker, filename, opt_level=opt_level, colors=Colors, jobs=jobs, timer=timer)
+    except LinkError as e:
+        if e.syntax:
+            errors = linker.errors or [(e.path, e.msg)]
+            for path, err in errors:
+                print(f"{Colors.RED}[ERROR] syntax in {os.path.basename(path)}: {err}{Colors.RESET}")
+        else:
+            print(f"{Colors.RED}[ERROR] {e.msg}{Colors.RESET}")
+        return False
+
+    errors, warnings = analyzer.errors, analyzer.warnings
+
     # pretty printing
     if warnings:
         print(f"\n{Colors.BOLD}{Colors.YELLOW}=== WARNINGS ==={Colors.RESET}")
         for w in warnings: print(f"{Colors.YELLOW}⚠ {w}{Colors.RESET}")
-        
+
     if errors:
         print(f"\n{Colors.BOLD}{Colors.RED}=== COMPILATION FAILED ==={Colors.RESET}")
         for e in errors: print(f"{Colors.RED}✖ {e}{Colors.RESET}")
-        sys.exit(1)
-        
+        return False
+
     print(f"{Colors.BOLD}{Colors.GREEN}analysis passed{Colors.RESET}")
 
     # ir emitter
-    ir_gen = IREmitter(ast, analyzer)
-    cwir_output = ir_gen.emit()
-    
-    if "--ir" in sys.argv:
+    program = emit_ir(ast, analyzer, Colors, split_events, timer)
+
+    if show_ir:
         print(f"\n{Colors.BOLD}{Colors.BLUE}=== CWIR ==={Colors.RESET}")
-        print(cwir_output)
+        print(serialize(program))
+
+    if report:
+        # next to the output, so CI can diff it against the last build's
+        actions = action_report(program, filename, opt_level)
+        print_report(actions, Colors)
+        report_file = f"{os.path.splitext(out_file)[0]}.actions.json"
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(actions, f, indent=2)
+        print(f"{Colors.BLUE}action report -> {report_file}{Colors.RESET}")
 
     # json export
-    out_file = None
-    if "-o" in sys.argv:
-        idx = sys.argv.index("-o")
-        if idx + 1 < len(sys.argv):
-            out_file = sys.argv[idx + 1]
-            
-    if not out_file:
-        base = os.path.splitext(filename)[0]
-        out_file = f"{base}.json"
-
-    if emit:
+    if emit_program:
         try:
-            final_json = emit(cwir_output)
-            with open(out_file, 'w', encoding='utf-8') as f:
-                f.write(final_json)
-            print(f"\n{Colors.BOLD}{Colors.GREEN}compiled {filename} -> {out_file} successfully{Colors.RESET}")
+            with timer.stage("json"):
+                written = write_json(program, out_file, compact, seed, force)
+            if written:
+                print(f"\n{Colors.BOLD}{Colors.GREEN}compiled {filename} -> {out_file} successfully{Colors.RESET}")
+            else:
+                print(f"\n{Colors.BOLD}{Colors.GREEN}compiled {filename}, {out_file} unchanged{Colors.RESET}")
         except EmitError as e:
             print(f"\n{Colors.RED}json emitter error: {e}{Colors.RESET}")
-            sys.exit(1)
+            return False
     else:
         cwobj_file = out_file.replace(".json", ".cwobj")
         with open(cwobj_file, 'w', encoding='utf-8') as f:
-            f.write(cwir_output)
+            f.write(serialize(program))
         print(f"\n{Colors.YELLOW}[WARN] emitter.py not found. saved raw IR to {cwobj_file} instead.{Colors.RESET}")
 
+    return True
+
+def load_manifest(path):
+    """
+    reads a catlua.toml project file:
+
+        entries = ["pages/home.catlua", "pages/shop.catlua"]
+        out_dir = "build"   # optional, defaults to next to each entry
+        opt = 2             # optional
+        jobs = 4            # optional
+        seed = "my-site"    # optional, see --seed
+    """
+    if tomllib is None:
+        print(f"{Colors.RED}[ERROR] reading {path} needs python 3.11+ (or `pip install tomli`){Colors.RESET}")
+        sys.exit(1)
+
+    with open(path, 'rb') as f:
+        manifest = tomllib.load(f)
+
+    # toml has no schema, a wrong type would otherwise only blow up deep inside the build
+    def is_int(value):
+        return isinstance(value, int) and not isinstance(value, bool)
+    checks = {
+        "entries": (lambda v: isinstance(v, list) and all(isinstance(e, str) for e in v), "a list of paths"),
+        "out_dir": (lambda v: isinstance(v, str), "a path"),
+        "opt": (lambda v: is_int(v) and 0 <= v <= 3, "0, 1, 2 or 3"),
+        "jobs": (lambda v: is_int(v) and v >= 1, "a number of worker processes (1 or more)"),
+        "seed": (lambda v: isinstance(v, str) or is_int(v), "a string or an integer"),
+    }
+    for key, (valid, expected) in checks.items():
+        if key in manifest and not valid(manifest[key]):
+            print(f"{Colors.RED}[ERROR] {path}: {key} must be {expected}, got {manifest[key]!r}{Colors.RESET}")
+            sys.exit(1)
+
+    base_dir = os.path.dirname(os.path.abspath(path))
+    entries = [os.path.join(base_dir, entry) for entry in manifest.get("entries", [])]
+    if not entries:
+        print(f"{Colors.RED}[ERROR] {path} has no entries{Colors.RESET}")
+        sys.exit(1)
+
+    out_dir = manifest.get("out_dir")
+    if out_dir:
+        out_dir = os.path.join(base_dir, out_dir)
+    return entries, out_dir, base_dir, manifest
+
+def output_path(filename, out_dir=None, base_dir=None):
+    base = os.path.splitext(filename)[0]
+    if not out_dir:
+        return f"{base}.json"
+    # keep the folder layout under out_dir so pages/a/index and pages/b/index don't collide
+    rel = os.path.relpath(base, base_dir) if base_dir else os.path.basename(base)
+    return os.path.join(out_dir, f"{rel}.json")
+
+def inside(path, folder):
+    path, folder = os.path.abspath(path), os.path.abspath(folder)
+    try:
+        return os.path.commonpath([path, folder]) == folder
+    except ValueError:
+        return False # different drives on windows
+
+def build(linker, entries, out_dir=None, base_dir=None, opt_level=1, jobs=1, show_ir=False, report=False, split_events=False, compact=False, seed=None, force=False,
+          time_passes=False, profile=False):
+    """compiles every entry in one process, required files are only parsed once for all of them"""
+    results = []
+    build_start = time.perf_counter()
+
+    for filename in entries:
+        out_file = output_path(filename, out_dir, base_dir)
+        print(f"\n{Colors.BOLD}{Colors.CYAN}=== {filename} ==={Colors.RESET}")
+        # an entry outside base_dir ("../x", an absolute path) would mirror its way out of out_dir
+        if out_dir and not inside(out_file, out_dir):
+            print(f"{Colors.RED}[ERROR] {filename} is outside {base_dir}, its output would be written outside {out_dir}{Colors.RESET}")
+            results.append((filename, out_file, False, 0.0))
+            continue
+        if os.path.dirname(out_file):
+            os.makedirs(os.path.dirname(out_file), exist_ok=True)
+
+        start = time.perf_counter()
+        ok = compile_entry(linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes, profile)
+        results.append((filename, out_file, ok, time.perf_counter() - start))
+
+    total = time.perf_counter() - build_start
+    failed = [r for r in results if not r[2]]
+
+    print(f"\n{Colors.BOLD}=== BUILD SUMMARY ==={Colors.RESET}")
+    for filename, out_file, ok, elapsed in results:
+        status = f"{Colors.GREEN}ok  " if ok else f"{Colors.RED}FAIL"
+        target = f" -> {out_file}" if ok else ""
+        print(f"  {status}{Colors.RESET} {elapsed * 1000:8.1f} ms  {filename}{target}")
+    print(f"{len(results)} entries, {len(results) - len(failed)} ok, {len(failed)} failed in {total * 1000:.1f} ms")
+
+    return not failed
+
+def watch(linker, entries, rebuild, interval=0.5):
+    """
+    polls every file the entries pull in and rebuilds only the entries whose
+    (transitive) requires changed. unchanged files come out of the linker's memo
+    """
+    def snapshot(paths):
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                mtimes[path] = None # missing for now, picked up once it's created
+        return mtimes
+
+    def watched():
+        return set().union(*(linker.dependencies(entry) for entry in entries))
+
+    def safe_rebuild(targets):
+        # unreadable sources already come back as failed entries, this is for the rest
+        # (an output folder removed by a checkout, ...) so the session keeps going
+        try:
+            rebuild(targets)
+        except OSError as e:
+            print(f"{Colors.RED}[ERROR] {e}{Colors.RESET}")
+
+    safe_rebuild(entries)
+    mtimes = snapshot(watched())
+    print(f"\n{Colors.BOLD}{Colors.BLUE}watching {len(mtimes)} file(s), ctrl+c to stop{Colors.RESET}")
+
+    try:
+        while True:
+            time.sleep(interval)
+            current = snapshot(watched())
+            changed = {path for path, mtime in current.items() if mtimes.get(path) != mtime}
+            if not changed:
+                continue
+
+            for path in sorted(changed):
+                print(f"\n{Colors.CYAN}changed: {os.path.relpath(path)}{Colors.RESET}")
+            targets = [entry for entry in entries if linker.dependencies(entry) & changed]
+            if targets:
+                safe_rebuild(targets)
+
+            # requires may have been added or removed, so re-scan the graph. known files keep
+            # the mtime from before the rebuild, a save that landed while it ran is still a change
+            # on the next poll. only files the rebuild newly pulled in get a fresh one
+            paths = watched()
+            mtimes = {path: current[path] for path in paths if path in current}
+            mtimes.update(snapshot(paths - current.keys()))
+            print(f"\n{Colors.BOLD}{Colors.BLUE}watching {len(mtimes)} file(s), ctrl+c to stop{Colors.RESET}")
+    except KeyboardInterrupt:
+        print()
+
+VALUE_FLAGS = {"-o", "-j", "--out-dir", "--seed"}
+
+def positional_args(args):
+    files = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+            continue
+        if arg in VALUE_FLAGS:
+            skip = True
+            continue
+        if not arg.startswith("-"):
+            files.append(arg)
+    return files
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"{Colors.BOLD}usage:{Colors.RESET} python main.py <file.catlua> [-o output.json] [--ir] [-O0|-O1|-O2|-O3] [-j N] [--watch] [--report-actions] [--split-events] [--compact] [--seed S] [--force] [--time-passes] [--profile] [--lint [--stdin]] [--no-cache]")
+        print("       python main.py <a.catlua> <b.catlua> ... [--out-dir build]")
+        print("       python main.py build [catlua.toml]")
+        print("       python main.py --server")
+        sys.exit(1)
+
+    if sys.argv[1] == "--server":
+        serve()
+        return
+
+    opt_level = get_opt_level(sys.argv)
+    jobs = get_jobs(sys.argv)
+    use_cache = "--no-cache" not in sys.argv
+    show_ir = "--ir" in sys.argv
+    report = "--report-actions" in sys.argv
+    split_events = "--split-events" in sys.argv
+    compact = "--compact" in sys.argv
+    seed = get_flag_value(sys.argv, "--seed")
+    force = "--force" in sys.argv
+    time_passes = "--time-passes" in sys.argv
+    profile = "--profile" in sys.argv
+
+    # one linker for the whole session, so required files and the -j workers are shared
+    # by every entry and every --watch rebuild
+    with Linker(disk_cache=use_cache) as linker:
+        # project mode
+        if sys.argv[1] == "build":
+            files = positional_args(sys.argv[2:])
+            entries, out_dir, base_dir, manifest = load_manifest(files[0] if files else "catlua.toml")
+            if not any(flag in sys.argv for flag in ("-O0", "-O1", "-O2", "-O3")):
+                opt_level = manifest.get("opt", opt_level)
+            if get_flag_value(sys.argv, "-j") is None:
+                jobs = manifest.get("jobs", jobs)
+            if seed is None:
+                seed = manifest.get("seed")
+
+            rebuild = lambda targets: build(linker, targets, out_dir, base_dir, opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes, profile)
+            if "--watch" in sys.argv:
+                watch(linker, entries, rebuild)
+            elif not rebuild(entries):
+                sys.exit(1)
+            return
+
+        files = positional_args(sys.argv[1:])
+
+        if len(files) > 1:
+            out_dir = get_flag_value(sys.argv, "--out-dir")
+            rebuild = lambda targets: build(linker, targets, out_dir, os.getcwd(), opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes, profile)
+            if "--watch" in sys.argv:
+                watch(linker, files, rebuild)
+            elif not rebuild(files):
+                sys.exit(1)
+            return
+
+        filename = files[0] if files else sys.argv[1]
+
+        # linter json output
+        if "--lint" in sys.argv:
+            code = sys.stdin.read() if "--stdin" in sys.argv else None
+            print(json.dumps(lint(linker, filename, code, opt_level)))
+            sys.exit(0)
+
+        out_file = get_flag_value(sys.argv, "-o")
+        if not out_file:
+            out_file = output_path(filename, get_flag_value(sys.argv, "--out-dir"))
+
+        if "--watch" in sys.argv:
+            watch(linker, [filename], lambda targets: compile_entry(linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes, profile))
+        elif not compile_entry(linker, filename, out_file, opt_level, jobs, show_ir, report, split_events, compact, seed, force, time_passes, profile):
+            sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
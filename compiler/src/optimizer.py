@@ -1,91 +1,389 @@
+import re
 from ast_nodes import *
+from visitor import NodeVisitor, NodeTransformer, walk
 
-class Optimizer:
+def note(colors, level, msg):
+    # what every optimization pass prints, the prefix colored when the CLI hands over Colors
+    prefix = f"[optimizer (-O{level})]"
+    if colors:
+        prefix = f"{colors.CYAN}{prefix}{colors.RESET}"
+    print(f"{prefix} {msg}")
+
+class ReadCounter(NodeVisitor):
+    # how many times every variable name is read, string interpolation included
+    def __init__(self):
+        self.read_counts = {}
+
+    def count(self, name):
+        self.read_counts[name] = self.read_counts.get(name, 0) + 1
+
+    def visit_VarRef(self, node):
+        self.count(node.name)
+
+    def visit_StringLit(self, node):
+        for var_name in re.findall(r"\{(?:[lgo]!)?([a-zA-Z_]\w*)", str(node.value)):
+            self.count(var_name)
+
+    visit_InterpStringLit = visit_StringLit
+
+    def visit_AssignStmt(self, node):
+        # the targets are writes, only the value is read
+        self.visit(node.value)
+
+def has_function_call(node):
+    # recursively check if an expression has a function call inside it
+    if not isinstance(node, NODE_TYPES): return False
+    return any(isinstance(child, CallStmt) for child in walk(node))
+
+class Optimizer(NodeTransformer):
     def __init__(self, ast):
         self.ast = ast
         self.read_counts = {}
 
-    def count_reads(self, node):
-        if node is None: return
+    def visit_AssignStmt(self, node):
+        # DCE
+        if node.scope == "local":
+            target = node.targets[0]
+            if isinstance(target, VarRef):
+                reads = self.read_counts.get(target.name, 0)
+                # if it's never read, and the right side has no side-effects (like a function call)
+                if reads == 0 and not has_function_call(node.value):
+                    note(self.Colors, 2, f"eliminated dead variable '{target.name}' at line {node.line}")
+                    return None # it gets deleted
+        return self.generic_visit(node)
 
-        if type(node).__name__ == "VarRef":
-            name = node.name
-            self.read_counts[name] = self.read_counts.get(name, 0) + 1
+    def visit_list(self, items):
+        # if we return, anything after is dead code
+        for i, stmt in enumerate(items):
+            if isinstance(stmt, (ReturnStmt, BreakStmt)) and i + 1 < len(items):
+                kept = super().visit_list(items[:i + 1])
+                dropped = len(items) - (i + 1)
+                note(self.Colors, 2, f"eliminated {dropped} unreachable statement(s) after return statement at line {stmt.line}")
+                return kept
+        return super().visit_list(items)
 
-        if type(node).__name__ in ("StringLit", "InterpStringLit"):
-            import re
+    def optimize(self, colors_class=None):
+        self.Colors = colors_class
+        counter = ReadCounter()
+        counter.visit(self.ast)
+        self.read_counts = counter.read_counts
+        self.visit(self.ast)
 
-            matches = re.findall(r"\{(?:[lgo]!)?([a-zA-Z_]\w*)", str(node.value))
-            for var_name in matches:
-                self.read_counts[var_name] = self.read_counts.get(var_name, 0) + 1
+class DeadDefinitions(NodeTransformer):
+    """
+    -O2 whole-program DCE over every linked shard. functions no event reaches through
+    calls are dropped (a required library often brings far more than a page uses), and so
+    are plain writes to globals that nothing left in the program reads
+    """
+    def __init__(self, ast):
+        self.ast = ast
+        self.read_counts = {}
+        self.removed = 0
 
-        for key, value in vars(node).items():
+    def reads(self, nodes):
+        counter = ReadCounter()
+        for node in nodes:
+            counter.visit(node)
+        return counter.read_counts
 
-            if key == "targets" and type(node).__name__ == "AssignStmt": continue
+    def calls(self, nodes):
+        # every call site, plain, bg and protected alike. `util.greet(x)` is a PropRef so
+        # this has to go through call_name() rather than the VarRefs read
+        return {call_name(sub) for node in nodes for sub in walk(node) if isinstance(sub, CallStmt)}
 
-            if isinstance(value, list):
-                for item in value:
-                    if hasattr(item, '__dict__'): self.count_reads(item)
-            elif hasattr(value, '__dict__'):
-                self.count_reads(value)
+    def reachable(self):
+        defs = {}
+        for shard in self.ast.shards:
+            for func in shard.func_defs:
+                defs.setdefault(func.name, []).append(func)
+        live = set()
+        todo = [name for name in self.calls(ev for shard in self.ast.shards for ev in shard.events) if name in defs]
+        while todo:
+            name = todo.pop()
+            if name in live:
+                continue
+            live.add(name)
+            todo.extend(n for n in self.calls(defs[name]) if n in defs and n not in live)
+        return live
 
-    def has_function_call(self, node):
-        # recursively check if an expression has a function call inside it
-        if isinstance(node, CallStmt): return True
-        if hasattr(node, '__dict__'):
-            for key, value in vars(node).items():
-                if isinstance(value, list):
-                    if any(self.has_function_call(item) for item in value): return True
+    def drop_functions(self):
+        live = self.reachable()
+        for shard in self.ast.shards:
+            kept = []
+            for func in shard.func_defs:
+                if func.name in live:
+                    kept.append(func)
                 else:
-                    if self.has_function_call(value): return True
+                    note(self.Colors, 2, f"removed function '{func.name}' at line {func.line}, nothing calls it")
+            shard.func_defs = kept
+
+    def visit_AssignStmt(self, node):
+        target = node.targets[0] if len(node.targets) == 1 else None
+        if (isinstance(target, VarRef) and target.prefix == "g!" and not node.annotations
+                and self.read_counts.get(target.name, 0) == 0 and not has_function_call(node.value)):
+            note(self.Colors, 2, f"eliminated dead global '{target.name}' at line {node.line}")
+            self.removed += 1
+            return None
+        return node
+
+    def optimize(self, colors_class=None):
+        self.Colors = colors_class
+        self.drop_functions()
+        # a removed write can be the last read of another global, so go until nothing changes
+        while True:
+            self.removed = 0
+            self.read_counts = self.reads([self.ast])
+            self.visit(self.ast)
+            if not self.removed:
+                return
+
+# props that change on their own, two reads in a row can differ
+VOLATILE_PROPS = {"TimePosition", "IsPlaying", "IsPaused", "IsLoaded", "GetMousePosition()", "ViewportSize"}
+
+def expr_key(node):
+    """hashable shape of a side-effect free expression, None if it can't be reused"""
+    if isinstance(node, VarRef):
+        return ("var", node.prefix, node.name)
+    if isinstance(node, NumberLit):
+        return ("num", str(node.value))
+    if isinstance(node, StringLit):
+        return ("str", node.value)
+    if isinstance(node, BinaryExpr):
+        left, right = expr_key(node.left), expr_key(node.right)
+        if left is None or right is None: return None
+        return ("bin", node.op, left, right)
+    if isinstance(node, UnaryExpr) and node.op in ("-", "#"):
+        right = expr_key(node.right)
+        return None if right is None else ("unary", node.op, right)
+    if isinstance(node, PropRef):
+        if node.prop in VOLATILE_PROPS: return None
+        obj = expr_key(node.obj)
+        return None if obj is None else ("prop", obj, node.prop)
+    if isinstance(node, IndexRef):
+        table, index = expr_key(node.table), expr_key(node.index)
+        if table is None or index is None: return None
+        return ("index", table, index)
+    return None
+
+class Available:
+    # what an available expression depends on, so writes know what to throw away
+    __slots__ = ("holder", "reads", "heap", "local_only")
+
+    def __init__(self, holder, key):
+        self.holder = holder
+        self.reads = set()
+        self.heap = False # reads a property, table entry or length
+        self.local_only = True
+        stack = [key]
+        while stack:
+            part = stack.pop()
+            if part[0] == "var":
+                self.reads.add(part[2])
+                if part[1] != "l!": self.local_only = False
+            elif part[0] in ("num", "str"):
+                continue
+            else:
+                if part[0] in ("prop", "index") or part[1] == "#":
+                    self.heap = True
+                    self.local_only = False
+                stack.extend(p for p in part[1:] if isinstance(p, tuple))
+
+# builtins that never touch the UI or a table (wait still counts as a yield)
+NO_WRITE_CALLS = {"print", "warn", "wait", "task.wait"}
+
+def call_name(call):
+    # "f", "util.greet", "a.b.c", the same spelling FuncDefNode.name uses
+    func = call.func_expr
+    parts = []
+    while isinstance(func, PropRef):
+        parts.append(func.prop)
+        func = func.obj
+    if not isinstance(func, VarRef):
+        return None
+    return ".".join([func.name] + parts[::-1])
+
+def yields(call, funcs):
+    # wait and custom functions can hand control to other events, which may write globals or the UI
+    if call.is_bg or call.is_protected or call.force_custom:
+        return True
+    name = call_name(call)
+    return name in ("wait", "task.wait") or name in funcs
+
+def clobbers(stmt, funcs=()):
+    """(names written, writes the UI/tables, may yield) for `stmt` and everything nested in it"""
+    names, heap, everything = set(), False, False
+    for node in walk(stmt):
+        if isinstance(node, (AssignStmt, CallStmt)):
+            for target in node.targets or ():
+                if isinstance(target, VarRef): names.add(target.name)
+                else: heap = True
+        if isinstance(node, CallStmt):
+            heap = heap or call_name(node) not in NO_WRITE_CALLS
+            everything = everything or yields(node, funcs)
+        elif isinstance(node, (PropertySet, IndexSet)):
+            heap = True
+        elif isinstance(node, DeleteStmt):
+            if isinstance(node.target, VarRef): names.add(node.target.name)
+            else: heap = True
+        elif isinstance(node, ForStmt):
+            names.update(node.vars)
+    return names, heap, everything
+
+class CommonSubexprs:
+    """
+    -O2 CSE. once `local x = <expr>` has run, later copies of <expr> in the same event/function
+    read x instead of recomputing it, until something writes to what <expr> depends on.
+    any call drops property/table reads, and wait or a custom function call (which can yield
+    or touch globals) drops everything that isn't purely local arithmetic
+    """
+    def __init__(self, ast, funcs=()):
+        self.ast = ast
+        self.funcs = funcs
+
+    def reuse(self, node, avail):
+        key = expr_key(node)
+        if key is not None and key in avail:
+            holder = avail[key].holder
+            note(self.Colors, 2, f"reused local '{holder}' for a repeated expression at line {node.line}")
+            return VarRef(node.line, holder, "l!")
+        if isinstance(node, BinaryExpr):
+            node.left = self.reuse(node.left, avail)
+            node.right = self.reuse(node.right, avail)
+        elif isinstance(node, UnaryExpr):
+            node.right = self.reuse(node.right, avail)
+        return node
+
+    def kill(self, stmt, avail):
+        """drop whatever `stmt` (and anything nested in it) may overwrite"""
+        names, heap, everything = clobbers(stmt, self.funcs)
+        for key in [k for k, entry in avail.items() if
+                    entry.holder in names or entry.reads & names
+                    or (heap and entry.heap) or (everything and not entry.local_only)]:
+            del avail[key]
+
+    def visit_block(self, stmts, avail):
+        for stmt in stmts:
+            reusable = not stmt.annotations
+            if isinstance(stmt, AssignStmt):
+                if reusable: stmt.value = self.reuse(stmt.value, avail)
+                if reusable and isinstance(stmt.value, CallStmt):
+                    stmt.value.args = [self.reuse(arg, avail) for arg in stmt.value.args]
+                self.kill(stmt, avail)
+
+                target = stmt.targets[0] if len(stmt.targets) == 1 else None
+                key = expr_key(stmt.value)
+                if (reusable and stmt.scope == "local" and stmt.op == "=" and isinstance(target, VarRef)
+                        and key is not None and key[0] not in ("var", "num", "str")):
+                    entry = Available(target.name, key)
+                    if target.name not in entry.reads: # local x = x + 1 is already stale
+                        avail[key] = entry
+            elif isinstance(stmt, CallStmt):
+                stmt.args = [self.reuse(arg, avail) for arg in stmt.args]
+                self.kill(stmt, avail)
+            elif isinstance(stmt, ReturnStmt):
+                stmt.value = self.reuse(stmt.value, avail)
+            elif isinstance(stmt, IfStmt):
+                stmt.condition = self.reuse(stmt.condition, avail)
+                self.visit_block(stmt.true_body, dict(avail))
+                for i, (cond, body) in enumerate(stmt.else_ifs):
+                    stmt.else_ifs[i] = (self.reuse(cond, avail), body)
+                    self.visit_block(body, dict(avail))
+                if stmt.false_body:
+                    self.visit_block(stmt.false_body, dict(avail))
+                self.kill(stmt, avail)
+            elif isinstance(stmt, (RepeatStmt, ForStmt)):
+                # the body runs again after itself, so only what survives all of it is available at the top
+                self.kill(stmt, avail)
+                self.visit_block(stmt.body, dict(avail))
+            else:
+                self.kill(stmt, avail)
+
+    def optimize(self, colors_class=None):
+        self.Colors = colors_class
+        for shard in self.ast.shards:
+            for func in shard.func_defs:
+                self.visit_block(func.body, {})
+            for event in shard.events:
+                self.visit_block(event.body, {})
+
+class LoopInvariants(NodeTransformer):
+    """
+    -O2 LICM. `local x = <expr>` at the top of a repeat/for body moves above the loop when
+    nothing in the loop can change what <expr> reads, so it runs once instead of every iteration
+    """
+    def __init__(self, ast, funcs=()):
+        self.ast = ast
+        self.funcs = funcs
+        self.event_reads = {}
+
+    def visit_body(self, node):
+        counter = ReadCounter()
+        for stmt in node.body:
+            counter.visit(stmt)
+        self.event_reads = counter.read_counts
+        return self.generic_visit(node)
+
+    visit_EventNode = visit_body
+    visit_FuncDefNode = visit_body
+
+    def always_runs(self, loop):
+        if isinstance(loop, RepeatStmt):
+            return loop.count is None or (isinstance(loop.count, NumberLit) and float(loop.count.value) >= 1)
         return False
 
-    def eliminate_dead_code(self, node):
-        if node is None: return
-        
-        # if this node has a block of statements (like a function body or if-statement)
-        for attr in ['body', 'true_body', 'false_body']:
-            block = getattr(node, attr, None)
-            if isinstance(block, list):
-                new_block = []
-                for i, stmt in enumerate(block):
-                    # DCE
-                    if isinstance(stmt, AssignStmt) and stmt.scope == "local":
-                        target = stmt.targets[0]
-                        if isinstance(target, VarRef):
-                            reads = self.read_counts.get(target.name, 0)
-                            # if it's never read, and the right side has no side-effects (like a function call)
-                            if reads == 0 and not self.has_function_call(stmt.value):
-                                print(f"[optimizer (-O2)] eliminated dead variable '{target.name}' at line {stmt.line}")
-                                continue # it gets deleted
-                    
-                    self.eliminate_dead_code(stmt)
-                    new_block.append(stmt)
-
-                    if isinstance(stmt, ReturnStmt) or isinstance(stmt, BreakStmt):
-                        # if we return, anything after is dead code
-                        if i + 1 < len(block):
-                            dropped = len(block) - (i + 1)
-                            print(f"[optimizer (-O2)] eliminated {dropped} unreachable statement(s) after return statement at line {stmt.line}")
-                        break
-                    
-                setattr(node, attr, new_block)
-
-        # recursively check else-ifs and other shards
-        if hasattr(node, 'else_ifs'):
-            for cond, body in node.else_ifs:
-                self.eliminate_dead_code(body) # we pass body as a dummy object if needed, or just iterate its stmts
-                # (simplified)
-                
-        if hasattr(node, '__dict__'):
-            for key, value in vars(node).items():
-                if isinstance(value, list) and key not in ['body', 'true_body', 'false_body']:
-                    for item in value:
-                        if hasattr(item, '__dict__'): self.eliminate_dead_code(item)
-                elif hasattr(value, '__dict__') and key not in ['body', 'true_body', 'false_body']:
-                    self.eliminate_dead_code(value)
+    def invariant(self, stmt, loop, index, names, heap, everything):
+        if not (isinstance(stmt, AssignStmt) and stmt.scope == "local" and stmt.op == "="
+                and len(stmt.targets) == 1 and isinstance(stmt.targets[0], VarRef) and not stmt.annotations):
+            return False
+        target = stmt.targets[0]
+        key = expr_key(stmt.value)
+        if key is None:
+            return False
+        entry = Available(target.name, key)
+        # LocalPlayer's name/id can't change while the page is open
+        stable = key[0] == "prop" and key[1][0] == "var" and key[1][2] == "LocalPlayer"
+
+        if entry.reads & (names - {target.name}) or target.name in entry.reads:
+            return False
+        if entry.heap and not stable and (heap or not self.always_runs(loop)):
+            return False
+        if everything and not entry.local_only and not stable:
+            return False
+
+        # x must be written only here, not read before it in the body (that'd be last
+        # iteration's value) and not read after the loop (the loop might not run at all)
+        counter = ReadCounter()
+        counter.visit(loop)
+        inside = counter.read_counts.get(target.name, 0)
+        if self.event_reads.get(target.name, 0) > inside:
+            return False
+        written = sum(1 for node in walk(loop) if isinstance(node, (AssignStmt, CallStmt))
+                      and any(isinstance(t, VarRef) and t.name == target.name for t in node.targets or ()))
+        if written != 1:
+            return False
+        earlier = ReadCounter()
+        for prev in loop.body[:index]:
+            earlier.visit(prev)
+        return target.name not in earlier.read_counts
+
+    def hoist(self, loop):
+        loop = self.generic_visit(loop) # inner loops first, what they hoist can keep going
+        hoisted = []
+        moved = True
+        while moved:
+            moved = False
+            names, heap, everything = clobbers(loop, self.funcs)
+            for i, stmt in enumerate(loop.body):
+                if self.invariant(stmt, loop, i, names, heap, everything):
+                    note(self.Colors, 2, f"hoisted '{stmt.targets[0].name}' out of the loop at line {loop.line}")
+                    hoisted.append(loop.body.pop(i))
+                    moved = True
+                    break
+        return hoisted + [loop] if hoisted else loop
+
+    visit_RepeatStmt = hoist
+    visit_ForStmt = hoist
 
     def optimize(self, colors_class=None):
         self.Colors = colors_class
-        self.count_reads(self.ast)
-        self.eliminate_dead_code(self.ast)
\ No newline at end of file
+        self.visit(self.ast)
@@ -1,3 +1,4 @@
+from collections import deque
 from ast_nodes import *
 
 class ParseError(Exception):
@@ -5,19 +6,29 @@ class ParseError(Exception):
 
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.pos = 0
-        self.block_annotations = {}
+        # tokens can be a list or the lexer's iter_tokens() generator. either way only
+        # the lookahead (peek(1) at most) is buffered, not the whole file
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+        self.eof = None
+        self.block_annotations = EMPTY_ANNOTATIONS # replaced, never mutated, so statements can share it
         self.errors = []
+        self.toplevel = [] # (EventNode/FuncDefNode, block annotations going in), used by incremental reparsing
 
     def peek(self, offset=0):
-        if self.pos + offset < len(self.tokens):
-            return self.tokens[self.pos + offset]
-        return self.tokens[-1] # EOF
+        lookahead = self.lookahead
+        while len(lookahead) <= offset:
+            tok = next(self.tokens, None)
+            if tok is None:
+                tok = self.eof # past the end, keep handing out EOF
+            elif tok.type == "EOF":
+                self.eof = tok
+            lookahead.append(tok)
+        return lookahead[offset]
 
     def consume(self):
         tok = self.peek()
-        self.pos += 1
+        self.lookahead.popleft()
         return tok
 
     def match(self, type_, value=None):
@@ -48,8 +59,6 @@ class Parser:
         current_shard = ScriptShardNode()
         
         while self.peek().type != "EOF":
-            line = self.peek().line
-            
             # --- REQUIRE PARSING ---
             if self.peek().type == "IDENT" and self.peek().value == "require":
                 self.consume()
@@ -77,60 +86,73 @@ class Parser:
                 continue
                 
             # --- NORMAL PARSING ---
-            if self.match("KEYWORD", "function"):
-                name = self.expect("IDENT").value
-                
-                while self.match("PUNC", "."):
-                    name += "." + self.expect("IDENT").value
-                    
-                self.expect("PUNC", "(")
-                params = []
-                if not self.match("PUNC", ")"):
-                    params.append(self.expect("IDENT").value)
-                    while self.match("PUNC", ","):
-                        params.append(self.expect("IDENT").value)
-                    self.expect("PUNC", ")")
-                body = self.parse_block()
-                self.expect("KEYWORD", "end")
-                current_shard.func_defs.append(FuncDefNode(line, name, params, body))
+            anno_in = self.block_annotations
+            node = self.parse_toplevel()
+            if isinstance(node, FuncDefNode):
+                current_shard.func_defs.append(node)
             else:
-                obj_or_event = self.expect("IDENT").value
-                event_name = obj_or_event
-                obj_name = None
+                current_shard.events.append(node)
+            self.toplevel.append((node, anno_in))
+                
+        if current_shard.events or current_shard.func_defs:
+            shards.append(current_shard)
                 
-                if self.match("PUNC", "."):
-                    obj_name = obj_or_event
-                    event_name = self.expect("IDENT").value
+        return ScriptNode(1, shards)
+
+    def parse_toplevel(self):
+        line = self.peek().line
+
+        if self.match("KEYWORD", "function"):
+            name = self.expect("IDENT").value
+            
+            while self.match("PUNC", "."):
+                name += "." + self.expect("IDENT").value
                 
-                args = []
-                if self.match("PUNC", "("):
-                    if not self.match("PUNC", ")"):
+            self.expect("PUNC", "(")
+            params = []
+            if not self.match("PUNC", ")"):
+                params.append(self.expect("IDENT").value)
+                while self.match("PUNC", ","):
+                    params.append(self.expect("IDENT").value)
+                self.expect("PUNC", ")")
+            body = self.parse_block()
+            end_tok = self.expect("KEYWORD", "end")
+            node = FuncDefNode(line, name, params, body)
+        else:
+            obj_or_event = self.expect("IDENT").value
+            event_name = obj_or_event
+            obj_name = None
+            
+            if self.match("PUNC", "."):
+                obj_name = obj_or_event
+                event_name = self.expect("IDENT").value
+            
+            args = []
+            if self.match("PUNC", "("):
+                if not self.match("PUNC", ")"):
+                    arg_tok = self.consume()
+                    if arg_tok.type not in ("IDENT", "STRING"):
+                        raise ParseError(f"expected IDENT or STRING, got {arg_tok.value!r} at line {line}")
+                    args.append(arg_tok.value)
+                    
+                    while self.match("PUNC", ","):
                         arg_tok = self.consume()
                         if arg_tok.type not in ("IDENT", "STRING"):
                             raise ParseError(f"expected IDENT or STRING, got {arg_tok.value!r} at line {line}")
                         args.append(arg_tok.value)
-                        
-                        while self.match("PUNC", ","):
-                            arg_tok = self.consume()
-                            if arg_tok.type not in ("IDENT", "STRING"):
-                                raise ParseError(f"expected IDENT or STRING, got {arg_tok.value!r} at line {line}")
-                            args.append(arg_tok.value)
-                        self.expect("PUNC", ")")
-                
-                full_event = f"{obj_name}.{event_name}" if obj_name else event_name
-                body = self.parse_block(is_event=True)
-                self.expect("KEYWORD", "end")
-                
-                current_shard.events.append(EventNode(line, full_event, args, body))
-                
-        if current_shard.events or current_shard.func_defs:
-            shards.append(current_shard)
-                
-        return ScriptNode(1, shards)
+                    self.expect("PUNC", ")")
+            
+            full_event = f"{obj_name}.{event_name}" if obj_name else event_name
+            body = self.parse_block(is_event=True)
+            end_tok = self.expect("KEYWORD", "end")
+            node = EventNode(line, full_event, args, body)
+
+        node.end_line = end_tok.line
+        return node
 
     def parse_block(self, is_event=False):
         stmts = []
-        line_annotations = {}
+        line_annotations = None
 
         while self.peek().type != "EOF":
             if self.peek().type == "ANNOTATION":
@@ -141,7 +163,7 @@ class Parser:
                 
                 if is_block:
                     if anno_text == "end":
-                        self.block_annotations.clear()
+                        self.block_annotations = EMPTY_ANNOTATIONS
                     else:
                         parts = anno_text.split(maxsplit=1)
                         if not parts:
@@ -149,10 +171,12 @@ class Parser:
                         
                         anno_key = parts[0]
                         if len(parts) > 1:
-                            self.block_annotations[anno_key] = parts[1]
-                        else:
-                            self.block_annotations.pop(anno_key, None)
+                            self.block_annotations = {**self.block_annotations, anno_key: parts[1]}
+                        elif anno_key in self.block_annotations:
+                            self.block_annotations = {k: v for k, v in self.block_annotations.items() if k != anno_key}
                 else:
+                    if line_annotations is None:
+                        line_annotations = {}
                     for tag in anno_text.split():
                         kv = tag.split("=", 1)
                         if len(kv) == 2:
@@ -171,18 +195,21 @@ class Parser:
             try:
                 stmt = self.parse_statement()
                 if stmt:
-                    stmt.annotations = self.block_annotations.copy()
-                    stmt.annotations.update(line_annotations)
-                    
-                    stmt.force_builtin = stmt.annotations.get("builtin", False)
-                    stmt.force_custom = stmt.annotations.get("custom", False)
+                    if line_annotations:
+                        stmt.annotations = {**self.block_annotations, **line_annotations}
+                    else:
+                        stmt.annotations = self.block_annotations
+
+                    if stmt.annotations:
+                        stmt.force_builtin = stmt.annotations.get("builtin", False)
+                        stmt.force_custom = stmt.annotations.get("custom", False)
                     
                     stmts.append(stmt)
             except ParseError as e:
                 self.errors.append(str(e))
                 self.synchronize()
                 
-            line_annotations.clear()
+            line_annotations = None
                 
         return stmts
 
@@ -0,0 +1,193 @@
+import re
+from functools import lru_cache
+from cwir import Operand, BLOCK_CLOSERS, opens_block
+from optimizer import note
+
+# scaffold() temps after regalloc (l!__0) or before it (l!__tmp1)
+TEMP_RE = re.compile(r"l!__(?:tmp)?\d+")
+
+# ops that read and write their first arg
+IN_PLACE = {"VAR_INC", "VAR_DEC", "VAR_MUL", "VAR_DIV", "VAR_POW", "VAR_MOD", "VAR_ROUND", "VAR_FLOOR", "VAR_CEIL"}
+# ops nothing else can observe mid-way, so a global can be written a few of these early
+PURE = IN_PLACE | {"VAR_SET", "STR_CONCAT", "STR_LEN", "STR_LOWER", "STR_UPPER"}
+FLOW = {"ELSE", "BREAK", "RETURN"}
+
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+@lru_cache(maxsize=None)
+def name_re(name):
+    # "l!x" as a var name or inside "{l!x}", but not "l!xy", "o!x" for "x", ...
+    return re.compile(r"(?<![\w!])" + re.escape(name) + r"(?!\w)")
+
+def mentions(args, name):
+    pattern = name_re(name)
+    for arg in args:
+        if arg.kind == "TUPLE":
+            if mentions(arg.value, name): return True
+        elif arg.kind != "WORD" and pattern.search(arg.value):
+            return True
+    return False
+
+def rename(arg, pattern, new):
+    if arg.kind == "TUPLE":
+        return Operand("TUPLE", [rename(item, pattern, new) for item in arg.value])
+    if arg.kind == "WORD":
+        return arg
+    return Operand(arg.kind, pattern.sub(new, arg.value))
+
+def defines(instr, name):
+    """instr overwrites name without reading it first"""
+    args = instr.args
+    if not args or instr.op in IN_PLACE or instr.op in ("VAR_DEL", "TABLE_DEL"):
+        return False
+    if instr.op == "VAR_SET":
+        out, ins = args[0], args[1:]
+    else:
+        # every other op with an output var takes it last
+        out, ins = args[-1], args[:-1]
+    return out.kind == "STRING" and out.value == name and not mentions(ins, name)
+
+def is_flow(instr):
+    return opens_block(instr.op) or instr.op in BLOCK_CLOSERS or instr.op in FLOW
+
+def number(value):
+    return float(value) if NUMBER_RE.fullmatch(value) else None
+
+class Peephole:
+    """CWIR-level cleanups of what scaffold() leaves behind, one event/function at a time"""
+    def __init__(self, instrs, opt_level=2):
+        self.instrs = instrs
+        self.opt_level = opt_level
+
+    def drop_self_copies(self, body):
+        # VAR_SET x "{x}"
+        return [ins for ins in body if not (
+            ins.op == "VAR_SET" and len(ins.args) == 2
+            and ins.args[1].kind == "STRING" and ins.args[1].value == f"{{{ins.args[0].value}}}"
+        )]
+
+    def merge_increments(self, body):
+        # VAR_INC x "2" / VAR_DEC x "5" -> VAR_DEC x "3"
+        out = []
+        for ins in body:
+            prev = out[-1] if out else None
+            if (prev is not None and ins.op in ("VAR_INC", "VAR_DEC") and prev.op in ("VAR_INC", "VAR_DEC")
+                    and len(ins.args) == 2 and len(prev.args) == 2 and ins.args[0] == prev.args[0]):
+                a, b = number(prev.args[1].value), number(ins.args[1].value)
+                if a is not None and b is not None:
+                    total = (a if prev.op == "VAR_INC" else -a) + (b if ins.op == "VAR_INC" else -b)
+                    if total == 0:
+                        out.pop()
+                        continue
+                    prev.op = "VAR_INC" if total > 0 else "VAR_DEC"
+                    total = abs(total)
+                    prev.args[1] = Operand("STRING", str(int(total)) if total.is_integer() else str(total))
+                    continue
+            out.append(ins)
+        return out
+
+    def drop_empty_ifs(self, body):
+        # IF_* END_IF, IF_* ELSE END_IF, and the empty ELSE of IF_* ... ELSE END_IF
+        out = []
+        for ins in body:
+            if ins.op == "END_IF" and out:
+                if out[-1].op == "ELSE":
+                    out.pop()
+                    if out and out[-1].op.startswith("IF_"):
+                        out.pop()
+                        continue
+                    out.append(ins)
+                    continue
+                if out[-1].op.startswith("IF_"):
+                    out.pop()
+                    continue
+            out.append(ins)
+        return out
+
+    def fold_copy(self, body, j):
+        """
+        VAR_SET out "{tmp}" right after tmp gets computed: compute straight into out instead.
+        returns True if body[j] can go
+        """
+        copy = body[j]
+        out, src = copy.args[0].value, copy.args[1].value
+        if not (src.startswith("{") and src.endswith("}") and TEMP_RE.fullmatch(src[1:-1])):
+            return False
+        tmp = src[1:-1]
+        if tmp == out:
+            return False
+
+        # out is written early, only safe if nothing in between can see it
+        local = out.startswith("l!")
+        d = j - 1
+        while d >= 0:
+            ins = body[d]
+            if is_flow(ins):
+                return False
+            if defines(ins, tmp):
+                break
+            if mentions(ins.args, out) or (not local and ins.op not in PURE):
+                return False
+            d -= 1
+        if d < 0:
+            return False
+
+        # tmp can't be read again before it's redefined. temps never outlive the statement
+        # that made them, so there's no read coming back around a loop to worry about
+        for ins in body[j + 1:]:
+            if mentions(ins.args, tmp):
+                if not defines(ins, tmp):
+                    return False
+                break
+
+        pattern = name_re(tmp)
+        for ins in body[d:j]:
+            if mentions(ins.args, tmp):
+                ins.args = [rename(arg, pattern, out) for arg in ins.args]
+        return True
+
+    def fold_copies(self, body):
+        body = list(body)
+        j = 0
+        while j < len(body):
+            ins = body[j]
+            if ins.op == "VAR_SET" and len(ins.args) == 2 and ins.args[1].kind == "STRING" and self.fold_copy(body, j):
+                del body[j]
+            else:
+                j += 1
+        return body
+
+    def optimize_body(self, body):
+        while True:
+            size = len(body)
+            body = self.drop_self_copies(body)
+            body = self.merge_increments(body)
+            body = self.drop_empty_ifs(body)
+            body = self.fold_copies(body)
+            if len(body) == size:
+                return body
+
+    def optimize(self, colors_class=None):
+        self.Colors = colors_class
+        out = []
+        body = None
+        for ins in self.instrs:
+            if ins.op == "EVENT":
+                event, body = ins, []
+                out.append(ins)
+            elif ins.op == "END_EVENT" and body is not None:
+                optimized = self.optimize_body(body)
+                saved = len(body) - len(optimized)
+                if saved:
+                    kind = event.args[0].value if event.args else "?"
+                    label = f"function '{event.args[1].value}'" if kind == "FUNC_DEF" and len(event.args) > 1 else f"event {kind}"
+                    note(self.Colors, self.opt_level, f"peephole saved {saved} action(s) in {label} at line {event.line}")
+                out.extend(optimized)
+                out.append(ins)
+                body = None
+            elif body is not None:
+                body.append(ins)
+            else:
+                out.append(ins)
+        self.instrs = out
+        return out
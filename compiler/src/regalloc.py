@@ -0,0 +1,86 @@
+import re
+import heapq
+from cwir import Operand, LOOP_OPENERS, BLOCK_CLOSERS, opens_block
+
+# scaffold() temps, always local. the lookbehind keeps user names like "my__tmp1" out
+TEMP_RE = re.compile(r"(?<=l!)__tmp\d+\b")
+
+def temps_in(args):
+    for arg in args:
+        if arg.kind == "TUPLE":
+            yield from temps_in(arg.value)
+        elif arg.kind == "STRING":
+            yield from TEMP_RE.findall(arg.value)
+
+def rename(arg, mapping):
+    if arg.kind == "TUPLE":
+        return Operand("TUPLE", [rename(item, mapping) for item in arg.value])
+    if arg.kind == "STRING" and "__tmp" in arg.value:
+        return Operand("STRING", TEMP_RE.sub(lambda m: mapping[m.group(0)], arg.value))
+    return arg
+
+def live_ranges(instrs):
+    """temp name -> [first index, last index] over one event/function body"""
+    ranges = {}
+    loops = []
+    stack = []
+
+    for i, instr in enumerate(instrs):
+        if opens_block(instr.op):
+            stack.append(i)
+        elif instr.op in BLOCK_CLOSERS and stack:
+            start = stack.pop()
+            if instrs[start].op in LOOP_OPENERS:
+                loops.append((start, i))
+
+        for name in temps_in(instr.args):
+            if name in ranges:
+                ranges[name][1] = i
+            else:
+                ranges[name] = [i, i]
+
+    # a temp live across a loop boundary has to survive the whole loop, the next
+    # iteration can still read it. extending one range never shrinks another so
+    # this settles after a pass per nesting level
+    changed = True
+    while changed:
+        changed = False
+        for r in ranges.values():
+            for start, end in loops:
+                overlaps = r[0] <= end and start <= r[1]
+                inside = start < r[0] and r[1] < end
+                covers = r[0] <= start and end <= r[1]
+                if overlaps and not inside and not covers:
+                    r[0], r[1] = min(r[0], start), max(r[1], end)
+                    changed = True
+    return ranges
+
+def allocate_temps(instrs):
+    """
+    renames the __tmpN temps of one event/function to short slots (__0, __1, ...),
+    reusing a slot once the temp holding it is dead. returns how many slots are used
+    """
+    ranges = live_ranges(instrs)
+    if not ranges:
+        return 0
+
+    mapping = {}
+    free = [] # slot numbers, smallest first
+    active = [] # (last use, slot)
+    slots = 0
+
+    for name, (start, end) in sorted(ranges.items(), key=lambda item: item[1][0]):
+        # strictly before: a temp read by the same instruction that defines the next one keeps its slot
+        while active and active[0][0] < start:
+            heapq.heappush(free, heapq.heappop(active)[1])
+        if free:
+            slot = heapq.heappop(free)
+        else:
+            slot = slots
+            slots += 1
+        mapping[name] = f"__{slot}"
+        heapq.heappush(active, (end, slot))
+
+    for instr in instrs:
+        instr.args = [rename(arg, mapping) for arg in instr.args]
+    return slots
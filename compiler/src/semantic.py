@@ -1,6 +1,8 @@
 from ast_nodes import *
+from visitor import NodeVisitor
+from constfold import fold_arith
 
-class SemanticAnalyzer:
+class SemanticAnalyzer(NodeVisitor):
     SERVICES = {"UserInputService", "LocalPlayer", "Camera"}
 
     BUILTINS = {
@@ -99,24 +101,9 @@ class SemanticAnalyzer:
         expr.right = self.fold_constants(expr.right)
         
         if type(expr.left).__name__ == "NumberLit" and type(expr.right).__name__ == "NumberLit":
-            try:
-                left_val = float(expr.left.value)
-                right_val = float(expr.right.value)
-                result = None
-                
-                if expr.op == "+": result = left_val + right_val
-                elif expr.op == "-": result = left_val - right_val
-                elif expr.op == "*": result = left_val * right_val
-                elif expr.op == "/": result = left_val / right_val if right_val != 0 else None
-                elif expr.op == "^": result = left_val ** right_val
-                elif expr.op == "%": result = left_val % right_val if right_val != 0 else None
-                
-                if result is not None:
-                    res_str = str(int(result)) if result.is_integer() else str(result)
-                    
-                    return NumberLit(expr.line, res_str)
-            except Exception:
-                pass # if math fails for some weird reason, just abort folding
+            result = fold_arith(expr.op, expr.left.value, expr.right.value)
+            if result is not None:
+                return NumberLit(expr.line, result)
                 
         return expr
 
@@ -171,22 +158,6 @@ class SemanticAnalyzer:
                 self.warn(stmt.line, "action limit exceeded (120 per event). further actions may not compile or run correctly.")
             self.visit(stmt)
 
-    def visit(self, node):
-        if node is None:
-            return
-        method_name = 'visit_' + type(node).__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        visitor(node)
-
-    def generic_visit(self, node):
-        for key, value in vars(node).items():
-            if isinstance(value, list):
-                for item in value:
-                    if hasattr(item, '__dict__'):
-                        self.visit(item)
-            elif hasattr(value, '__dict__'):
-                self.visit(value)
-
     def visit_IfStmt(self, node):
         self.visit(node.condition)
         self.visit_block(node.true_body)
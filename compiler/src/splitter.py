@@ -0,0 +1,181 @@
+"""
+--split-events: outlines chunks of events/functions that compile to more than ACTION_LIMIT
+actions into generated FUNC_DEF helpers, called with FUNC_RUN. works on the final CWIR so the
+counts are the real ones
+"""
+import re
+from cwir import Instr, EMPTY, string, word, tuple_of, opens_block, BLOCK_CLOSERS, LOOP_OPENERS
+from peephole import defines
+from actions import ACTION_LIMIT
+
+MAX_PARAMS = 6 # SemanticAnalyzer.analyze rejects functions with more
+
+LOCAL_RE = re.compile(r"(?<![\w!])l!([a-zA-Z_]\w*)")
+# ops that take a table/audio/object by name, those can't go through a function argument
+BY_NAME = ("TABLE_", "AVAR_", "AUDIO_")
+# TABLE_ITER's implicit loop locals
+LOOP_LOCALS = {"value", "index"}
+
+def local_names(args):
+    for arg in args:
+        if arg.kind == "TUPLE":
+            yield from local_names(arg.value)
+        elif arg.kind != "WORD":
+            yield from LOCAL_RE.findall(arg.value)
+
+def bare(instr, name):
+    # the local itself rather than its value, i.e. a write or a by-name use
+    return any(arg.kind == "STRING" and arg.value == name for arg in instr.args)
+
+def depths(body):
+    """block depth before each instruction"""
+    out, depth = [], 0
+    for instr in body:
+        if instr.op in BLOCK_CLOSERS or instr.op == "ELSE":
+            depth -= 1
+        out.append(depth)
+        if opens_block(instr.op) or instr.op == "ELSE":
+            depth += 1
+    return out
+
+class EventSplitter:
+    def __init__(self, instrs):
+        self.instrs = instrs
+        self.counter = 0
+
+    def live_in(self, chunk):
+        """locals the chunk may read before writing them itself"""
+        seen, params = set(), []
+        for instr, depth in zip(chunk, depths(chunk)):
+            for name in local_names(instr.args):
+                if name in seen:
+                    continue
+                seen.add(name)
+                if name in LOOP_LOCALS and any(i.op == "TABLE_ITER" for i in chunk):
+                    continue
+                # a write inside an IF/loop might not run, the value from before the cut can still get through
+                if depth > 0 or not defines(instr, f"l!{name}"):
+                    params.append(name)
+        return params
+
+    def written(self, chunk):
+        return {name for instr in chunk for name in local_names(instr.args) if bare(instr, f"l!{name}")}
+
+    def passable(self, chunk, names):
+        for instr in chunk:
+            if instr.op.startswith(BY_NAME) and any(bare(instr, f"l!{name}") for name in names):
+                return False
+        return True
+
+    def escapes(self, chunk, allow_return):
+        # a BREAK for a loop outside the chunk, or a RETURN we can't pass on
+        loops = 0
+        for instr in chunk:
+            if instr.op in LOOP_OPENERS: loops += 1
+            elif instr.op in ("END_REPEAT", "END_ITER"): loops -= 1
+            elif instr.op == "BREAK" and loops == 0: return True
+            elif instr.op == "RETURN" and not allow_return: return True
+        return False
+
+    def plan(self, body, a, b, trailing, in_loop):
+        """(params, returned local or None) to outline body[a:b], None if it can't be done"""
+        chunk = body[a:b]
+        if self.escapes(chunk, allow_return=trailing):
+            return None
+        params = self.live_in(chunk)
+        outs = []
+        if not trailing: # nothing runs after a trailing chunk
+            outside = set(local_names([arg for instr in body[:a] + body[b:] for arg in instr.args]))
+            # written and needed afterwards, or carried into the next iteration of a loop around it
+            outs = sorted(name for name in self.written(chunk) if name in outside or (in_loop and name in params))
+        if len(params) > MAX_PARAMS or len(outs) > 1:
+            return None
+        if not self.passable(body, params + outs):
+            return None
+        return params, (outs[0] if outs else None)
+
+    def candidates(self, body):
+        """(a, b, trailing, in_loop): trailing cuts at the top level, smallest first, then whole branch bodies, biggest first"""
+        depth = depths(body)
+        for k in range(len(body) - 1, 0, -1):
+            if depth[k] == 0 and body[k].line != body[k - 1].line:
+                yield k, len(body), True, False
+        regions = []
+        stack = []
+        for i, instr in enumerate(body):
+            if instr.op in BLOCK_CLOSERS or instr.op == "ELSE":
+                start, in_loop = stack.pop()
+                regions.append((start, i, in_loop))
+            if opens_block(instr.op) or instr.op == "ELSE":
+                # an ELSE has already popped its IF's region, so stack[-1] is the IF's parent either way
+                in_loop = instr.op in LOOP_OPENERS or (stack[-1][1] if stack else False)
+                stack.append((i + 1, in_loop))
+        for a, b, in_loop in sorted(regions, key=lambda r: r[0] - r[1]):
+            if b - a >= 2:
+                yield a, b, False, in_loop
+
+    def split_body(self, event, body, is_function):
+        """returns the new body and the helper events (lists of Instr) it calls"""
+        helpers = []
+        while len(body) > ACTION_LIMIT:
+            budget = ACTION_LIMIT - (2 if is_function else 1)
+            for a, b, trailing, in_loop in self.candidates(body):
+                if trailing and a > budget:
+                    continue
+                planned = self.plan(body, a, b, trailing, in_loop)
+                if planned:
+                    break
+            else:
+                print(f"[split] couldn't find a chunk to outline in the event at line {event.line} (locals used across every cut are tables, "
+                      f"too many, or written inside a loop), it stays at {len(body)} actions")
+                return body, helpers
+
+            params, out = planned
+            self.counter += 1
+            name = f"__split{self.counter}"
+            chunk = body[a:b]
+            indent = chunk[0].indent
+            line = chunk[0].line
+            ret = "__ret" if trailing and is_function else out
+
+            call = [Instr("FUNC_RUN", [string(name), tuple_of(string(f"{{l!{p}}}") for p in params),
+                                       string(f"l!{ret}") if ret else EMPTY], line, indent)]
+            if trailing and is_function:
+                call.append(Instr("RETURN", [string(f"{{l!{ret}}}")], line, indent))
+
+            cut = min(len(i.indent) for i in chunk)
+            helper_body = [Instr(i.op, i.args, i.line, "    " + i.indent[cut:]) for i in chunk]
+            if out:
+                helper_body.append(Instr("RETURN", [string(f"{{l!{out}}}")], line, "    "))
+            helper = Instr("EVENT", [word("FUNC_DEF"), string(name), tuple_of(string(p) for p in params)], event.line)
+            print(f"[split] moved {len(chunk)} action(s) from the event at line {event.line} into {name}({', '.join(params)})")
+
+            body = body[:a] + call + body[b:]
+            helper_body, nested = self.split_body(helper, helper_body, True)
+            helpers.append([helper] + helper_body + [Instr("END_EVENT", (), event.line)])
+            helpers.extend(nested)
+        return body, helpers
+
+    def split(self, colors_class=None):
+        self.Colors = colors_class
+        out = []
+        event, body = None, None
+        for instr in self.instrs:
+            if instr.op == "EVENT":
+                event, body = instr, []
+                out.append(instr)
+            elif instr.op == "END_EVENT" and body is not None:
+                is_function = bool(event.args) and event.args[0].value == "FUNC_DEF"
+                body, helpers = self.split_body(event, body, is_function)
+                out.extend(body)
+                out.append(instr)
+                # helpers go in the same SCRIPT so FUNC_RUN can find them
+                for helper in helpers:
+                    out.extend(helper)
+                event, body = None, None
+            elif body is not None:
+                body.append(instr)
+            else:
+                out.append(instr)
+        self.instrs = out
+        return out
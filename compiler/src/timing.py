@@ -0,0 +1,89 @@
+"""
+--time-passes: wall time and memory allocated per compiler stage and per required file.
+a PassTimer that isn't enabled does nothing, so the pipeline can always go through one
+"""
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+class PassTimer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.stages = [] # {"name", "ms", "allocated", "peak"}, memory in bytes
+        self.files = [] # {"path", "ms", "allocated", "source"}
+        # someone else (a test harness, -X tracemalloc) may already be tracing, leave theirs alone
+        self.owns_tracing = enabled and not tracemalloc.is_tracing()
+        if self.owns_tracing:
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            self.stages.append({
+                "name": name,
+                "ms": round(elapsed * 1000, 3),
+                "allocated": current - before, # what the stage left behind
+                "peak": max(peak - before, 0), # the most it held at once
+            })
+
+    @contextmanager
+    def file(self, path):
+        """
+        yields the file's entry so the linker can fill in "source": "parsed", "cache", "editor"
+        or "worker" (parsed by a -j process, only the hand-over is timed here)
+        """
+        entry = {"path": path, "ms": 0, "allocated": 0, "source": "parsed"}
+        if not self.enabled:
+            yield entry
+            return
+        # nested inside the link stage, so no reset_peak() here or the stage's peak is lost
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            entry["allocated"] = tracemalloc.get_traced_memory()[0] - before
+            self.files.append(entry)
+
+    def report(self, filename=None, opt_level=None):
+        """the machine-readable form --time-passes writes next to the output"""
+        return {
+            "file": filename,
+            "opt_level": opt_level,
+            "total_ms": round(sum(stage["ms"] for stage in self.stages), 3),
+            "stages": self.stages,
+            "files": self.files,
+        }
+
+    def stop(self):
+        if self.owns_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.owns_tracing = False
+
+def kb(size):
+    return f"{size / 1024:9.1f} KB"
+
+def print_timings(report, colors):
+    print(f"\n{colors.BOLD}{colors.BLUE}=== PASSES ==={colors.RESET}")
+    print(f"  {'stage':<22}{'time':>11}{'allocated':>13}{'peak':>13}")
+    for stage in report["stages"]:
+        print(f"  {stage['name']:<22}{stage['ms']:8.2f} ms{kb(stage['allocated'])}  {kb(stage['peak'])}")
+    print(f"  {'total':<22}{report['total_ms']:8.2f} ms")
+    if report["files"]:
+        print(f"{colors.BOLD}  lex + parse per file{colors.RESET}")
+        for entry in sorted(report["files"], key=lambda e: -e["ms"]):
+            where = f" ({entry['source']})" if entry["source"] != "parsed" else ""
+            print(f"    {entry['ms']:8.2f} ms{kb(entry['allocated'])}  {os.path.relpath(entry['path'])}{where}")
+    print(f"  {colors.YELLOW}memory tracing is on, so these times run slower than a normal build{colors.RESET}")
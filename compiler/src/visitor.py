@@ -0,0 +1,82 @@
+from ast_nodes import *
+
+def iter_child_nodes(node):
+    """every node directly below `node`, in field order. else_ifs tuples are flattened"""
+    for name in node._children:
+        value = getattr(node, name)
+        if isinstance(value, list):
+            for item in value:
+                if isinstance(item, tuple):
+                    for part in item:
+                        if isinstance(part, list):
+                            yield from part
+                        elif part is not None:
+                            yield part
+                elif item is not None:
+                    yield item
+        elif value is not None:
+            yield value
+
+def walk(node):
+    """node and everything below it, depth first"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(iter_child_nodes(node))))
+
+class NodeVisitor:
+    """
+    base for passes over the AST. visit() calls visit_<ClassName> if the pass has one and
+    generic_visit() otherwise. the method for each node class is looked up once per pass
+    class and cached, and generic_visit() only touches the fields listed in `_children`
+    """
+    _dispatch = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {} # node class -> plain function, per pass class
+
+    def visit(self, node):
+        if node is None:
+            return None
+        method = self._dispatch.get(type(node))
+        if method is None:
+            cls = type(self)
+            method = getattr(cls, 'visit_' + type(node).__name__, cls.generic_visit)
+            cls._dispatch[type(node)] = method
+        return method(self, node)
+
+    def generic_visit(self, node):
+        for child in iter_child_nodes(node):
+            self.visit(child)
+
+class NodeTransformer(NodeVisitor):
+    """
+    a visitor whose visit_ methods return the replacement for the node they were given.
+    in a list (a block, args, ...) returning None drops the node and returning a list
+    splices all of it in. generic_visit() writes the results back into the node
+    """
+    def generic_visit(self, node):
+        for name in node._children:
+            value = getattr(node, name)
+            if isinstance(value, list):
+                setattr(node, name, self.visit_list(value))
+            elif value is not None:
+                setattr(node, name, self.visit(value))
+        return node
+
+    def visit_list(self, items):
+        new_items = []
+        for item in items:
+            if isinstance(item, tuple):
+                # IfStmt.else_ifs, (condition, body)
+                new_items.append(tuple(self.visit_list(part) if isinstance(part, list) else self.visit(part) for part in item))
+                continue
+
+            result = self.visit(item)
+            if isinstance(result, list):
+                new_items.extend(result)
+            elif result is not None:
+                new_items.append(result)
+        return new_items
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, os.path.abspath(SRC))
+
+from linker import Linker
+from cwir import serialize
+import main
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    """keeps the parse cache of every test out of the real user cache folder"""
+    path = tmp_path / "cache"
+    monkeypatch.setenv("CATLUA_CACHE_DIR", str(path))
+    return path
+
+@pytest.fixture
+def compile_ir(tmp_path):
+    """writes {name: source} into tmp_path and returns the CWIR text for the first file"""
+    def run(files, opt_level=1, split_events=False):
+        paths = []
+        for name, source in files.items():
+            path = tmp_path / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(source, encoding="utf-8")
+            paths.append(path)
+        ast, analyzer = main.analyze(Linker(), str(paths[0]), opt_level=opt_level)
+        assert not analyzer.errors, analyzer.errors
+        return serialize(main.emit_ir(ast, analyzer, split_events=split_events))
+    return run
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+
+import main
+from linker import Linker
+
+GOOD = "OnWebsiteLoaded\n    print(\"hi\")\nend\n"
+
+def test_build_reports_missing_entry_and_keeps_going(tmp_path, capsys):
+    good = tmp_path / "good.catlua"
+    good.write_text(GOOD, encoding="utf-8")
+    missing = tmp_path / "missing.catlua"
+    out_dir = tmp_path / "build"
+
+    ok = main.build(Linker(), [str(missing), str(good)], str(out_dir), str(tmp_path))
+
+    assert ok is False
+    assert (out_dir / "good.json").exists()
+    out = capsys.readouterr().out
+    assert "cannot read" in out
+    assert "2 entries, 1 ok, 1 failed" in out
+
+def test_build_missing_entry_with_jobs(tmp_path, capsys):
+    missing = tmp_path / "missing.catlua"
+    ok = main.build(Linker(), [str(missing)], str(tmp_path / "build"), str(tmp_path), jobs=2)
+    assert ok is False
+    assert "cannot read" in capsys.readouterr().out
+
+@pytest.mark.parametrize("value", ["foo", "0", "-2"])
+def test_bad_jobs_value_is_a_usage_error(tmp_path, monkeypatch, capsys, value):
+    entry = tmp_path / "good.catlua"
+    entry.write_text(GOOD, encoding="utf-8")
+    monkeypatch.setattr(main.sys, "argv", ["main.py", str(entry), "-j", value])
+    with pytest.raises(SystemExit) as exit:
+        main.main()
+    assert exit.value.code == 1
+    assert "-j takes a number" in capsys.readouterr().out
+    assert not (tmp_path / "good.json").exists()
+
+@pytest.mark.parametrize("setting", ['jobs = "4"', "jobs = 0", 'opt = "2"', "opt = 7", "seed = 1.5", 'entries = "main.catlua"'])
+def test_manifest_settings_are_type_checked(tmp_path, capsys, setting):
+    manifest = tmp_path / "catlua.toml"
+    entries = "" if setting.startswith("entries") else 'entries = ["good.catlua"]\n'
+    manifest.write_text(f"{entries}{setting}\n", encoding="utf-8")
+    with pytest.raises(SystemExit) as exit:
+        main.load_manifest(str(manifest))
+    assert exit.value.code == 1
+    assert f"{setting.split()[0]} must be" in capsys.readouterr().out
+
+def test_entry_outside_the_project_is_not_written_outside_out_dir(tmp_path, capsys):
+    project = tmp_path / "site"
+    project.mkdir()
+    (project / "good.catlua").write_text(GOOD, encoding="utf-8")
+    (tmp_path / "outside.catlua").write_text(GOOD, encoding="utf-8")
+    manifest = project / "catlua.toml"
+    manifest.write_text('entries = ["good.catlua", "../outside.catlua"]\nout_dir = "build"\n', encoding="utf-8")
+
+    entries, out_dir, base_dir, _ = main.load_manifest(str(manifest))
+    ok = main.build(Linker(), entries, out_dir, base_dir)
+
+    assert ok is False
+    assert (project / "build" / "good.json").exists()
+    assert not (tmp_path / "outside.json").exists()
+    out = capsys.readouterr().out
+    assert "would be written outside" in out
+    assert "2 entries, 1 ok, 1 failed" in out
+
+def test_unchanged_build_is_skipped_but_a_damaged_output_is_rewritten(tmp_path, capsys):
+    entry = tmp_path / "good.catlua"
+    entry.write_text(GOOD, encoding="utf-8")
+    out_file = tmp_path / "good.json"
+
+    assert main.compile_entry(Linker(), str(entry), str(out_file))
+    built = out_file.read_text(encoding="utf-8")
+    mtime = os.stat(out_file).st_mtime_ns
+    assert main.compile_entry(Linker(), str(entry), str(out_file))
+    assert os.stat(out_file).st_mtime_ns == mtime
+
+    # the sidecar still matches the new build, the file it describes doesn't
+    out_file.write_text(built[:len(built) // 2], encoding="utf-8")
+    assert main.compile_entry(Linker(), str(entry), str(out_file))
+    assert out_file.read_text(encoding="utf-8") == built
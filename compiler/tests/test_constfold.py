@@ -0,0 +1,67 @@
+def event(*lines):
+    return {"main.catlua": "OnWebsiteLoaded\n" + "".join(f"    {line}\n" for line in lines) + "end\n"}
+
+def body(ir):
+    lines = ir.splitlines()
+    start = lines.index("EVENT LOADED")
+    return [line.strip() for line in lines[start + 1:lines.index("END_EVENT", start)]]
+
+def test_single_write_local_is_propagated_and_folded(compile_ir):
+    assert body(compile_ir(event(
+        "local a = 4",
+        "local b = a * 2 + 1",
+        "print(b)",
+    ))) == ['VAR_SET "l!a" "4"', 'VAR_SET "l!b" "9"', 'LOG "9"']
+
+def test_local_written_in_one_branch_is_not_propagated(compile_ir):
+    assert body(compile_ir(event(
+        "local c = 1",
+        'if LocalPlayer.Name == "x" then',
+        "    l!c = 2",
+        "end",
+        "print(c)",
+    )))[-1] == 'LOG "{l!c}"'
+
+def test_never_true_branches_are_removed(compile_ir, capsys):
+    out = body(compile_ir(event(
+        "local a = 4",
+        "if a > 10 then",
+        '    print("never")',
+        "end",
+        'print("after")',
+    )))
+    assert out == ['VAR_SET "l!a" "4"', 'LOG "after"']
+    assert "removed branch that can never run at line 3" in capsys.readouterr().out
+
+def test_always_true_branch_replaces_the_if(compile_ir):
+    out = body(compile_ir(event(
+        "local a = 4",
+        "if a > 10 then",
+        '    print("never")',
+        "elseif a == 4 then",
+        '    print("always")',
+        "else",
+        '    print("else")',
+        "end",
+    )))
+    assert out == ['VAR_SET "l!a" "4"', 'LOG "always"']
+
+def test_always_true_elseif_becomes_the_else(compile_ir):
+    out = body(compile_ir(event(
+        "local a = 4",
+        'if LocalPlayer.Name == "x" then',
+        '    print("x")',
+        "elseif a == 4 then",
+        '    print("always")',
+        "else",
+        '    print("else")',
+        "end",
+    )))
+    assert out == [
+        'VAR_SET "l!a" "4"',
+        'IF_EQ "{LocalPlayer.Name}" "x"',
+        'LOG "x"',
+        "ELSE",
+        'LOG "always"',
+        "END_IF",
+    ]
@@ -0,0 +1,29 @@
+import main
+from emitter import GlobalIDGen
+
+SOURCE = "OnWebsiteLoaded\n    print(\"hi\")\n    print(\"there\")\nend\n"
+
+def test_ids_widen_to_three_chars_without_repeats():
+    gen = GlobalIDGen()
+    ids = [gen.next() for _ in range(len(GlobalIDGen.CHARS) ** 2 + 100)]
+    assert len(set(ids)) == len(ids)
+    assert {len(gid) for gid in ids[:4900]} == {2}
+    assert {len(gid) for gid in ids[4900:]} == {3}
+
+def test_seed_flag_and_manifest_seed_give_the_same_ids(tmp_path, monkeypatch):
+    (tmp_path / "main.catlua").write_text(SOURCE, encoding="utf-8")
+    (tmp_path / "catlua.toml").write_text('entries = ["main.catlua"]\nout_dir = "build"\nseed = 7\n', encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+
+    # the flag arrives as the string "7", the manifest as the integer 7
+    monkeypatch.setattr(main.sys, "argv", ["main.py", "main.catlua", "-o", "flag.json", "--seed", "7"])
+    main.main()
+    monkeypatch.setattr(main.sys, "argv", ["main.py", "build"])
+    main.main()
+    monkeypatch.setattr(main.sys, "argv", ["main.py", "main.catlua", "-o", "unseeded.json"])
+    main.main()
+
+    flag = (tmp_path / "flag.json").read_text(encoding="utf-8")
+    assert flag == (tmp_path / "build" / "main.json").read_text(encoding="utf-8")
+    # and the seed did change the ids
+    assert flag != (tmp_path / "unseeded.json").read_text(encoding="utf-8")
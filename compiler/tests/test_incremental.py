@@ -0,0 +1,72 @@
+import random
+
+from incremental import IncrementalDocument
+
+SOURCE = """OnWebsiteLoaded
+    local x = 10
+    print(x + 1)
+end
+
+function greet(name)
+    local msg = `hello {name}`
+    print(msg)
+end
+
+--#type audio
+Button.MouseButton1Click
+    mySong.Volume = 8
+    if x > 1 then
+        print(1)
+    end
+end
+--#type
+
+function add(a, b)
+    return a + b
+end
+"""
+
+SNIPPETS = ["x", "1", " + 2", "\n", "\n    print(1)\n", "end", "local q = 3", "--#type audio\n", "--#type\n", "(", "if a then\n"]
+
+def dump(node):
+    # every slot, nested, so two trees compare equal only if they are the same down to line numbers
+    if isinstance(node, (list, tuple)):
+        return type(node)(dump(item) for item in node)
+    slots = [name for cls in type(node).__mro__ for name in getattr(cls, "__slots__", ())]
+    if not slots:
+        return node
+    return type(node).__name__, {name: dump(getattr(node, name)) for name in slots if hasattr(node, name)}
+
+def full_parse(text):
+    doc = IncrementalDocument(text)
+    return None if doc.failure else (dump(doc.ast), doc.errors)
+
+def test_spliced_reparse_matches_full_parse():
+    rng = random.Random(1234)
+    doc = IncrementalDocument(SOURCE)
+    for step in range(400):
+        lines = doc.lines
+        first = rng.randrange(len(lines))
+        last = min(len(lines) - 1, first + rng.choice([0, 0, 0, 1, 2]))
+        start_col = rng.randint(0, len(lines[first]))
+        end_col = rng.randint(start_col if last == first else 0, len(lines[last]))
+        doc.apply_edit((first, start_col), (last, end_col), rng.choice(SNIPPETS) if rng.random() < 0.7 else "")
+
+        expected = full_parse(doc.text)
+        got = None if doc.failure else (dump(doc.ast), doc.errors)
+        assert got == expected, (step, doc.text)
+        # keep the document mostly valid so most edits go through the splice
+        if doc.failure or doc.errors or rng.random() < 0.05:
+            doc.reset(SOURCE)
+
+def test_edit_inside_an_item_shifts_the_later_ones():
+    doc = IncrementalDocument(SOURCE)
+    later = [node for node, _ in doc.items[1:]]
+    lines = [(node.line, node.end_line) for node in later]
+
+    doc.apply_edit((2, 0), (2, 0), "    print(2)\n    print(3)\n")
+
+    # spliced, not reparsed: the later items are the same objects, two lines further down
+    assert [node for node, _ in doc.items[1:]] == later
+    assert [(node.line, node.end_line) for node in later] == [(a + 2, b + 2) for a, b in lines]
+    assert dump(doc.ast) == full_parse(doc.text)[0]
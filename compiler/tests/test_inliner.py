@@ -0,0 +1,112 @@
+from itertools import count
+
+from cwir import parse, serialize
+from inliner import Inliner
+
+def inline(text):
+    temps = count(1)
+    instrs = parse("CWIR_VERSION 1.0\n" + text)[1]
+    return serialize(Inliner(instrs, lambda: f"__tmp{next(temps)}").inline())
+
+def event_body(ir, header):
+    lines = ir.splitlines()
+    start = lines.index(header)
+    return [line.strip() for line in lines[start + 1:lines.index("END_EVENT", start)]]
+
+SHOUT = (
+    'EVENT FUNC_DEF "shout" ["msg"]\n'
+    '    STR_UPPER "{l!msg}" "l!loud"\n'
+    '    RETURN "{l!loud}"\n'
+    'END_EVENT\n'
+)
+
+def test_params_and_locals_become_caller_temps():
+    ir = inline(
+        'SCRIPT\n'
+        'EVENT LOADED\n'
+        '    VAR_SET "l!loud" "keep me"\n'
+        '    FUNC_RUN "shout" ["{LocalPlayer.Name}"] "l!out"\n'
+        '    LOG "{l!loud}"\n'
+        'END_EVENT\n'
+        + SHOUT +
+        'END_SCRIPT\n'
+    )
+    # the callee's "loud" can't clobber the caller's, and an arg that could change is copied first
+    assert event_body(ir, "EVENT LOADED") == [
+        'VAR_SET "l!loud" "keep me"',
+        'VAR_SET "l!__tmp1" "{LocalPlayer.Name}"',
+        'STR_UPPER "{l!__tmp1}" "l!__tmp2"',
+        'VAR_SET "l!out" "{l!__tmp2}"',
+        'LOG "{l!loud}"',
+    ]
+
+def test_literal_arg_is_substituted():
+    ir = inline(
+        'SCRIPT\n'
+        'EVENT LOADED\n'
+        '    FUNC_RUN "shout" ["hi"] "l!out"\n'
+        'END_EVENT\n'
+        + SHOUT +
+        'END_SCRIPT\n'
+    )
+    assert event_body(ir, "EVENT LOADED") == ['STR_UPPER "hi" "l!__tmp1"', 'VAR_SET "l!out" "{l!__tmp1}"']
+
+def limit_case(filler):
+    return inline(
+        'SCRIPT\n'
+        'EVENT LOADED\n'
+        + "".join(f'    LOG "{i}"\n' for i in range(filler)) +
+        '    FUNC_RUN "shout" ["hi"] "l!out"\n'
+        'END_EVENT\n'
+        + SHOUT +
+        'END_SCRIPT\n'
+    )
+
+def test_call_that_would_pass_the_action_limit_is_kept():
+    # 119 logs + the 2 actions shout expands to is one past ACTION_LIMIT
+    assert 'FUNC_RUN "shout" ["hi"] "l!out"' in event_body(limit_case(119), "EVENT LOADED")
+    # landing exactly on the limit is fine
+    assert 'FUNC_RUN "shout" ["hi"] "l!out"' not in event_body(limit_case(118), "EVENT LOADED")
+
+def test_recursive_functions_are_not_inlined():
+    ir = inline(
+        'SCRIPT\n'
+        'EVENT LOADED\n'
+        '    FUNC_RUN "ping" ["1"] EMPTY\n'
+        'END_EVENT\n'
+        'EVENT FUNC_DEF "ping" ["n"]\n'
+        '    FUNC_RUN "pong" ["{l!n}"] EMPTY\n'
+        'END_EVENT\n'
+        'EVENT FUNC_DEF "pong" ["n"]\n'
+        '    FUNC_RUN "ping" ["{l!n}"] EMPTY\n'
+        'END_EVENT\n'
+        'END_SCRIPT\n'
+    )
+    assert event_body(ir, "EVENT LOADED") == ['FUNC_RUN "ping" ["1"] EMPTY']
+
+def test_helpers_from_required_files_are_inlined(compile_ir):
+    ir = compile_ir({
+        "main.catlua": 'require("lib")\n\nOnWebsiteLoaded\n    local r = double(LocalPlayer.Name)\n    print(r)\nend\n',
+        "lib.catlua": "function double(x)\n    local y = x .. x\n    return y\nend\n",
+    }, opt_level=3)
+    assert 'FUNC_RUN "double"' not in event_body(ir, "EVENT LOADED")
+
+def test_helpers_using_their_scripts_object_vars_stay_calls():
+    ir = inline(
+        'SCRIPT\n'
+        'EVENT LOADED\n'
+        '    FUNC_RUN "bump" [] EMPTY\n'
+        'END_EVENT\n'
+        'END_SCRIPT\n'
+        'SCRIPT\n'
+        'EVENT FUNC_DEF "bump" []\n'
+        '    VAR_INC "o!clicks" "1"\n'
+        'END_EVENT\n'
+        'EVENT LOADED\n'
+        '    FUNC_RUN "bump" [] EMPTY\n'
+        'END_EVENT\n'
+        'END_SCRIPT\n'
+    )
+    first, second = ir.split("END_SCRIPT")[:2]
+    assert 'FUNC_RUN "bump"' in first
+    assert 'FUNC_RUN "bump"' not in second.split("EVENT LOADED")[1]
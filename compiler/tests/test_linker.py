@@ -0,0 +1,47 @@
+import os
+import pickle
+
+from linker import Linker, parse_source
+
+SOURCE = "OnWebsiteLoaded\n    print(\"hi\")\nend\n"
+
+def test_parse_cache_stays_out_of_the_project(tmp_path, cache_dir):
+    project = tmp_path / "site"
+    project.mkdir()
+    entry = project / "main.catlua"
+    entry.write_text(SOURCE, encoding="utf-8")
+
+    Linker(disk_cache=True).link(str(entry))
+
+    assert os.listdir(project) == ["main.catlua"]
+    assert any(name.endswith(".ast") for name in os.listdir(cache_dir))
+
+def test_cache_shipped_inside_a_project_is_never_read(tmp_path):
+    project = tmp_path / "site"
+    (project / ".catlua_cache").mkdir(parents=True)
+    entry = project / "main.catlua"
+    entry.write_text(SOURCE, encoding="utf-8")
+
+    linker = Linker(disk_cache=True)
+    # whatever a repo ships, its cache folder is not where the linker looks
+    planted = project / ".catlua_cache" / os.path.basename(linker.cache_path(SOURCE))
+    planted.write_bytes(pickle.dumps(parse_source(SOURCE.replace("hi", "planted"))[0]))
+
+    linker.link(str(entry))
+    assert linker.last_source == "parsed"
+
+def test_parallel_links_share_one_worker_pool(tmp_path):
+    (tmp_path / "util.catlua").write_text("function greet(name)\n    print(name)\nend\n", encoding="utf-8")
+    entries = []
+    for name in ("a", "b"):
+        entry = tmp_path / f"{name}.catlua"
+        entry.write_text(f"require(\"util\")\n\nOnWebsiteLoaded\n    greet(\"{name}\")\nend\n", encoding="utf-8")
+        entries.append(str(entry))
+
+    with Linker() as linker:
+        linker.link(entries[0], jobs=2)
+        pool = linker.pool
+        linker.invalidate(str(tmp_path / "util.catlua")) # make the second link parse again
+        linker.link(entries[1], jobs=2)
+        assert linker.pool is pool
+    assert linker.pool is None
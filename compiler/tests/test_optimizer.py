@@ -0,0 +1,177 @@
+def event(*lines):
+    return {"main.catlua": "OnWebsiteLoaded\n" + "".join(f"    {line}\n" for line in lines) + "end\n"}
+
+def test_dead_definitions_keeps_dotted_and_method_calls(compile_ir):
+    ir = compile_ir({
+        "main.catlua": 'require("util")\n'
+                       "Btn.MouseButton1Click\n"
+                       '    util.greet("x")\n'
+                       '    Btn:shout("hey")\n'
+                       "end\n",
+        "util.catlua": "function util.greet(n)\n"
+                       "    print(n)\n"
+                       "end\n"
+                       "\n"
+                       "function shout(obj, msg)\n"
+                       "    print(msg)\n"
+                       "end\n"
+                       "\n"
+                       "function unused()\n"
+                       '    print("never")\n'
+                       "end\n",
+    }, opt_level=2)
+
+    assert 'FUNC_RUN "util.greet"' in ir
+    assert 'EVENT FUNC_DEF "util.greet"' in ir
+    assert 'FUNC_RUN "shout"' in ir
+    assert 'EVENT FUNC_DEF "shout"' in ir
+    assert '"unused"' not in ir
+
+def test_cse_repeat_in_straight_line_code_is_reused(compile_ir):
+    ir = compile_ir(event(
+        'local a = Label.Text .. "!"',
+        'local b = Label.Text .. "!"',
+        'print(a)',
+        'print(b)',
+    ), opt_level=2)
+    assert 'VAR_SET "l!b" "{l!a}"' in ir
+    assert ir.count("STR_CONCAT") == 1
+
+def test_cse_wait_blocks_reusing_a_property_read(compile_ir):
+    ir = compile_ir(event(
+        'local a = Label.Text .. "!"',
+        'wait(1)',
+        'local b = Label.Text .. "!"',
+        'print(a)',
+        'print(b)',
+    ), opt_level=2)
+    assert ir.count("STR_CONCAT") == 2
+
+def test_cse_ui_write_blocks_reusing_a_property_read(compile_ir):
+    ir = compile_ir(event(
+        'local a = Label.Text .. "!"',
+        'Label.Text = "x"',
+        'local b = Label.Text .. "!"',
+        'print(a)',
+        'print(b)',
+    ), opt_level=2)
+    assert ir.count("STR_CONCAT") == 2
+
+def test_cse_custom_call_blocks_reuse_but_keeps_local_arithmetic(compile_ir, capsys):
+    files = event(
+        'local n = LocalPlayer.Name',
+        'local a = Label.Text .. n',
+        'local c = n .. "?"',
+        'refresh()',
+        'local b = Label.Text .. n',
+        'local d = n .. "?"',
+        'print(a)', 'print(b)', 'print(c)', 'print(d)',
+    )
+    files["main.catlua"] += "\nfunction refresh()\n    Label.Text = \"new\"\nend\n"
+    ir = compile_ir(files, opt_level=2)
+    out = capsys.readouterr().out
+    assert "reused local 'c'" in out
+    assert "reused local 'a'" not in out
+    assert ir.count('"{Label.Text}"') == 2
+
+def test_cse_write_to_an_input_local_blocks_reuse(compile_ir, capsys):
+    compile_ir(event(
+        'local n = LocalPlayer.Name',
+        'local a = n .. "?"',
+        'l!n = "other"',
+        'local b = n .. "?"',
+        'print(a)', 'print(b)',
+    ), opt_level=2)
+    assert "reused local" not in capsys.readouterr().out
+
+def test_cse_loop_body_only_reuses_what_survives_the_loop(compile_ir, capsys):
+    compile_ir(event(
+        'local n = LocalPlayer.Name',
+        'local a = n .. "?"',
+        'repeat 3',
+        '    local b = n .. "?"',
+        '    print(b)',
+        '    l!n = LocalPlayer.DisplayName',
+        'end',
+        'print(a)',
+    ), opt_level=2)
+    # the second iteration would read the old n .. "?" through a
+    assert "reused local" not in capsys.readouterr().out
+
+def test_cse_volatile_property_is_never_reused(compile_ir, capsys):
+    compile_ir(event(
+        '--#type audio',
+        'local song = playAudio(123)',
+        '--#type',
+        'local a = song.TimePosition * 2',
+        'local b = song.TimePosition * 2',
+        'print(a)', 'print(b)',
+    ), opt_level=2)
+    assert "reused local" not in capsys.readouterr().out
+
+def hoisted(compile_ir, capsys, *lines):
+    compile_ir(event(*lines), opt_level=2)
+    return [line.split("'")[1] for line in capsys.readouterr().out.splitlines() if "hoisted '" in line]
+
+def test_licm_invariant_local_is_hoisted(compile_ir, capsys):
+    assert hoisted(compile_ir, capsys,
+        "local n = LocalPlayer.Name",
+        "repeat 3",
+        '    local x = n .. "!"',
+        "    print(x)",
+        "end",
+    ) == ["x"]
+
+def test_licm_global_read_is_not_hoisted_past_a_wait(compile_ir, capsys):
+    assert hoisted(compile_ir, capsys,
+        "repeat 3",
+        "    local x = score * 2",
+        "    print(x)",
+        "    wait(1)",
+        "end",
+    ) == []
+
+def test_licm_property_read_stays_in_a_loop_that_may_not_run(compile_ir, capsys):
+    assert hoisted(compile_ir, capsys,
+        "local n = tonumber(LocalPlayer.Name)",
+        "repeat n",
+        "    local x = Label.Text",
+        "    print(x)",
+        "end",
+    ) == []
+
+def test_licm_local_read_before_it_in_the_body_is_not_hoisted(compile_ir, capsys):
+    # from the second iteration on, the first print reads last iteration's x
+    assert hoisted(compile_ir, capsys,
+        "local n = LocalPlayer.Name",
+        "repeat 3",
+        "    print(x)",
+        '    local x = n .. "!"',
+        "    print(x)",
+        "end",
+    ) == []
+
+def test_licm_local_read_after_the_loop_is_not_hoisted(compile_ir, capsys):
+    assert hoisted(compile_ir, capsys,
+        "local n = LocalPlayer.Name",
+        "local count = tonumber(n)",
+        "repeat count",
+        '    local x = n .. "!"',
+        "    print(x)",
+        "end",
+        "print(x)",
+    ) == []
+
+def test_licm_nested_loops_climb_out_one_level_at_a_time(compile_ir, capsys):
+    ir = compile_ir(event(
+        "local n = LocalPlayer.Name",
+        "repeat 3",
+        "    repeat 2",
+        '        local x = n .. "!"',
+        "        print(x)",
+        "    end",
+        "end",
+    ), opt_level=2)
+    assert capsys.readouterr().out.count("hoisted 'x'") == 2
+    lines = [line.strip() for line in ir.splitlines()]
+    assert lines.index('STR_CONCAT "{l!n}" "!" "l!x"') < lines.index('REPEAT "3"')
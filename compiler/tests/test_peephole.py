@@ -0,0 +1,100 @@
+from cwir import parse
+from peephole import Peephole
+
+def peephole(text):
+    body = parse("CWIR_VERSION 1.0\n" + text)[1]
+    return "".join(f"{ins}\n" for ins in Peephole(body).optimize_body(body))
+
+def test_temp_is_computed_straight_into_the_destination():
+    assert peephole(
+        'VAR_SET "l!__0" "{l!a}"\n'
+        'VAR_INC "l!__0" "1"\n'
+        'VAR_SET "l!b" "{l!__0}"\n'
+    ) == (
+        'VAR_SET "l!b" "{l!a}"\n'
+        'VAR_INC "l!b" "1"\n'
+    )
+
+def test_destination_read_in_the_chain_is_not_folded():
+    # l!m = n + m: writing m first would make the VAR_INC add n to itself
+    body = (
+        'VAR_SET "l!__0" "{l!n}"\n'
+        'VAR_INC "l!__0" "{l!m}"\n'
+        'VAR_SET "l!m" "{l!__0}"\n'
+    )
+    assert peephole(body) == body
+
+def test_destination_read_in_the_chain_end_to_end(compile_ir):
+    ir = compile_ir({"main.catlua":
+        "OnWebsiteLoaded\n"
+        "    local m = LocalPlayer.Name\n"
+        "    local n = LocalPlayer.DisplayName\n"
+        "    l!m = n + m\n"
+        "    print(m)\n"
+        "end\n"}, opt_level=2)
+    assert 'VAR_INC "l!__0" "{l!m}"\n    VAR_SET "l!m" "{l!__0}"' in ir
+
+def test_global_destination_waits_for_impure_ops():
+    # the global would be visible to the other scripts while wait() runs
+    body = (
+        'VAR_SET "l!__0" "{l!a}"\n'
+        'WAIT "1"\n'
+        'VAR_SET "g" "{l!__0}"\n'
+    )
+    assert peephole(body) == body
+
+def test_temp_read_again_is_not_folded():
+    body = (
+        'VAR_SET "l!__0" "{l!a}"\n'
+        'VAR_SET "l!b" "{l!__0}"\n'
+        'LOG "{l!__0}"\n'
+    )
+    assert peephole(body) == body
+
+def test_increments_merge_and_cancel():
+    assert peephole(
+        'VAR_INC "l!x" "2"\n'
+        'VAR_DEC "l!x" "5"\n'
+        'VAR_INC "l!y" "1"\n'
+        'VAR_DEC "l!y" "1"\n'
+        'VAR_INC "l!z" "0.5"\n'
+        'VAR_INC "l!z" "{l!a}"\n'
+    ) == (
+        'VAR_DEC "l!x" "3"\n'
+        'VAR_INC "l!z" "0.5"\n'
+        'VAR_INC "l!z" "{l!a}"\n'
+    )
+
+def test_self_copy_is_dropped():
+    assert peephole('VAR_SET "l!x" "{l!x}"\nLOG "{l!x}"\n') == 'LOG "{l!x}"\n'
+
+def test_empty_ifs_are_removed():
+    assert peephole(
+        'IF_EQ "{l!a}" "1"\n'
+        'END_IF\n'
+        'IF_EQ "{l!a}" "2"\n'
+        'ELSE\n'
+        'END_IF\n'
+        'LOG "done"\n'
+    ) == 'LOG "done"\n'
+
+def test_empty_else_branch_is_removed():
+    assert peephole(
+        'IF_EQ "{l!a}" "1"\n'
+        '    LOG "one"\n'
+        'ELSE\n'
+        'END_IF\n'
+    ) == (
+        'IF_EQ "{l!a}" "1"\n'
+        '    LOG "one"\n'
+        'END_IF\n'
+    )
+
+def test_empty_then_branch_keeps_the_if():
+    body = (
+        'IF_EQ "{l!a}" "1"\n'
+        'ELSE\n'
+        '    LOG "other"\n'
+        'END_IF\n'
+    )
+    assert peephole(body) == body
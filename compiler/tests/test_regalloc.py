@@ -0,0 +1,48 @@
+import re
+
+from cwir import parse
+from regalloc import allocate_temps
+
+def allocate(text):
+    body = parse("CWIR_VERSION 1.0\n" + text)[1]
+    slots = allocate_temps(body)
+    return slots, [re.findall(r"l!(__\d+)", str(instr)) for instr in body]
+
+def test_dead_temp_slot_is_reused():
+    slots, used = allocate(
+        'VAR_SET "l!__tmp1" "5"\n'
+        'VAR_SET "l!a" "{l!__tmp1}"\n'
+        'VAR_SET "l!__tmp2" "7"\n'
+        'VAR_SET "l!b" "{l!__tmp2}"\n'
+    )
+    assert slots == 1
+    assert used == [["__0"], ["__0"], ["__0"], ["__0"]]
+
+def test_temp_read_inside_a_loop_keeps_its_slot():
+    # __tmp1's last read is before __tmp2 is set, but the next iteration reads it again
+    slots, used = allocate(
+        'VAR_SET "l!__tmp1" "5"\n'
+        'REPEAT "3"\n'
+        '    VAR_SET "l!a" "{l!__tmp1}"\n'
+        '    VAR_SET "l!__tmp2" "7"\n'
+        '    VAR_SET "l!b" "{l!__tmp2}"\n'
+        'END_REPEAT\n'
+    )
+    assert slots == 2
+    assert used[0] == used[2] != used[3]
+
+def test_temp_read_in_a_nested_loop_survives_the_outer_one():
+    slots, used = allocate(
+        'VAR_SET "l!__tmp1" "5"\n'
+        'REPEAT "3"\n'
+        '    VAR_SET "l!__tmp2" "1"\n'
+        '    VAR_SET "l!c" "{l!__tmp2}"\n'
+        '    REPEAT "2"\n'
+        '        VAR_SET "l!a" "{l!__tmp1}"\n'
+        '    END_REPEAT\n'
+        '    VAR_SET "l!__tmp3" "7"\n'
+        '    VAR_SET "l!b" "{l!__tmp3}"\n'
+        'END_REPEAT\n'
+    )
+    assert used[0] == used[5]
+    assert used[0] not in (used[2], used[7])
@@ -0,0 +1,41 @@
+import io
+import json
+import os
+
+import main
+from linker import Linker
+
+SOURCE = "OnWebsiteLoaded\n    print(\"hi\")\nend\n"
+
+def serve(monkeypatch, requests):
+    linkers = []
+
+    def make_linker(**kwargs):
+        linkers.append(Linker(**kwargs))
+        return linkers[-1]
+
+    monkeypatch.setattr(main, "Linker", make_linker)
+    monkeypatch.setattr(main.sys, "stdin", io.StringIO("".join(json.dumps(r) + "\n" for r in requests)))
+    monkeypatch.setattr(main.sys, "stdout", io.StringIO())
+    main.serve()
+    return linkers[0], [json.loads(line) for line in main.sys.stdout.getvalue().splitlines()]
+
+def test_edit_and_close_drop_the_memoized_tree(tmp_path, monkeypatch):
+    path = str(tmp_path / "main.catlua")
+    edited = SOURCE.replace("hi", "bye")
+
+    linker, responses = serve(monkeypatch, [
+        {"id": 1, "cmd": "lint", "file": path, "text": SOURCE},
+        {"id": 2, "cmd": "open", "file": path, "text": SOURCE},
+        {"id": 3, "cmd": "edit", "file": path, "edits": [{"start": [1, 11], "end": [1, 13], "text": "bye"}]},
+    ])
+    assert all("error" not in r for r in responses)
+    assert os.path.abspath(path) not in linker.memo
+    assert linker.documents[os.path.abspath(path)].text == edited
+
+    linker, responses = serve(monkeypatch, [
+        {"id": 1, "cmd": "lint", "file": path, "text": SOURCE},
+        {"id": 2, "cmd": "close", "file": path},
+    ])
+    assert all("error" not in r for r in responses)
+    assert os.path.abspath(path) not in linker.memo
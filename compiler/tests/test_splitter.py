@@ -0,0 +1,27 @@
+from cwir import parse
+from splitter import EventSplitter
+
+def body_of(text):
+    return parse("CWIR_VERSION 1.0\n" + text)[1]
+
+def test_conditional_write_stays_a_param():
+    body = body_of(
+        'VAR_SET "l!x" "0"\n'
+        'VAR_SET "l!y" "1"\n'
+        'IF_EQ "{l!y}" "1"\n'
+        '    VAR_SET "l!x" "5"\n'
+        'END_IF\n'
+        'LOG "{l!x}"\n'
+    )
+    params, out = EventSplitter(body).plan(body, 2, len(body), trailing=True, in_loop=False)
+    assert sorted(params) == ["x", "y"]
+    assert out is None
+
+def test_unconditional_write_is_not_a_param():
+    body = body_of(
+        'VAR_SET "l!x" "0"\n'
+        'VAR_SET "l!x" "5"\n'
+        'LOG "{l!x}"\n'
+    )
+    params, out = EventSplitter(body).plan(body, 1, len(body), trailing=True, in_loop=False)
+    assert params == []
@@ -0,0 +1,41 @@
+import tracemalloc
+
+import main
+from linker import Linker
+from timing import PassTimer
+
+MAIN = "require(\"util\")\n\nOnWebsiteLoaded\n    greet(\"hi\")\nend\n"
+UTIL = "function greet(name)\n    print(name)\nend\n"
+
+def test_stop_leaves_outside_tracing_alone():
+    tracemalloc.start()
+    try:
+        timer = PassTimer(True)
+        timer.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+def test_stop_ends_its_own_tracing():
+    timer = PassTimer(True)
+    assert tracemalloc.is_tracing()
+    timer.stop()
+    assert not tracemalloc.is_tracing()
+
+def sources(linker, entry, jobs):
+    timer = PassTimer(True)
+    try:
+        main.analyze(linker, entry, jobs=jobs, timer=timer)
+    finally:
+        timer.stop()
+    return sorted(f["source"] for f in timer.files)
+
+def test_cached_files_are_not_labelled_worker(tmp_path):
+    # the disk cache sits next to the entry, so the second build hits it
+    (tmp_path / "util.catlua").write_text(UTIL, encoding="utf-8")
+    (tmp_path / "main.catlua").write_text(MAIN, encoding="utf-8")
+    entry = str(tmp_path / "main.catlua")
+
+    assert sources(Linker(disk_cache=True), entry, jobs=2) == ["worker", "worker"]
+    assert sources(Linker(disk_cache=True), entry, jobs=2) == ["cache", "cache"]
+    assert sources(Linker(disk_cache=True), entry, jobs=1) == ["cache", "cache"]
@@ -0,0 +1,69 @@
+import os
+
+import main
+from linker import Linker
+
+def run_watch(linker, entries, steps, monkeypatch):
+    """runs main.watch, doing steps[i]() at its i-th poll, then stops it"""
+    results = []
+    def rebuild(targets):
+        for entry in targets:
+            results.append(main.compile_entry(linker, entry, entry.replace(".catlua", ".json")))
+
+    polls = iter(steps)
+    def fake_sleep(_):
+        step = next(polls, None)
+        if step is None:
+            raise KeyboardInterrupt
+        step()
+    monkeypatch.setattr(main.time, "sleep", fake_sleep)
+    main.watch(linker, entries, rebuild)
+    return results
+
+def test_watch_survives_deleted_files(tmp_path, monkeypatch, capsys):
+    lib = tmp_path / "lib.catlua"
+    lib.write_text("function hello()\n    print(\"hi\")\nend\n", encoding="utf-8")
+    entry = tmp_path / "main.catlua"
+    source = 'require("lib")\nOnWebsiteLoaded\n    hello()\nend\n'
+    entry.write_text(source, encoding="utf-8")
+
+    results = run_watch(Linker(), [str(entry)], [
+        lib.unlink, # a required module goes away
+        entry.unlink, # then the entry itself
+        lambda: entry.write_text('OnWebsiteLoaded\n    print("back")\nend\n', encoding="utf-8"),
+    ], monkeypatch)
+
+    assert results == [True, False, False, True]
+    assert "cannot read" in capsys.readouterr().out
+
+def test_save_during_a_rebuild_is_picked_up(tmp_path, monkeypatch):
+    entry = tmp_path / "main.catlua"
+    out = str(tmp_path / "main.json")
+    entry_mtime = [1_000_000_000]
+
+    def save(word):
+        # explicit mtimes, so saves a few ms apart never share one on coarse filesystems
+        entry.write_text(f'OnWebsiteLoaded\n    print("{word}")\nend\n', encoding="utf-8")
+        entry_mtime[0] += 1_000_000_000
+        os.utime(entry, ns=(entry_mtime[0], entry_mtime[0]))
+
+    save("one")
+    linker = Linker()
+    builds = []
+    def rebuild(targets):
+        builds.append(main.compile_entry(linker, str(entry), out))
+        if len(builds) == 2:
+            save("three") # saved again while the rebuild for "two" was running
+
+    polls = iter([lambda: save("two"), lambda: None])
+    def fake_sleep(_):
+        step = next(polls, None)
+        if step is None:
+            raise KeyboardInterrupt
+        step()
+    monkeypatch.setattr(main.time, "sleep", fake_sleep)
+    main.watch(linker, [str(entry)], rebuild)
+
+    assert builds == [True, True, True]
+    with open(out, encoding="utf-8") as f:
+        assert "three" in f.read()